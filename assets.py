@@ -1,34 +1,71 @@
 import pygame
 from settings import *
 
+# The shape each unit type is drawn as, and the heading in degrees (0 is east, clockwise on screen)
+# that its drawing faces; units with no heading are never rotated
+SHIP_SHAPES = {
+    'cruiser': ('rect', 0),
+    'scout': ('triangle', -90),
+    'command_center': ('star', None),
+}
+
 
 class Assets:
-    def __init__(self):
-        self.images = {}
-        self.generate_ship_images()
+    """
+    A lazy cache of the game's images. Nothing is drawn until an image is first asked for, so
+    importing this module needs neither pygame.init() nor a display. Images are converted to the
+    display's pixel format as soon as there is a display, which makes blitting them much cheaper,
+    and ship images rotated to a heading are kept in SHIP_ROTATION_STEPS steps per full turn.
+    """
 
-    def generate_ship_images(self):
-        """Creates the surfaces for our ship sprites programmatically."""
-        # Player 1 (Green Team)
-        self.images['cruiser_1'] = self.create_ship_sprite(SHIP_STATS['cruiser']['image_size'], PLAYER_COLORS[1], PLAYER_COLORS[1])
-        self.images['scout_1'] = self.create_ship_sprite(SHIP_STATS['scout']['image_size'], PLAYER_COLORS[1], PLAYER_COLORS[1], shape='triangle')
-        self.images['command_center_1'] = self.create_ship_sprite(SHIP_STATS['command_center']['image_size'], PLAYER_COLORS[1], PLAYER_COLORS[1], shape='star')
+    def __init__(self):
+        self.images = {}  # name: surface
+        self.unconverted = set()  # Names of images made before there was a display to convert them for
+        self.rotated = {}  # (name, rotation step): surface
 
-        # Player 2 (Red Team)
-        self.images['cruiser_2'] = self.create_ship_sprite(SHIP_STATS['cruiser']['image_size'], PLAYER_COLORS[2], PLAYER_COLORS[2])
-        self.images['scout_2'] = self.create_ship_sprite(SHIP_STATS['scout']['image_size'], PLAYER_COLORS[2], PLAYER_COLORS[2], shape='triangle')
-        self.images['command_center_2'] = self.create_ship_sprite(SHIP_STATS['command_center']['image_size'], PLAYER_COLORS[2], PLAYER_COLORS[2], shape='star')
+    def get_image(self, name):
+        """The image called name: 'projectile' or '<unit type>_<player id>'."""
+        image = self.images.get(name)
+        if image is not None and name not in self.unconverted:
+            return image
+        if image is None:
+            image = self.create_image(name)
+        if pygame.display.get_surface() is not None:
+            # Colour-keyed images keep their key through convert(); per-pixel alpha needs convert_alpha()
+            image = image.convert_alpha() if image.get_flags() & pygame.SRCALPHA else image.convert()
+            self.unconverted.discard(name)
+        else:
+            self.unconverted.add(name)
+        self.images[name] = image
+        return image
 
-        # Add more players if needed
-        # Player 3 (Blue Team)
-        self.images['cruiser_3'] = self.create_ship_sprite(SHIP_STATS['cruiser']['image_size'], PLAYER_COLORS[3], PLAYER_COLORS[3])
-        self.images['scout_3'] = self.create_ship_sprite(SHIP_STATS['scout']['image_size'], PLAYER_COLORS[3], PLAYER_COLORS[3], shape='triangle')
-        self.images['command_center_3'] = self.create_ship_sprite(SHIP_STATS['command_center']['image_size'], PLAYER_COLORS[3], PLAYER_COLORS[3], shape='star')
+    def create_image(self, name):
+        if name == 'projectile':
+            return self.create_projectile_sprite()
+        unit_type, player = name.rsplit('_', 1)
+        color = PLAYER_COLORS[int(player)]
+        shape, _ = SHIP_SHAPES[unit_type]
+        return self.create_ship_sprite(SHIP_STATS[unit_type]['image_size'], color, color, shape=shape)
 
-        # Player 4 (Yellow Team)
-        self.images['cruiser_4'] = self.create_ship_sprite(SHIP_STATS['cruiser']['image_size'], PLAYER_COLORS[4], PLAYER_COLORS[4])
-        self.images['scout_4'] = self.create_ship_sprite(SHIP_STATS['scout']['image_size'], PLAYER_COLORS[4], PLAYER_COLORS[4], shape='triangle')
-        self.images['command_center_4'] = self.create_ship_sprite(SHIP_STATS['command_center']['image_size'], PLAYER_COLORS[4], PLAYER_COLORS[4], shape='star')
+    def ship_image(self, unit_type, player, heading=None):
+        """The image of a player's unit, turned to face heading (degrees, 0 is east) if it is given."""
+        name = f"{unit_type}_{player}"
+        image = self.get_image(name)
+        facing = SHIP_SHAPES[unit_type][1]
+        if heading is None or facing is None:
+            return image
+        step_angle = 360 / SHIP_ROTATION_STEPS
+        step = round((heading - facing) / step_angle) % SHIP_ROTATION_STEPS
+        if step == 0:
+            return image
+        key = (name, step)
+        rotated = self.rotated.get(key)
+        if rotated is None:
+            # pygame turns counterclockwise for positive angles; headings turn clockwise on screen
+            rotated = pygame.transform.rotate(image, -step * step_angle)
+            if name not in self.unconverted:  # Rotations of an unconverted image would be stale once it is converted
+                self.rotated[key] = rotated
+        return rotated
 
     def create_ship_sprite(self, size, color, dark_color, shape='rect'):
         """Creates a stylized ship surface."""
@@ -60,9 +97,14 @@ class Assets:
 
         return surf
 
-    def get_image(self, name):
-        return self.images.get(name)
+    def create_projectile_sprite(self):
+        """The shell image, shared by every projectile in flight."""
+        surf = pygame.Surface((6, 6))
+        surf.fill(BLACK)
+        pygame.draw.circle(surf, WHITE, (3, 3), 3)
+        surf.set_colorkey(BLACK)
+        return surf
 
 
-# Create a single instance to be imported by other modules
+# A single instance to be imported by other modules; it makes no images until they are needed
 assets = Assets()
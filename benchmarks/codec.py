@@ -0,0 +1,83 @@
+# Compares the binary wire protocol with the old pickle framing on game_state payloads.
+# Run from the repository root: python -m benchmarks.codec
+
+import pickle
+import random
+import timeit
+from settings import SHIP_STATS
+from snapshots import diff_units
+from protocol import HEADER, decode_message, encode_message
+
+PICKLE_HEADER_LENGTH = 10
+
+
+def make_game_state(unit_count, seed=0):
+    """Builds a game_state shaped like the one NetworkServer.start_game creates, with unit_count units."""
+    rng = random.Random(seed)
+    units = {}
+    for unit_id in range(unit_count):
+        unit_type = ['command_center', 'cruiser', 'scout'][unit_id % 3]
+        pos = (rng.randint(0, 4000), rng.randint(0, 4000))
+        units[unit_id] = {
+            'id': unit_id, 'type': unit_type, 'owner': unit_id % 4 + 1,
+            'pos': pos, 'hp': SHIP_STATS[unit_type]['hp'], 'target_pos': pos
+        }
+    return {'world_seed': seed, 'units': units, 'turn_number': 0, 'world_streamed': False, 'lockstep': False,
+            'world_size': (4000, 4000), 'tick_interval': 1.0}
+
+
+def make_game_update(game_state, moving_fraction=0.25, seed=0):
+    """A delta game_update in which moving_fraction of the units moved since the base tick."""
+    rng = random.Random(seed)
+    base = game_state['units']
+    units = {unit_id: dict(unit) for unit_id, unit in base.items()}
+    for unit in units.values():
+        if unit['type'] != 'command_center' and rng.random() < moving_fraction:
+            unit['pos'] = (unit['pos'][0] + rng.uniform(-6, 6), unit['pos'][1] + rng.uniform(-6, 6))
+    changed, removed = diff_units(base, units)
+    payload = {'tick': 2, 'turn_number': 2, 'keyframe': False, 'base_tick': 1, 'units': changed, 'removed': removed}
+    return {'type': 'game_update', 'payload': payload}
+
+
+def pickle_encode(message_data):
+    message = pickle.dumps(message_data)
+    return f"{len(message):<{PICKLE_HEADER_LENGTH}}".encode('utf-8') + message
+
+
+def pickle_decode(data):
+    return pickle.loads(data[PICKLE_HEADER_LENGTH:])
+
+
+def protocol_decode(data):
+    _, message_type_id, _ = HEADER.unpack_from(data)
+    return decode_message(message_type_id, memoryview(data)[HEADER.size:])
+
+
+def measure(message_data, number):
+    """Returns {codec: (bytes, encode seconds, decode seconds)} for one message."""
+    results = {}
+    for name, encode, decode in [('pickle', pickle_encode, pickle_decode),
+                                 ('protocol', encode_message, protocol_decode)]:
+        data = encode(message_data)
+        encode_time = timeit.timeit(lambda: encode(message_data), number=number) / number
+        decode_time = timeit.timeit(lambda: decode(data), number=number) / number
+        results[name] = (len(data), encode_time, decode_time)
+    return results
+
+
+def main():
+    print(f"{'message':<26}{'codec':<10}{'bytes':>10}{'encode us':>12}{'decode us':>12}")
+    for unit_count in (12, 100, 1000, 10000):
+        game_state = make_game_state(unit_count)
+        messages = [
+            (f"start_game ({unit_count})", {'type': 'start_game', 'payload': game_state}),
+            (f"game_update ({unit_count})", make_game_update(game_state)),
+        ]
+        number = max(10, 20000 // unit_count)
+        for label, message_data in messages:
+            for codec, (size, encode_time, decode_time) in measure(message_data, number).items():
+                print(f"{label:<26}{codec:<10}{size:>10}{encode_time * 1e6:>12.1f}{decode_time * 1e6:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,522 @@
+# Headless benchmarks of world generation, server simulation, networking and rendering.
+# Run from the repository root: python -m benchmarks.suite
+#
+# Results are written as JSON to --output and compared with --baseline; a benchmark whose median
+# time grew by more than --threshold over its baseline is reported as a regression and the run
+# exits with status 1. Timings only compare on the same hardware: the committed baseline.json
+# records the machine it was measured on, and a warning is printed when it doesn't match this one.
+# Record a baseline for your own machine with --save-baseline.
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Rendering benchmarks need no window
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import types
+import numpy as np
+import pygame
+from settings import *
+
+RESULTS_PATH = "benchmark_results.json"
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+REGRESSION_THRESHOLD = 0.25  # Allowed growth of a median over its baseline, as a fraction
+WORLD_SEED = 1234
+FLEET_SIZES = [10, 100, 1000, 10000]
+
+
+def make_world(headless=True):
+    """A freshly generated world, so that timings don't depend on the state of the world cache."""
+    from world import World
+    return World(seed=WORLD_SEED, use_cache=False, headless=headless)
+
+
+def make_open_sea(world):
+    """
+    Floods a world so that units and projectiles never hit land. With the current WATER_LEVEL almost
+    every tile is land, which would stop any synthetic fleet after its first step.
+    """
+    from components import TerrainComponents
+    world.terrain_data[:] = 0
+    world.terrain_colors[:] = world.classify_terrain(world.terrain_data)
+    world.components = TerrainComponents(world.terrain_data)
+    return world
+
+
+def make_archipelago(world, sea_fraction=0.7):
+    """Lowers a world until sea_fraction of its tiles are water, leaving the highest ground as islands."""
+    sea_level = np.float32(np.percentile(world.terrain_data, sea_fraction * 100))
+    heights = world.terrain_data
+    from components import TerrainComponents
+    heights[:] = np.where(heights > sea_level, heights - sea_level + WATER_LEVEL, 0)
+    world.terrain_colors[:] = world.classify_terrain(heights)
+    world.components = TerrainComponents(heights)
+    return world
+
+
+def make_server(unit_count, world):
+    """A NetworkServer in a running game with unit_count units spread over the map, all under way."""
+    from networking import NetworkServer
+    from unit_store import UNIT_TYPES
+
+    server = NetworkServer(port=0)
+    server.world = world
+    server.game_started = True
+    server.game_state = {
+        'world_seed': WORLD_SEED, 'turn_number': 0,
+        'world_streamed': False, 'lockstep': False, 'world_size': (world.width, world.height),
+        'tick_interval': TICK_INTERVAL
+    }
+    rng = random.Random(unit_count)
+    owners = 3
+    for unit_id in range(unit_count):
+        unit_type = UNIT_TYPES[unit_id % len(UNIT_TYPES)]
+        pos = (rng.uniform(0, WORLD_WIDTH), rng.uniform(0, WORLD_HEIGHT))
+        target = (rng.uniform(0, WORLD_WIDTH), rng.uniform(0, WORLD_HEIGHT))
+        server.units.add(unit_id, unit_type, unit_id % owners + 1, pos, SHIP_STATS[unit_type]['hp'], target)
+    return server
+
+
+# Every benchmark function returns (run, before): run() is timed, before() runs untimed ahead of
+# each repeat to restore whatever state run() consumed, and may be None.
+
+def bench_world_init(_):
+    return make_world, None
+
+
+def bench_generate_terrain(_):
+    world = make_world()
+    return world.generate_terrain, None
+
+
+def bench_generate_large(workers):
+    """Heights of an 8000x8000 pixel world, in-process or split across worker processes."""
+    from world import generate_height_band, generate_heights_parallel
+    from perlin import PerlinNoise
+
+    size = 8000 // TILE_SIZE
+    permutation = PerlinNoise(octaves=4, seed=WORLD_SEED).p
+    if workers == 1:
+        return lambda: generate_height_band(permutation, 4, size, size, 0, size), None
+    return lambda: generate_heights_parallel(permutation, 4, size, size, workers), None
+
+
+def bench_find_islands(_):
+    world = make_world()
+    return world.find_islands, None
+
+
+def bench_label_components(_):
+    from components import TerrainComponents
+
+    world = make_archipelago(make_world())
+    return lambda: TerrainComponents(world.terrain_data), None
+
+
+def bench_create_map_surface(_):
+    world = make_world(headless=False)
+    return world.create_map_surface, None
+
+
+def bench_draw_terrain(_):
+    """Drawing one screen of terrain with every chunk rendered from scratch."""
+    world = make_world(headless=False)
+    screen = pygame.display.get_surface()
+    offset = (-(WORLD_WIDTH - SCREEN_WIDTH) // 2, -(WORLD_HEIGHT - SCREEN_HEIGHT) // 2)
+    return lambda: world.draw_terrain(screen, offset), world.chunk_surfaces.clear
+
+
+def bench_deform_terrain(radius):
+    """A hundred craters of the given pixel radius, on a world whose map surface and chunks are rendered."""
+    world = make_world(headless=False)
+    world.map_surface
+    world.draw_terrain(pygame.display.get_surface(), (0, 0))
+    rng = random.Random(radius)
+    craters = [(rng.uniform(0, WORLD_WIDTH), rng.uniform(0, WORLD_HEIGHT)) for _ in range(100)]
+
+    def run():
+        for pos in craters:
+            world.deform_terrain(pos, radius)
+    return run, None
+
+
+def bench_streamed_init(_):
+    """A 400000x400000 pixel streamed world, which only generates its start region."""
+    from streamed_world import StreamedWorld
+
+    return lambda: StreamedWorld(WORLD_SEED, headless=True), None
+
+
+def bench_streamed_draw(_):
+    """Drawing one screen of a streamed world with no chunk generated or rendered yet."""
+    from streamed_world import StreamedWorld
+
+    world = StreamedWorld(WORLD_SEED)
+    screen = pygame.display.get_surface()
+    offset = (-world.width // 3, -world.height // 3)
+
+    def before():
+        world.chunks.clear()
+        world.chunk_surfaces.clear()
+    return lambda: world.draw_terrain(screen, offset), before
+
+
+def bench_streamed_is_land(unit_count):
+    """is_land_batch() for a fleet spread over a screen of a streamed world whose chunks are cached."""
+    from streamed_world import StreamedWorld
+
+    world = StreamedWorld(WORLD_SEED, headless=True)
+    rng = np.random.default_rng(unit_count)
+    positions = rng.uniform(0, (SCREEN_WIDTH, SCREEN_HEIGHT), (unit_count, 2)) + (world.width // 2, world.height // 2)
+    return lambda: world.is_land_batch(positions), None
+
+
+def bench_update_game_state(unit_count):
+    server = make_server(unit_count, make_open_sea(make_world()))
+    start_pos = server.units.pos.copy()
+
+    def before():
+        server.units.pos[:] = start_pos
+    return server.update_game_state, before
+
+
+def bench_lockstep_step(unit_count):
+    """A tick of the fixed-point lockstep simulation with the same fleet, none of it newly ordered."""
+    from lockstep import LockstepSimulation
+
+    world = make_open_sea(make_world())
+    simulation = LockstepSimulation(world, make_server(unit_count, world).units.to_dicts())
+    start_pos = simulation.units.pos.copy()
+
+    def before():
+        simulation.units.pos[:] = start_pos
+    return lambda: simulation.step([]), before
+
+
+def _game_messages(unit_count):
+    from snapshots import diff_units
+
+    server = make_server(unit_count, make_open_sea(make_world()))
+    start_game = {'type': 'start_game', 'payload': server.get_game_state()}
+    base = start_game['payload']['units']
+    server.update_game_state()
+    changed, removed = diff_units(base, server.units.to_dicts())
+    game_update = {'type': 'game_update', 'payload': {
+        'tick': 1, 'turn_number': 1, 'keyframe': False, 'base_tick': 0, 'units': changed, 'removed': removed
+    }}
+    return start_game, game_update
+
+
+def bench_encode(unit_count):
+    from protocol import encode_message
+
+    messages = _game_messages(unit_count)
+    return lambda: [encode_message(message) for message in messages], None
+
+
+def bench_decode(unit_count):
+    from protocol import encode_message
+    from benchmarks.codec import protocol_decode
+
+    encoded = [encode_message(message) for message in _game_messages(unit_count)]
+    return lambda: [protocol_decode(data) for data in encoded], None
+
+
+def bench_strategy_draw(unit_count):
+    """
+    One StrategyView.draw with a third of the units friendly and all of those moving to a new
+    tile, so that visibility and the fog are recomputed every frame.
+    """
+    from strategy_view import StrategyView, Camera
+    from fog import FogOfWar
+
+    game_manager = types.SimpleNamespace(network_client=types.SimpleNamespace(player_id=1))
+    view = StrategyView(game_manager)
+    view.world = make_world(headless=False)
+    view.camera = Camera(WORLD_WIDTH, WORLD_HEIGHT)
+    view.camera.camera.topleft = (-(WORLD_WIDTH - SCREEN_WIDTH) // 2, -(WORLD_HEIGHT - SCREEN_HEIGHT) // 2)
+    view.fog = FogOfWar(view.world)
+    server = make_server(unit_count, view.world)
+    for unit_id, unit_data in server.units.to_dicts().items():
+        view.add_unit(unit_id, unit_data)
+    friendly = [sprite for sprite in view.all_sprites if sprite.player_owner == 1]
+    screen = pygame.display.get_surface()
+    view.draw(screen)  # Render the terrain chunks once; they stay cached in a real game too
+    step = [TILE_SIZE]
+
+    def before():
+        step[0] = -step[0]
+        for sprite in friendly:
+            sprite.pos.x += step[0]
+            sprite.rect.center = sprite.pos
+            view.spatial_index.move(sprite)
+    return lambda: view.draw(screen), before
+
+
+def bench_positions_at(unit_count):
+    """One frame of interpolated positions for unit_count units, all of them moving between snapshots."""
+    from snapshots import SnapshotBuffer
+
+    server = make_server(unit_count, make_open_sea(make_world()))
+    buffer = SnapshotBuffer()
+    for tick in range(SNAPSHOT_BUFFER_SIZE):
+        buffer.add(tick, server.units.to_dicts(), [], tick * TICK_INTERVAL, keyframe=not tick)
+        server.update_game_state()
+    now = (SNAPSHOT_BUFFER_SIZE - 1) * TICK_INTERVAL
+    return lambda: buffer.positions_at(now), None
+
+
+def bench_replay_seek(ticks_past_keyframe):
+    """Seeking a recorded game of 1000 ships to a tick that lies ticks_past_keyframe after a keyframe."""
+    import tempfile
+    from replay import ReplayWriter, ReplayPlayer
+
+    world = make_open_sea(make_world())
+    server = make_server(1000, world)
+    rng = random.Random(ticks_past_keyframe)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.replay')
+    writer = ReplayWriter(path, {'type': 'start_game', 'payload': server.get_game_state()}, server.units)
+    for tick in range(1, 2 * REPLAY_KEYFRAME_INTERVAL + 1):
+        # A few dozen new orders every tick, as when players keep their fleets busy
+        orders = [(unit_id, [(rng.uniform(0, WORLD_WIDTH), rng.uniform(0, WORLD_HEIGHT))])
+                  for unit_id in rng.sample(range(1000), 30)]
+        for unit_id, waypoints in orders:
+            server.units.set_path(unit_id, waypoints)
+        server.update_game_state()
+        writer.record_tick(tick, orders, server.units)
+    writer.close()
+    player = ReplayPlayer(path, world)
+
+    def before():
+        player.tick = None  # Start from the keyframe rather than from where the last repeat ended
+    return lambda: player.seek(REPLAY_KEYFRAME_INTERVAL + ticks_past_keyframe), before
+
+
+def bench_projectile_update(count):
+    """One frame of a barrage of count shells in flight over the combat arena, swept against a target."""
+    from projectiles import Projectiles
+    from combat_terrain import CombatTerrain
+
+    terrain = CombatTerrain([SCREEN_HEIGHT - 50] * SCREEN_WIDTH, SCREEN_HEIGHT)
+    rng = np.random.default_rng(count)
+    projectiles = Projectiles()
+    arena = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    target = pygame.Rect(SCREEN_WIDTH - 120, SCREEN_HEIGHT - 120, 40, 40)
+
+    def before():
+        projectiles.clear()
+        positions = rng.uniform((100, 100), (SCREEN_WIDTH - 100, SCREEN_HEIGHT - 100), (count, 2))
+        projectiles.fire_many(positions, rng.uniform((-200, -300), (200, 0), (count, 2)))
+    return lambda: projectiles.update(1 / FPS, terrain, arena, [target], COMBAT_CRATER_RADIUS), before
+
+
+def bench_combat_craters(_):
+    """A hundred shells blasting craters into the combat terrain."""
+    from combat_terrain import CombatTerrain
+
+    rng = random.Random(0)
+    craters = [(rng.uniform(0, SCREEN_WIDTH), rng.uniform(SCREEN_HEIGHT - 200, SCREEN_HEIGHT)) for _ in range(100)]
+    terrain = [None]
+
+    def before():
+        terrain[0] = CombatTerrain([SCREEN_HEIGHT - 200] * SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    def run():
+        for pos in craters:
+            terrain[0].deform_terrain(pos, COMBAT_CRATER_RADIUS)
+    before()
+    return run, before
+
+
+def bench_combat_draw(crater_count):
+    """Drawing the combat terrain after crater_count craters; the cost shouldn't depend on the count."""
+    from combat_terrain import CombatTerrain
+
+    terrain = CombatTerrain([SCREEN_HEIGHT - 200] * SCREEN_WIDTH, SCREEN_HEIGHT)
+    rng = random.Random(crater_count)
+    for _ in range(crater_count):
+        terrain.deform_terrain((rng.uniform(0, SCREEN_WIDTH), rng.uniform(SCREEN_HEIGHT - 200, SCREEN_HEIGHT)),
+                               COMBAT_CRATER_RADIUS)
+    screen = pygame.display.get_surface()
+    return lambda: terrain.draw(screen), None
+
+
+def bench_find_path(count):
+    """Paths for a fleet of count ships ordered across an archipelago, starting with empty route caches."""
+    from pathfinding import PathFinder
+
+    world = make_archipelago(make_world())
+    pathfinder = PathFinder(world)
+    pathfinder.build_graphs()
+    water = np.argwhere(world.terrain_data < WATER_LEVEL)
+    rng = random.Random(count)
+    # Ships of a fleet start close to each other and head for a few destinations
+    origin_y, origin_x = water[rng.randrange(len(water))]
+    fleet = water[(abs(water[:, 0] - origin_y) < 24) & (abs(water[:, 1] - origin_x) < 24)]
+    goals = [water[rng.randrange(len(water))] for _ in range(4)]
+    queries = []
+    for _ in range(count):
+        y, x = fleet[rng.randrange(len(fleet))]
+        goal_y, goal_x = goals[rng.randrange(len(goals))]
+        queries.append((((x + 0.5) * TILE_SIZE, (y + 0.5) * TILE_SIZE),
+                        ((goal_x + 0.5) * TILE_SIZE, (goal_y + 0.5) * TILE_SIZE)))
+
+    def before():
+        pathfinder.routes.clear()
+        pathfinder.cluster_routes.clear()
+        pathfinder.tile_searches.clear()
+    return lambda: [pathfinder.find_path(start, goal) for start, goal in queries], before
+
+
+BENCHMARKS = [
+    # (name, function, parameter, repeats)
+    ('world.init', bench_world_init, None, 3),
+    ('world.generate_terrain', bench_generate_terrain, None, 3),
+    ('world.generate_large[serial]', bench_generate_large, 1, 3),
+    ('world.generate_large[parallel]', bench_generate_large, os.cpu_count() or 1, 3),
+    ('world.find_islands', bench_find_islands, None, 3),
+    ('world.label_components', bench_label_components, None, 5),
+    ('world.create_map_surface', bench_create_map_surface, None, 5),
+    ('world.draw_terrain_cold', bench_draw_terrain, None, 10),
+    ('world.deform_terrain[r=40]', bench_deform_terrain, 40, 10),
+    ('world.deform_terrain[r=100]', bench_deform_terrain, 100, 10),
+    ('streamed_world.init', bench_streamed_init, None, 3),
+    ('streamed_world.draw_terrain_cold', bench_streamed_draw, None, 10),
+] + [
+    (f'streamed_world.is_land_batch[{n}]', bench_streamed_is_land, n, 50) for n in (100, 10000)
+] + [
+    (f'server.update_game_state[{n}]', bench_update_game_state, n, 50) for n in FLEET_SIZES
+] + [
+    (f'lockstep.step[{n}]', bench_lockstep_step, n, 50) for n in FLEET_SIZES
+] + [
+    (f'protocol.encode[{n}]', bench_encode, n, max(5, 5000 // n)) for n in FLEET_SIZES
+] + [
+    (f'protocol.decode[{n}]', bench_decode, n, max(5, 5000 // n)) for n in FLEET_SIZES
+] + [
+    (f'pathfinding.find_path[{n}]', bench_find_path, n, 5) for n in (10, 100)
+] + [
+    (f'strategy_view.draw[{n}]', bench_strategy_draw, n, 30) for n in (12, 200, 2000)
+] + [
+    (f'snapshot_buffer.positions_at[{n}]', bench_positions_at, n, 50) for n in (200, 2000)
+] + [
+    (f'replay.seek[keyframe+{n}]', bench_replay_seek, n, 10) for n in (0, 50)
+] + [
+    (f'projectile.update[{n}]', bench_projectile_update, n, 30) for n in (100, 1000, 10000)
+] + [
+    ('combat_terrain.deform_terrain', bench_combat_craters, None, 10),
+] + [
+    (f'combat_terrain.draw[{n}]', bench_combat_draw, n, 50) for n in (0, 1000)
+]
+
+
+def measure(function, parameter, repeats):
+    run, before = function(parameter)
+    run()  # Warm up caches that a running game would already have warm
+    times = []
+    for _ in range(repeats):
+        if before:
+            before()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {
+        'repeats': repeats,
+        'median_ms': statistics.median(times) * 1000,
+        'min_ms': min(times) * 1000,
+        'mean_ms': statistics.fmean(times) * 1000,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pygame': pygame.version.ver,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+# Fields of environment() that must match for timings to be comparable
+HARDWARE_FIELDS = ('platform', 'machine', 'cpus', 'python')
+
+
+def compare(results, baseline, threshold):
+    """Returns [(name, median_ms, baseline median_ms or None, regressed)] for every result."""
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        base_ms = base['median_ms'] if base else None
+        regressed = base_ms is not None and result['median_ms'] > base_ms * (1 + threshold)
+        rows.append((name, result['median_ms'], base_ms, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Nautical benchmark suite.")
+    parser.add_argument('--output', default=RESULTS_PATH, help="Where the results are written as JSON")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Results file to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Allowed slowdown over the baseline median, e.g. 0.25 for 25%%")
+    parser.add_argument('--save-baseline', action='store_true', help="Also store the results as the new baseline")
+    parser.add_argument('--filter', default='', help="Only run benchmarks whose name contains this text")
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    results = {}
+    for name, function, parameter, repeats in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        results[name] = measure(function, parameter, repeats)
+        print(f"{name:<36}{results[name]['median_ms']:>12.3f} ms")
+
+    report = {'environment': environment(), 'threshold': args.threshold, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    here = environment()
+    differences = [f"{field} {baseline['environment'].get(field)} here {here[field]}"
+                   for field in HARDWARE_FIELDS if baseline['environment'].get(field) != here[field]]
+    if differences:
+        print(f"Warning: the baseline was recorded on a different machine ({'; '.join(differences)}); "
+              "record one for this machine with --save-baseline.")
+    baseline = baseline['results']
+
+    print(f"\n{'benchmark':<36}{'median ms':>12}{'baseline ms':>14}{'change':>10}")
+    regressions = 0
+    for name, median_ms, base_ms, regressed in compare(results, baseline, args.threshold):
+        if base_ms is None:
+            print(f"{name:<36}{median_ms:>12.3f}{'-':>14}{'new':>10}")
+            continue
+        change = f"{(median_ms / base_ms - 1) * 100:+.1f}%" if base_ms else '-'
+        print(f"{name:<36}{median_ms:>12.3f}{base_ms:>14.3f}{change:>10}{'  REGRESSION' if regressed else ''}")
+        regressions += regressed
+    if regressions:
+        print(f"{regressions} benchmark(s) regressed by more than {args.threshold:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import numpy as np
+import pygame
+from settings import *
+
+
+class CombatTerrain:
+    """
+    The destructible ground of the side-view combat arena, as a solid/empty bitmap with one entry per pixel.
+
+    Point queries are a single array lookup. A crater clears a disk of the bitmap and redraws only the
+    part of the terrain surface under it, so drawing costs one blit however many craters there are.
+    """
+
+    def __init__(self, ground_heights, height, color=LAND_GREEN):
+        """ground_heights holds, for every pixel column of the arena, the y of its ground surface."""
+        width = len(ground_heights)
+        self.width, self.height = width, height
+        ys = np.arange(height)[:, np.newaxis]
+        self.solid = ys >= np.asarray(ground_heights)[np.newaxis, :]  # Indexed [y, x]
+
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.surface.fill(color)
+        self.redraw((0, 0, width, height))
+
+    def redraw(self, rect):
+        """Updates the transparency of the terrain surface inside rect (x, y, w, h) from the bitmap."""
+        x, y, w, h = rect
+        sub = self.surface.subsurface(rect)
+        # surfarray is indexed [x, y], the bitmap [y, x]
+        pygame.surfarray.pixels_alpha(sub)[:] = self.solid[y:y + h, x:x + w].T * np.uint8(255)
+
+    def is_land(self, pos):
+        """Whether the pixel at pos is solid ground. Everything outside the arena is open air."""
+        x, y = int(pos[0]), int(pos[1])
+        return 0 <= x < self.width and 0 <= y < self.height and bool(self.solid[y, x])
+
+    def is_land_batch(self, positions):
+        """is_land() for an (n, 2) array of pixel positions, as one gather from the bitmap."""
+        xs = np.floor(positions[:, 0]).astype(np.int64)
+        ys = np.floor(positions[:, 1]).astype(np.int64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        result = np.zeros(len(positions), dtype=bool)
+        result[inside] = self.solid[ys[inside], xs[inside]]
+        return result
+
+    def ground_at(self, x):
+        """The y of the topmost solid pixel in column x, or the arena height if it has been blasted away."""
+        column = self.solid[:, int(min(max(x, 0), self.width - 1))]
+        return int(np.argmax(column)) if column.any() else self.height
+
+    def deform_terrain(self, pos, radius):
+        """Blasts a disk of the given pixel radius out of the ground around pos."""
+        cx, cy = pos
+        x0, x1 = max(0, int(cx - radius)), min(self.width, int(cx + radius) + 1)
+        y0, y1 = max(0, int(cy - radius)), min(self.height, int(cy + radius) + 1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        xs = np.arange(x0, x1) + 0.5 - cx
+        ys = np.arange(y0, y1) + 0.5 - cy
+        disk = xs[np.newaxis, :] ** 2 + ys[:, np.newaxis] ** 2 <= radius ** 2
+        self.solid[y0:y1, x0:x1] &= ~disk
+        self.redraw((x0, y0, x1 - x0, y1 - y0))
+
+    def draw(self, screen, offset=(0, 0)):
+        screen.blit(self.surface, offset)
@@ -1,7 +1,8 @@
 import pygame
 import math
 from settings import *
-from entities import Projectile
+from projectiles import Projectiles
+from combat_terrain import CombatTerrain
 import random
 
 
@@ -28,14 +29,16 @@ class CombatPlayer:
 class CombatView:
     def __init__(self, game_manager):
         self.game_manager = game_manager
-        self.projectiles = pygame.sprite.Group()
-        self.combat_world = None
+        self.projectiles = Projectiles()
+        self.arena = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)  # Shells leaving it are dropped
+        self.combat_world = None  # The strategy world sector the battle takes place in
+        self.terrain = None  # The destructible CombatTerrain of the arena
         self.attacker = None
         self.defender = None
 
     def on_enter(self, data):
         # Reset and setup combat
-        self.projectiles.empty()
+        self.projectiles.clear()
         self.combat_world = data['world_sector']
 
         # Position players on screen
@@ -43,15 +46,12 @@ class CombatView:
         self.defender = CombatPlayer(pygame.math.Vector2(SCREEN_WIDTH - 100, SCREEN_HEIGHT - 100), RED, data['defender'])
 
         # For simplicity, create a flat ground for combat
-        self.combat_terrain_slice = self.create_terrain_slice()
+        self.terrain = self.create_terrain_slice()
 
     def create_terrain_slice(self):
-        """Creates a simplified 1D terrain slice for the combat view."""
-        slice_surf = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        slice_surf.fill((0, 0, 0, 0))
-        # Draw a simple ground
+        """Creates the destructible side-view ground of the arena, flat for now."""
         ground_y = SCREEN_HEIGHT - 50
-        pygame.draw.rect(slice_surf, LAND_GREEN, (0, ground_y, SCREEN_WIDTH, 50))
+        terrain = CombatTerrain([ground_y] * SCREEN_WIDTH, SCREEN_HEIGHT)
 
         # Place players on the ground
         self.attacker.pos.y = ground_y - self.attacker.rect.height / 2
@@ -59,7 +59,7 @@ class CombatView:
         self.defender.pos.y = ground_y - self.defender.rect.height / 2
         self.defender.rect.midbottom = (self.defender.pos.x, ground_y)
 
-        return slice_surf
+        return terrain
 
     def handle_event(self, event):
         if event.type == pygame.KEYDOWN:
@@ -83,8 +83,7 @@ class CombatView:
         # Scale down velocity for gameplay
         vel = pygame.math.Vector2(velocity_x, velocity_y) * 0.5
 
-        proj = Projectile(start_pos, vel)
-        self.projectiles.add(proj)
+        self.projectiles.fire(start_pos, vel)
 
     def end_combat(self):
         # In a real game, you would calculate damage here
@@ -102,18 +101,14 @@ class CombatView:
         if self.attacker.is_charging:
             self.attacker.power += 500 * dt
 
-        self.projectiles.update(dt, self.combat_world)  # Pass a dummy world for now
-
-        # Check projectile collision with defender
-        for proj in self.projectiles:
-            if proj.rect.colliderect(self.defender.rect):
-                print("HIT!")
-                proj.kill()
-                self.end_combat()
+        # Shell paths are swept against the defender, so fast shells can't skip past it between frames
+        if self.projectiles.update(dt, self.terrain, self.arena, [self.defender.rect], COMBAT_CRATER_RADIUS):
+            print("HIT!")
+            self.end_combat()
 
     def draw(self, screen):
         screen.fill(OCEAN_BLUE)
-        screen.blit(self.combat_terrain_slice, (0, 0))
+        self.terrain.draw(screen)
         self.attacker.draw(screen)
         self.defender.draw(screen)
         self.projectiles.draw(screen)
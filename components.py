@@ -0,0 +1,328 @@
+import numpy as np
+from settings import *
+
+# Tiles around a change that are searched for another way to keep a component in one piece
+LOCAL_MARGIN = 8
+
+
+def label_runs(mask):
+    """
+    Labels the 4-connected components of a 2D boolean mask.
+
+    Each row is split into runs of set tiles, runs that overlap in neighbouring rows are joined
+    with union-find, and the labels are painted back run by run, so Python only ever loops over
+    runs, never over tiles. Returns (labels, sizes, sum_x, sum_y, bboxes): labels is an int32 grid
+    with 0 outside the mask and 1..n inside, numbered in scan order of each component's first tile.
+    The tables are indexed by label, with a row for the unused label 0; bboxes rows are (x0, y0, x1, y1),
+    end exclusive.
+    """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    run_count = len(starts)
+
+    # Runs are ordered by row, then column, so keys that combine the two are sorted too. The runs of
+    # the row above that overlap a run form one contiguous range of them.
+    stride = width + 1
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+    below = np.flatnonzero(rows > 0)
+    first = np.searchsorted(end_keys, (rows[below] - 1) * stride + starts[below], side='right')
+    last = np.searchsorted(start_keys, (rows[below] - 1) * stride + ends[below], side='left')
+
+    parent = list(range(run_count))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    for run, lo, hi in zip(below.tolist(), first.tolist(), last.tolist()):
+        for above in range(lo, hi):
+            a, b = find(run), find(above)
+            if a != b:
+                # Keep the earlier run as the root so that roots stay in scan order
+                if a < b:
+                    parent[b] = a
+                else:
+                    parent[a] = b
+
+    roots = np.array([find(run) for run in range(run_count)], dtype=np.int64)
+    # Every root is the first run of its component, so sorted roots are in scan order
+    unique_roots, inverse = np.unique(roots, return_inverse=True)
+    run_labels = (inverse + 1).astype(np.int32)
+    count = len(unique_roots)
+
+    lengths = ends - starts
+    labels = np.zeros((height, width), dtype=np.int32)
+    # The set tiles of the mask, in row-major order, are exactly the runs laid end to end
+    labels.ravel()[np.flatnonzero(mask)] = np.repeat(run_labels, lengths)
+
+    sizes = np.bincount(run_labels, weights=lengths, minlength=count + 1).astype(np.int64)
+    sum_x = np.bincount(run_labels, weights=lengths * (starts + ends - 1) // 2, minlength=count + 1).astype(np.int64)
+    sum_y = np.bincount(run_labels, weights=lengths * rows, minlength=count + 1).astype(np.int64)
+    bboxes = np.zeros((count + 1, 4), dtype=np.int32)
+    bboxes[1:, :2] = np.iinfo(np.int32).max
+    np.minimum.at(bboxes[:, 0], run_labels, starts)
+    np.minimum.at(bboxes[:, 1], run_labels, rows)
+    np.maximum.at(bboxes[:, 2], run_labels, ends)
+    np.maximum.at(bboxes[:, 3], run_labels, rows + 1)
+    bboxes[0] = 0
+    return labels, sizes, sum_x, sum_y, bboxes
+
+
+class ComponentTable:
+    """
+    The connected components of one kind of tile: a label grid indexed [y, x] and, per label, the
+    component's size in tiles, its bounding box and the sums of its tile coordinates for the centroid.
+    Labels of components that were merged or relabelled are left with size 0 and never reused.
+    """
+
+    TABLES = ('labels', 'sizes', 'sum_x', 'sum_y', 'bboxes')
+
+    def __init__(self, mask=None, tables=None):
+        """Labels mask, or takes over tables as returned by to_arrays() without looking at any tile."""
+        if tables is None:
+            tables = label_runs(mask)
+        self.labels, self.sizes, self.sum_x, self.sum_y, self.bboxes = tables
+        self.count = len(self.sizes) - 1  # Highest label handed out; the tables may have room for more
+
+    def to_arrays(self):
+        """The label grid and the per-label tables, trimmed to the labels handed out."""
+        end = self.count + 1
+        return (self.labels, self.sizes[:end], self.sum_x[:end], self.sum_y[:end], self.bboxes[:end])
+
+    def centroid(self, label):
+        """The mean tile position of a component, in tiles."""
+        size = self.sizes[label]
+        return self.sum_x[label] / size, self.sum_y[label] / size
+
+    def live_labels(self):
+        return np.flatnonzero(self.sizes)
+
+    def update(self, mask, tile_rect, was_set):
+        """
+        Brings the labels up to date with mask after the tiles in tile_rect changed; was_set is the
+        old mask within tile_rect. Tiles that only joined or only left components are handled
+        locally; anything else relabels the components around the change.
+        """
+        x, y, w, h = tile_rect
+        now_set = mask[y:y + h, x:x + w]
+        gained = now_set & ~was_set
+        lost = was_set & ~now_set
+        if gained.any() and lost.any():
+            self.relabel(mask, tile_rect)
+        elif gained.any():
+            self.add_tiles(mask, tile_rect, gained)
+        elif lost.any():
+            self.remove_tiles(mask, tile_rect, lost)
+
+    def window(self, tile_rect, margin):
+        x, y, w, h = tile_rect
+        height, width = self.labels.shape
+        return max(0, x - margin), max(0, y - margin), min(width, x + w + margin), min(height, y + h + margin)
+
+    def reserve(self, n):
+        """Makes room in the tables for n more labels."""
+        needed = self.count + n + 1
+        if needed > len(self.sizes):
+            capacity = max(needed, 2 * len(self.sizes))
+            for name in ('sizes', 'sum_x', 'sum_y', 'bboxes'):
+                old = getattr(self, name)
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+
+    def new_label(self):
+        self.reserve(1)
+        self.count += 1
+        return self.count
+
+    def add_tiles(self, mask, tile_rect, gained):
+        """Labels tiles that joined the mask, merging the components that they connect."""
+        x0, y0, x1, y1 = self.window(tile_rect, 1)
+        local, _, _, _, _ = label_runs(mask[y0:y1, x0:x1])
+        old = self.labels[y0:y1, x0:x1]
+        ys, xs = np.nonzero(gained)
+        ys, xs = ys + tile_rect[1], xs + tile_rect[0]
+        merged_into = {}
+
+        def resolve(label):
+            while label in merged_into:
+                label = merged_into[label]
+            return label
+
+        for piece in np.unique(local[ys - y0, xs - x0]).tolist():
+            in_piece = local == piece
+            touching = {resolve(label) for label in np.unique(old[in_piece]).tolist() if label}
+            keep = min(touching) if touching else self.new_label()
+            for other in touching - {keep}:
+                bx0, by0, bx1, by1 = self.bboxes[other].tolist()
+                box = self.labels[by0:by1, bx0:bx1]
+                box[box == other] = keep
+                self.sizes[keep] += self.sizes[other]
+                self.sum_x[keep] += self.sum_x[other]
+                self.sum_y[keep] += self.sum_y[other]
+                self.grow_bbox(keep, bx0, by0, bx1, by1)
+                self.sizes[other] = self.sum_x[other] = self.sum_y[other] = 0
+                self.bboxes[other] = 0
+                merged_into[other] = keep
+
+            new_tiles = in_piece & (old == 0)
+            tile_ys, tile_xs = np.nonzero(new_tiles)
+            old[new_tiles] = keep
+            self.sizes[keep] += len(tile_xs)
+            self.sum_x[keep] += int(tile_xs.sum()) + len(tile_xs) * x0
+            self.sum_y[keep] += int(tile_ys.sum()) + len(tile_ys) * y0
+            self.grow_bbox(keep, x0 + tile_xs.min(), y0 + tile_ys.min(), x0 + tile_xs.max() + 1, y0 + tile_ys.max() + 1)
+
+    def grow_bbox(self, label, x0, y0, x1, y1):
+        if not self.sizes[label] or not self.bboxes[label].any():
+            self.bboxes[label] = (x0, y0, x1, y1)
+            return
+        bbox = self.bboxes[label]
+        bbox[:] = min(bbox[0], x0), min(bbox[1], y0), max(bbox[2], x1), max(bbox[3], y1)
+
+    def remove_tiles(self, mask, tile_rect, lost):
+        """
+        Unlabels tiles that left the mask. A component only needs relabelling if what is left of it
+        around the change falls apart into pieces that aren't connected nearby; any path between two
+        of its tiles that ran through the lost tiles enters that area on both sides.
+        """
+        ys, xs = np.nonzero(lost)
+        ys, xs = ys + tile_rect[1], xs + tile_rect[0]
+        lost_labels = self.labels[ys, xs]
+        x0, y0, x1, y1 = self.window(tile_rect, LOCAL_MARGIN)
+        local, _, _, _, _ = label_runs(mask[y0:y1, x0:x1])
+        old = self.labels[y0:y1, x0:x1]
+        remaining = mask[y0:y1, x0:x1]
+        for label in np.unique(lost_labels).tolist():
+            if len(np.unique(local[(old == label) & remaining])) > 1:
+                self.relabel(mask, tile_rect)
+                return
+
+        self.labels[ys, xs] = 0
+        np.subtract.at(self.sizes, lost_labels, 1)
+        np.subtract.at(self.sum_x, lost_labels, xs)
+        np.subtract.at(self.sum_y, lost_labels, ys)
+        for label in np.unique(lost_labels).tolist():
+            if not self.sizes[label]:
+                self.bboxes[label] = 0
+                continue
+            bx0, by0, bx1, by1 = self.bboxes[label].tolist()
+            box = self.labels[by0:by1, bx0:bx1] == label
+            cols, rows = np.flatnonzero(box.any(axis=0)), np.flatnonzero(box.any(axis=1))
+            self.bboxes[label] = (bx0 + cols[0], by0 + rows[0], bx0 + cols[-1] + 1, by0 + rows[-1] + 1)
+
+    def relabel(self, mask, tile_rect):
+        """
+        Brings the labels up to date with mask after the tiles in tile_rect changed. Only the
+        components next to those tiles are labelled again, within the box that covers all of them.
+        """
+        height, width = mask.shape
+        x, y, w, h = tile_rect
+        # Components touching the changed tiles, or next to them, may have split or merged
+        rx0, ry0 = max(0, x - 1), max(0, y - 1)
+        rx1, ry1 = min(width, x + w + 1), min(height, y + h + 1)
+        affected = np.unique(self.labels[ry0:ry1, rx0:rx1])
+        affected = affected[affected != 0]
+        x0, y0, x1, y1 = rx0, ry0, rx1, ry1
+        if len(affected):
+            boxes = self.bboxes[affected]
+            x0, y0 = min(x0, int(boxes[:, 0].min())), min(y0, int(boxes[:, 1].min()))
+            x1, y1 = max(x1, int(boxes[:, 2].max())), max(y1, int(boxes[:, 3].max()))
+
+        window = self.labels[y0:y1, x0:x1]
+        was_affected = np.isin(window, affected)
+        in_rect = np.zeros(window.shape, dtype=bool)
+        in_rect[ry0 - y0:ry1 - y0, rx0 - x0:rx1 - x0] = True
+        # Everything else in the window belongs to components that can't have changed
+        window_mask = mask[y0:y1, x0:x1] & (was_affected | in_rect)
+        window[was_affected] = 0
+        self.sizes[affected] = 0
+        self.sum_x[affected] = 0
+        self.sum_y[affected] = 0
+        self.bboxes[affected] = 0
+
+        labels, sizes, sum_x, sum_y, bboxes = label_runs(window_mask)
+        new_count = len(sizes) - 1
+        if not new_count:
+            return
+        window[window_mask] = labels[window_mask] + self.count
+        self.reserve(new_count)
+        new = slice(self.count + 1, self.count + 1 + new_count)
+        self.sizes[new] = sizes[1:]
+        self.sum_x[new] = sum_x[1:] + sizes[1:] * x0
+        self.sum_y[new] = sum_y[1:] + sizes[1:] * y0
+        self.bboxes[new] = bboxes[1:] + np.array([x0, y0, x0, y0], dtype=np.int32)
+        self.count += new_count
+
+
+class TerrainComponents:
+    """
+    Labels the islands and water bodies of a heightmap once, and keeps them up to date as the
+    terrain changes. Both are 4-connected; ships can't slip diagonally between two land tiles either,
+    so two water tiles with the same label are always reachable from each other.
+    """
+
+    ARRAYS = ('is_water',) + tuple(f'{kind}_{name}' for kind in ('land', 'water') for name in ComponentTable.TABLES)
+
+    def __init__(self, heights, arrays=None):
+        """Labels heights, or restores labels saved with to_arrays() for the same heights."""
+        self.heights = heights
+        if arrays is None:
+            self.is_water = heights < WATER_LEVEL  # As of the last labelling
+            self.land = ComponentTable(~self.is_water)
+            self.water = ComponentTable(self.is_water)
+        else:
+            self.is_water = arrays['is_water']
+
+            def restore(kind):
+                # The small per-label tables are copied, as relabelling grows them; the grid is used as given
+                return ComponentTable(tables=[arrays[f'{kind}_{name}'] if name == 'labels' else np.array(arrays[f'{kind}_{name}'])
+                                              for name in ComponentTable.TABLES])
+            self.land, self.water = restore('land'), restore('water')
+
+    def to_arrays(self):
+        """Everything needed to restore these labels without labelling again, as named arrays."""
+        arrays = {'is_water': self.is_water}
+        for kind, table in (('land', self.land), ('water', self.water)):
+            arrays.update((f'{kind}_{name}', array) for name, array in zip(ComponentTable.TABLES, table.to_arrays()))
+        return arrays
+
+    def update(self, tile_rect):
+        """Relabels the components around tile_rect, whose heights changed, if any tile turned from land to water or back."""
+        x, y, w, h = tile_rect
+        was_water = self.is_water[y:y + h, x:x + w].copy()
+        is_water = self.heights[y:y + h, x:x + w] < WATER_LEVEL
+        if np.array_equal(is_water, was_water):
+            return
+        self.is_water[y:y + h, x:x + w] = is_water
+        self.land.update(~self.is_water, tile_rect, ~was_water)
+        self.water.update(self.is_water, tile_rect, was_water)
+
+    @staticmethod
+    def tile_of(world_pos):
+        tile_x, tile_y = int(world_pos[0] // TILE_SIZE), int(world_pos[1] // TILE_SIZE)
+        if 0 <= tile_x < WORLD_TILES_X and 0 <= tile_y < WORLD_TILES_Y:
+            return tile_x, tile_y
+        return None
+
+    def island_at(self, world_pos):
+        """The label of the island at a world pixel position, or 0 on water and off the map."""
+        tile = self.tile_of(world_pos)
+        return int(self.land.labels[tile[1], tile[0]]) if tile else 0
+
+    def water_body_at(self, world_pos):
+        """The label of the body of water at a world pixel position, or 0 on land and off the map."""
+        tile = self.tile_of(world_pos)
+        return int(self.water.labels[tile[1], tile[0]]) if tile else 0
+
+    def connected_by_water(self, a, b):
+        """True if both positions are on water that a ship can sail between."""
+        body = self.water_body_at(a)
+        return body != 0 and body == self.water_body_at(b)
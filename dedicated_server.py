@@ -0,0 +1,39 @@
+# Runs a NetworkServer on its own, without a window, for hosting games on a machine with no display.
+# The first player to join becomes Player 1 and can start the game from the lobby.
+# On POSIX systems, sending SIGUSR1 writes the tick timing stats to the --stats-file.
+
+import argparse
+import signal
+import time
+from networking import NetworkServer
+from settings import SERVER_HOST, SERVER_PORT, MAX_PLAYERS, TICK_INTERVAL, TICK_STATS_PATH
+
+def main():
+    """
+    Starts the server and keeps it running until interrupted.
+    """
+    parser = argparse.ArgumentParser(description="Run a dedicated Nautical server.")
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--tick-interval', type=float, default=TICK_INTERVAL, help="Seconds between server ticks")
+    parser.add_argument('--stats-file', default=TICK_STATS_PATH, help="Where tick stats are written")
+    parser.add_argument('--profile-ticks', type=int, default=0, help="cProfile this many ticks once the game starts")
+    args = parser.parse_args()
+
+    server = NetworkServer(host=SERVER_HOST, port=args.port, max_clients=MAX_PLAYERS, tick_interval=args.tick_interval)
+    server.start()
+    if args.profile_ticks:
+        server.profile_ticks(args.profile_ticks)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: server.dump_tick_stats(args.stats_file))
+
+    try:
+        while server.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.dump_tick_stats(args.stats_file)
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import math
 import pygame
 from settings import *
 from assets import assets
@@ -12,23 +13,33 @@ class BaseUnit(pygame.sprite.Sprite):
         self.unique_id = unique_id
         self.unit_type = unit_type
 
-        self.image = assets.images[str(self.unit_type) + "_" + str(self.player_owner+1)]
+        self.heading = None  # Degrees, 0 is east; None until the unit first moves
+        self.drawn_pos = pygame.math.Vector2(pos)  # Where the image was last placed
+        self.image = assets.ship_image(self.unit_type, self.player_owner)
         self.rect = self.image.get_rect(center=self.pos)
 
         self.selected = False
+        self.spatial_index = None  # Set by the view that owns the sprite, moved on every update
         self.radar_range = SHIP_STATS[self.unit_type]['radar']
         self.speed = SHIP_STATS[self.unit_type]['speed']
 
     def update_from_state(self, unit_data):
         self.server_pos.x, self.server_pos.y = unit_data['pos']
-        # We don't snap self.pos directly, we interpolate towards it in update()
+        # We don't snap self.pos directly; the view sets it from its snapshot buffer every frame
 
     def update(self, dt):
-        # Interpolate position smoothly towards the server's position
-        lerp_factor = 0.25  # Adjust for smoother or tighter movement
-        self.pos.x += (self.server_pos.x - self.pos.x) * lerp_factor
-        self.pos.y += (self.server_pos.y - self.pos.y) * lerp_factor
+        dx, dy = self.pos.x - self.drawn_pos.x, self.pos.y - self.drawn_pos.y
+        if dx or dy:
+            self.drawn_pos.update(self.pos)
+            heading = math.degrees(math.atan2(dy, dx))
+            if heading != self.heading:
+                # The image comes from a cache of rotations, so turning every frame makes no new surfaces
+                self.heading = heading
+                self.image = assets.ship_image(self.unit_type, self.player_owner, heading)
+                self.rect = self.image.get_rect()
         self.rect.center = self.pos
+        if self.spatial_index is not None:
+            self.spatial_index.move(self)
 
     def set_target(self, pos):
         self.target_pos.x, self.target_pos.y = pos
@@ -57,30 +68,3 @@ class ScoutShip(BaseUnit):
 class CommandCenter(BaseUnit):
     def __init__(self, pos, player_owner, unique_id):
         super().__init__(pos, player_owner, unique_id, 'command_center')
-
-
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, pos, velocity):
-        super().__init__()
-        self.pos = pygame.math.Vector2(pos)
-        self.velocity = pygame.math.Vector2(velocity)
-        self.image = pygame.Surface((6, 6))
-        self.image.fill(BLACK)
-        pygame.draw.circle(self.image, WHITE, (3, 3), 3)
-        self.image.set_colorkey(BLACK)
-        self.rect = self.image.get_rect(center=self.pos)
-        self.age = 0
-
-    def update(self, dt, world):
-        self.velocity.y += PROJECTILE_GRAVITY * dt
-        self.pos += self.velocity * dt
-        self.rect.center = self.pos
-        self.age += dt
-
-        if not pygame.display.get_surface().get_rect().colliderect(self.rect) or self.age > 10:
-            self.kill()
-
-        if world.is_land(self.pos):
-            world.deform_terrain(self.pos, DESTRUCTION_RADIUS)
-            self.kill()
-
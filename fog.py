@@ -0,0 +1,136 @@
+import numpy as np
+import pygame
+from settings import *
+from streamed_world import chunk_parts
+
+UNEXPLORED, EXPLORED, VISIBLE = 0, 1, 2
+# Units whose radar covers a bounding box of at most this many tiles are stamped into one grid
+DENSE_STAMP_AREA = 2048 * 2048
+
+
+class FogOfWar:
+    """
+    Tracks which tiles the local player can see, at tile resolution.
+
+    Visibility is only recomputed when a friendly unit enters a new tile, and the overlay is only
+    rendered for the area around the camera, at one pixel per tile, then scaled up and cached until
+    visibility or the terrain under it changes.
+    The state is kept per chunk, and only for chunks that have been seen, so it stays small on
+    streamed worlds too.
+    """
+
+    def __init__(self, world):
+        self.world = world
+        self.chunks = {}  # (chunk_x, chunk_y): state of the chunk's tiles, for chunks that were ever visible
+        self.visible_chunks = set()  # Chunks with VISIBLE tiles
+        self.unit_tiles = {}  # unit_id: (tile_x, tile_y, radar_range) as of the last recompute
+        self.radar_masks = {}  # radar_range: boolean disk of the tiles it covers
+        self.overlay = None
+        self.overlay_rect = None  # Tile rect covered by the cached overlay
+        self.overlay_dirty = True
+        world.terrain_listeners.append(self.on_terrain_changed)
+
+    def on_terrain_changed(self, tile_rect):
+        """The overlay tints unexplored tiles by their terrain colour, so craters under it need a new render."""
+        if self.overlay_rect is not None and self.overlay_rect.colliderect(tile_rect):
+            self.overlay_dirty = True
+
+    def get_radar_mask(self, radar_range):
+        mask = self.radar_masks.get(radar_range)
+        if mask is None:
+            r = int(radar_range // TILE_SIZE) + 1
+            offsets = (np.arange(-r, r + 1) * TILE_SIZE) ** 2
+            mask = offsets[np.newaxis, :] + offsets[:, np.newaxis] <= radar_range ** 2
+            self.radar_masks[radar_range] = mask
+        return mask
+
+    def update(self, units):
+        """Recomputes visibility if any of the given friendly units moved to another tile."""
+        unit_tiles = {
+            unit.unique_id: (int(unit.pos.x // TILE_SIZE), int(unit.pos.y // TILE_SIZE), unit.radar_range)
+            for unit in units
+        }
+        if unit_tiles == self.unit_tiles:
+            return
+        self.unit_tiles = unit_tiles
+
+        for key in self.visible_chunks:
+            state = self.chunks[key]
+            state[state == VISIBLE] = EXPLORED
+        self.visible_chunks.clear()
+
+        stamps = []  # (x0, y0, x1, y1, part of the radar mask inside the world)
+        for tile_x, tile_y, radar_range in unit_tiles.values():
+            mask = self.get_radar_mask(radar_range)
+            r = mask.shape[0] // 2
+            x0, x1 = max(0, tile_x - r), min(self.world.tiles_x, tile_x + r + 1)
+            y0, y1 = max(0, tile_y - r), min(self.world.tiles_y, tile_y + r + 1)
+            if x0 < x1 and y0 < y1:
+                stamps.append((x0, y0, x1, y1, mask[y0 - tile_y + r:y1 - tile_y + r, x0 - tile_x + r:x1 - tile_x + r]))
+
+        # Stamp every mask into one grid over their bounding box, unless the units are spread so far
+        # over a streamed world that the box would be huge; then each gets a grid of its own
+        if stamps:
+            left, top = min(stamp[0] for stamp in stamps), min(stamp[1] for stamp in stamps)
+            right, bottom = max(stamp[2] for stamp in stamps), max(stamp[3] for stamp in stamps)
+            if (right - left) * (bottom - top) <= DENSE_STAMP_AREA:
+                groups = [((left, top, right - left, bottom - top), stamps)]
+            else:
+                groups = [((stamp[0], stamp[1], stamp[2] - stamp[0], stamp[3] - stamp[1]), [stamp]) for stamp in stamps]
+        else:
+            groups = []
+
+        for (x, y, w, h), group in groups:
+            visible = np.zeros((h, w), dtype=bool)
+            for x0, y0, x1, y1, mask in group:
+                visible[y0 - y:y1 - y, x0 - x:x1 - x] |= mask
+            for key, chunk_slices, rect_slices in chunk_parts((x, y, w, h)):
+                part = visible[rect_slices]
+                if not part.any():
+                    continue
+                state = self.chunks.get(key)
+                if state is None:
+                    state = self.chunks[key] = np.full((CHUNK_SIZE, CHUNK_SIZE), UNEXPLORED, dtype=np.uint8)
+                state[chunk_slices][part] = VISIBLE
+                self.visible_chunks.add(key)
+        self.overlay_dirty = True
+
+    def render_overlay(self, tile_rect):
+        """Renders the fog for tile_rect at one pixel per tile and scales it up to world pixels."""
+        x, y, w, h = tile_rect
+        state = np.full((h, w), UNEXPLORED, dtype=np.uint8)
+        for key, chunk_slices, rect_slices in chunk_parts(tile_rect):
+            if key in self.chunks:
+                state[rect_slices] = self.chunks[key][chunk_slices]
+        # Unexplored tiles keep the original look: the fog colour minus the terrain colour
+        terrain = self.world.colors_in(tile_rect).astype(np.int16)
+        colors = np.clip(np.array(FOG_COLOR, dtype=np.int16) - terrain, 0, 255).astype(np.uint8)
+        colors[state == EXPLORED] = FOG_COLOR
+        alpha = np.choose(state, [255, FOG_EXPLORED_ALPHA, 0]).astype(np.uint8)
+
+        tile_surf = pygame.Surface((w, h), pygame.SRCALPHA)
+        # surfarray is indexed [x, y], the fog state [y, x]
+        pygame.surfarray.pixels3d(tile_surf)[:] = colors.transpose(1, 0, 2)
+        pygame.surfarray.pixels_alpha(tile_surf)[:] = alpha.T
+        self.overlay = pygame.transform.scale(tile_surf, (w * TILE_SIZE, h * TILE_SIZE))
+        self.overlay_rect = pygame.Rect(tile_rect)
+        self.overlay_dirty = False
+
+    def draw(self, screen, offset):
+        """Draws the fog over the visible part of the world, where offset is the screen position of the world origin."""
+        screen_w, screen_h = screen.get_size()
+        left, top = -offset[0] // TILE_SIZE, -offset[1] // TILE_SIZE
+        right = (-offset[0] + screen_w - 1) // TILE_SIZE + 1
+        bottom = (-offset[1] + screen_h - 1) // TILE_SIZE + 1
+        world_tiles = (0, 0, self.world.tiles_x, self.world.tiles_y)
+        view = pygame.Rect(left, top, right - left, bottom - top).clip(world_tiles)
+        if not view.width or not view.height:
+            return
+
+        if self.overlay_dirty or not self.overlay_rect.contains(view):
+            # Render a margin around the view so that scrolling doesn't re-render every frame
+            margin = view.inflate(2 * CHUNK_SIZE, 2 * CHUNK_SIZE).clip(world_tiles)
+            self.render_overlay(margin)
+
+        dest = (self.overlay_rect.x * TILE_SIZE + offset[0], self.overlay_rect.y * TILE_SIZE + offset[1])
+        screen.blit(self.overlay, dest)
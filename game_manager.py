@@ -1,11 +1,16 @@
+import importlib
 import pygame
 from settings import *
+from startup import startup_timeline
 
-from main_menu_view import MainMenuView
-from lobby_view import LobbyView
-from strategy_view import StrategyView
-from combat_view import CombatView
-from networking import NetworkServer, NetworkClient
+# The module and class of the view for each game state. Views, and whatever their modules import,
+# are only loaded when the game first enters their state, so the main menu shows up sooner.
+STATE_VIEWS = {
+    "MAIN_MENU": ("main_menu_view", "MainMenuView"),
+    "LOBBY": ("lobby_view", "LobbyView"),
+    "STRATEGY": ("strategy_view", "StrategyView"),
+    "COMBAT": ("combat_view", "CombatView"),
+}
 
 
 class Game:
@@ -24,14 +29,20 @@ class Game:
         self.is_host = False
 
         # State management
-        self.states = {
-            "MAIN_MENU": MainMenuView(self),
-            "LOBBY": LobbyView(self),
-            "STRATEGY": StrategyView(self),
-            "COMBAT": CombatView(self)
-        }
+        self.states = {}  # state name: view, for the states entered so far
         self.current_state = "MAIN_MENU"
-        self.active_state_obj = self.states[self.current_state]
+        self.active_state_obj = self.get_state(self.current_state)
+
+    def get_state(self, name):
+        """The view of a game state, importing and constructing it the first time it is needed."""
+        view = self.states.get(name)
+        if view is None:
+            module_name, class_name = STATE_VIEWS[name]
+            with startup_timeline.phase(f"import {module_name}"):
+                view_class = getattr(importlib.import_module(module_name), class_name)
+            with startup_timeline.phase(f"construct {class_name}"):
+                view = self.states[name] = view_class(self)
+        return view
 
     def run(self):
         """The main game loop."""
@@ -61,14 +72,15 @@ class Game:
         self.screen.fill(BLACK)  # Default background
         self.active_state_obj.draw(self.screen)
         pygame.display.flip()
+        startup_timeline.first_frame()
 
     def change_state(self, new_state, data=None):
         """
         Changes the current game state and passes data between them.
         """
-        if new_state in self.states:
+        if new_state in STATE_VIEWS:
             self.current_state = new_state
-            self.active_state_obj = self.states[self.current_state]
+            self.active_state_obj = self.get_state(self.current_state)
             # Pass data to the new state's on_enter method
             self.active_state_obj.on_enter(data)
             print(f"Game State Changed to: {self.current_state}")
@@ -76,11 +88,13 @@ class Game:
             print(f"Error: State '{new_state}' not found.")
 
     def start_server(self):
+        from networking import NetworkServer
         self.network_server = NetworkServer()
         self.network_server.start()
         self.is_host = True
 
     def start_client(self, host_ip):
+        from networking import NetworkClient
         self.network_client = NetworkClient(host=host_ip)
         return self.network_client.connect()
 
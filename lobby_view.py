@@ -18,8 +18,13 @@ class LobbyView:
             self.is_host = data.get('is_host', False)
         self.lobby_state = None
 
+    def can_start_game(self):
+        """The host starts the game; on a dedicated server that is whoever joined first."""
+        client = self.game_manager.network_client
+        return self.is_host or (client is not None and client.player_id == 1)
+
     def handle_event(self, event):
-        if self.is_host and self.start_game_button.handle_event(event):
+        if self.can_start_game() and self.start_game_button.handle_event(event):
             print("Host clicked Start Game. Sending request to server...")
             self.game_manager.network_client.send_message({'type': 'start_game_request'})
 
@@ -27,13 +32,15 @@ class LobbyView:
         client = self.game_manager.network_client
         if client:
             # Process all messages in the queue
-            for msg in client.get_messages():
+            messages = client.get_messages()
+            for i, msg in enumerate(messages):
                 if msg['type'] == 'lobby_update':
                     self.lobby_state = msg['payload']
                 elif msg['type'] == 'start_game':
                     print("Start game message received from server.")
-                    self.game_manager.change_state("STRATEGY", {'initial_state': msg['payload']})
-                    # Break because we are changing state
+                    # Whatever arrived with it, like the first ticks, is for the strategy view
+                    client.requeue(messages[i + 1:])
+                    self.game_manager.change_state("STRATEGY", {'initial_state': msg['payload'], 'received_at': msg['received_at']})
                     return
 
     def draw(self, screen):
@@ -70,7 +77,7 @@ class LobbyView:
             wait_rect = wait_surf.get_rect(center=(SCREEN_WIDTH / 2, 300))
             screen.blit(wait_surf, wait_rect)
 
-        if self.is_host:
+        if self.can_start_game():
             self.start_game_button.draw(screen)
         else:
             wait_surf = self.small_font.render("Waiting for host to start the game...", True, WHITE)
@@ -0,0 +1,99 @@
+import zlib
+import numpy as np
+from settings import *
+from unit_store import UnitStore
+from pathfinding import route_unit
+
+FIXED_ONE = 1 << FIXED_POINT_SHIFT  # One pixel in fixed point
+
+
+def isqrt(values):
+    """floor(sqrt(v)) for an int64 array, exact and therefore the same on every machine."""
+    roots = np.sqrt(values.astype(np.float64)).astype(np.int64)
+    # The float estimate can be one off either way for large values; settle it with integer checks
+    while True:
+        too_big = roots * roots > values
+        if not too_big.any():
+            break
+        roots -= too_big
+    while True:
+        too_small = (roots + 1) * (roots + 1) <= values
+        if not too_small.any():
+            break
+        roots += too_small
+    return roots
+
+
+class FixedPointUnitStore(UnitStore):
+    """
+    A UnitStore whose coordinates and speeds are int64 fixed point with FIXED_POINT_SHIFT fractional
+    bits. Movement is integer arithmetic only, so every peer that applies the same orders to the same
+    units ends up with bit-identical positions, whatever its CPU or floating-point environment.
+    """
+    COORDINATE_DTYPE = np.int64
+
+    def from_pixels(self, values):
+        return np.rint(np.asarray(values, dtype=np.float64) * FIXED_ONE).astype(np.int64)
+
+    def to_pixels(self, values):
+        return values / FIXED_ONE  # Exact: FIXED_ONE is a power of two
+
+    def distances(self, delta):
+        return isqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+
+    def steps(self, delta, distance, speeds):
+        return delta * speeds[:, np.newaxis] // distance[:, np.newaxis]
+
+
+class LockstepSimulation:
+    """
+    The game simulation of lockstep mode. Every peer runs its own copy from the same start_game state
+    and feeds it the same per-tick command lists, so only commands travel over the network. Units are
+    kept in fixed point, and orders are applied in the order the server collected them; state_hash()
+    summarises the whole state so that peers can compare notes and detect a desync.
+    """
+
+    def __init__(self, world, units, pathfinder=None, tick=0):
+        """units maps unit ids to unit dicts, as in the start_game payload."""
+        self.world = world
+        self.pathfinder = pathfinder
+        self.tick = tick
+        self.units = FixedPointUnitStore()
+        for unit_id in sorted(units):
+            unit = units[unit_id]
+            self.units.add(unit_id, unit['type'], unit['owner'], unit['pos'], unit['hp'], unit['target_pos'])
+
+    def step(self, commands):
+        """
+        Advances one tick. commands is the tick's list of (player_id, command), in the server's order.
+        Returns the orders that were routed, as (unit_id, waypoints).
+        """
+        requests = {}  # unit_id: target, in the order of each unit's latest order
+        for player_id, command in commands:
+            unit_id = command['unit_id']
+            if unit_id in self.units and self.units.owner_of(unit_id) == player_id:
+                if command['action'] == 'move' and self.units.type_of(unit_id) != 'command_center':
+                    requests.pop(unit_id, None)
+                    requests[unit_id] = command['target']
+        # Unlike the server's budgeted pathfinding, every order is routed in the tick it arrives, so
+        # that when a route is planned never depends on how fast a peer is
+        orders = []
+        for unit_id, target in requests.items():
+            waypoints = route_unit(self.units, self.world, self.pathfinder, unit_id, target)
+            if waypoints:
+                orders.append((unit_id, waypoints))
+        self.units.update_movement(self.world)
+        self.tick += 1
+        return orders
+
+    def state_hash(self):
+        """A CRC-32 of the tick and every unit's state, in a byte order that doesn't depend on the machine."""
+        units = self.units
+        n = units.count
+        crc = zlib.crc32(np.array([self.tick, n], dtype='<i8').tobytes())
+        for array in (units.ids, units.types, units.owners, units.hp, units.pos, units.target_pos):
+            crc = zlib.crc32(array[:n].astype('<i8').tobytes(), crc)
+        for unit_id in sorted(units.waypoints):
+            crc = zlib.crc32(np.array([unit_id], dtype='<i8').tobytes(), crc)
+            crc = zlib.crc32(np.array(units.waypoints[unit_id], dtype='<i8').tobytes(), crc)
+        return crc
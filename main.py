@@ -1,16 +1,28 @@
 # idea: Based on the "Nautical" concept by Horst Jens and Simon Heppner (2020)
 
+from startup import startup_timeline
+import argparse
 import pygame
+startup_timeline.mark("import pygame")
 from game_manager import Game
-from settings import SCREEN_WIDTH, SCREEN_HEIGHT
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, STARTUP_TIMELINE
+startup_timeline.mark("import game_manager")
 
 def main():
     """
     Main function to initialize and run the game.
     """
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption("Nautical")
+    parser = argparse.ArgumentParser(description="Play Nautical.")
+    parser.add_argument('--startup-timeline', action='store_true', default=STARTUP_TIMELINE,
+                        help="print how long each step took until the first frame")
+    args = parser.parse_args()
+    startup_timeline.enabled = args.startup_timeline
+
+    with startup_timeline.phase("pygame.init"):
+        pygame.init()
+    with startup_timeline.phase("open window"):
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Nautical")
     game = Game(screen)
     game.run()
     pygame.quit()
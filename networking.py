@@ -1,12 +1,20 @@
+import asyncio
+import collections
+import os
 import socket
-import pickle
 import threading
 import time
 import random
-import pygame
-from settings import SHIP_STATS
-
-HEADER_LENGTH = 10
+from settings import (SHIP_STATS, KEYFRAME_INTERVAL, SNAPSHOT_HISTORY, SEND_QUEUE_HIGH_WATER, LAGGARD_POLICY,
+                      TICK_INTERVAL, TICK_STATS_PATH, PATHFINDING_BUDGET, WORLD_STREAMING,
+                      STREAMED_WORLD_WIDTH, STREAMED_WORLD_HEIGHT, LOCKSTEP, STATE_HASH_INTERVAL, REPLAY_DIR)
+from pathfinding import PathFinder, route_unit
+from lockstep import LockstepSimulation
+from replay import ReplayWriter
+from scheduler import TickScheduler
+from snapshots import SnapshotHistory, diff_units, apply_delta
+from unit_store import UnitStore
+from protocol import MessageReader, ProtocolError, encode_message, read_message_async
 
 
 class NetworkClient:
@@ -18,6 +26,8 @@ class NetworkClient:
         self.player_id = None
         self.message_queue = []
         self.queue_lock = threading.Lock()
+        self.send_lock = threading.Lock()  # Acks are sent from the listener thread
+        self.snapshots = SnapshotHistory(SNAPSHOT_HISTORY)  # Reconstructed unit states, by tick
         print("Networking client initialized.")
 
     def connect(self):
@@ -34,23 +44,22 @@ class NetworkClient:
             return False
 
     def listen_for_messages(self):
+        reader = MessageReader(self.client_socket)
         while self.connected:
             try:
-                message_header = self.client_socket.recv(HEADER_LENGTH)
-                if not len(message_header):
+                message_data = reader.read_message()
+                if message_data is None:
                     print("Connection closed by server.")
                     self.connected = False
                     break
 
-                message_length = int(message_header.decode('utf-8').strip())
-                full_message = b''
-                while len(full_message) < message_length:
-                    chunk = self.client_socket.recv(message_length - len(full_message))
-                    if not chunk: break
-                    full_message += chunk
-
-                message_data = pickle.loads(full_message)
+                received_at = time.monotonic()
+                if message_data['type'] == 'game_update':
+                    message_data = self.receive_snapshot(message_data)
+                    if message_data is None:
+                        continue
 
+                message_data['received_at'] = received_at  # For timing snapshots on the client's clock
                 with self.queue_lock:
                     if message_data['type'] == 'welcome':
                         self.player_id = message_data['payload']['id']
@@ -63,6 +72,31 @@ class NetworkClient:
                 self.connected = False
                 break
 
+    def receive_snapshot(self, message_data):
+        """
+        Rebuilds the full unit state of a game_update from its base snapshot and acknowledges it.
+        The returned message carries the full state of every unit that changed since the base.
+        """
+        payload = message_data['payload']
+        if payload['keyframe']:
+            # Older snapshots stay: until the server has our ack for this keyframe, its next deltas
+            # may still be based on one of them
+            base_units = {}
+        else:
+            base_units = self.snapshots.get(payload['base_tick'])
+            if base_units is None:
+                print(f"Dropping game_update {payload['tick']}: missing base snapshot {payload['base_tick']}")
+                return None
+            # The server never falls back to a base older than the one it just used
+            self.snapshots.discard_before(payload['base_tick'])
+
+        units = apply_delta(base_units, payload['units'], payload['removed'])
+        self.snapshots.add(payload['tick'], units)
+        self.send_message({'type': 'ack', 'payload': {'tick': payload['tick']}})
+
+        update = dict(payload, units={unit_id: units[unit_id] for unit_id in payload['units']})
+        return {'type': 'game_update', 'payload': update}
+
     def get_messages(self):
         """Returns all messages from the queue and clears it."""
         with self.queue_lock:
@@ -70,6 +104,11 @@ class NetworkClient:
             self.message_queue.clear()
         return messages
 
+    def requeue(self, messages):
+        """Puts messages taken with get_messages() back at the front of the queue, for the next state to handle."""
+        with self.queue_lock:
+            self.message_queue[:0] = messages
+
     def send_commands(self, commands):
         if not self.connected:
             print("Not connected to server.")
@@ -79,9 +118,9 @@ class NetworkClient:
 
     def send_message(self, message_data):
         try:
-            message = pickle.dumps(message_data)
-            header = f"{len(message):<{HEADER_LENGTH}}".encode('utf-8')
-            self.client_socket.sendall(header + message)
+            message = encode_message(message_data)
+            with self.send_lock:
+                self.client_socket.sendall(message)
         except socket.error as e:
             print(f"Failed to send message: {e}")
             self.connected = False
@@ -93,191 +132,447 @@ class NetworkClient:
             print("Disconnected from server.")
 
 
+# Only the newest of these matters, so a lagging client may skip older ones
+SNAPSHOT_MESSAGES = ('lobby_update', 'game_update')
+
+
+class ClientOutbox:
+    """
+    The outbound queue of one connection. Messages are queued as already encoded, shared bytes and
+    written by the connection's own task, which waits for the socket to drain between messages.
+    """
+
+    def __init__(self, writer, high_water=SEND_QUEUE_HIGH_WATER, policy=LAGGARD_POLICY):
+        self.writer = writer
+        self.high_water = high_water
+        self.policy = policy
+        self.queue = collections.deque()  # (data, is_snapshot)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, data, is_snapshot):
+        """
+        Queues a message. Returns False if the client is lagging and should be disconnected: always
+        under the 'disconnect' policy, and under 'drop' once the messages that can't be dropped alone
+        fill the queue, as tick_commands do in lockstep mode.
+        """
+        if len(self.queue) >= self.high_water:
+            if self.policy == 'disconnect':
+                return False
+            # Only the newest snapshot matters: the incoming one, or else the latest one queued
+            latest = None if is_snapshot else next((item for item in reversed(self.queue) if item[1]), None)
+            kept = collections.deque(item for item in self.queue if not item[1] or item is latest)
+            self.dropped += len(self.queue) - len(kept)
+            self.queue = kept
+            if len(kept) - (latest is not None) >= self.high_water:
+                return False
+        self.queue.append((data, is_snapshot))
+        self.wakeup.set()
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                data, _ = self.queue.popleft()
+                self.writer.write(data)
+                await self.writer.drain()
+        except (OSError, RuntimeError):
+            pass  # The connection is gone; its client_handler cleans up
+
+
 class NetworkServer:
-    def __init__(self, host='0.0.0.0', port=5555, max_clients=4):
+    """
+    The authoritative game server. All connections, the lobby broadcast and the game tick run as
+    tasks on one asyncio event loop, so no client gets a thread and a slow socket never blocks the tick.
+    start() runs the loop in a background thread; serve() can also be awaited directly on an existing loop.
+
+    In lockstep mode the server runs the same LockstepSimulation as every client and only relays each
+    tick's commands; the hashes clients send back are checked against its own to catch desyncs.
+    With a replay_dir, every game is recorded there as a replay of the orders routed each tick.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5555, max_clients=4,
+                 send_queue_high_water=SEND_QUEUE_HIGH_WATER, laggard_policy=LAGGARD_POLICY,
+                 tick_interval=TICK_INTERVAL, lockstep=LOCKSTEP, replay_dir=REPLAY_DIR):
         self.host = host
         self.port = port
         self.max_clients = max_clients
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.clients = {}  # conn: player_id
+        self.send_queue_high_water = send_queue_high_water
+        self.laggard_policy = laggard_policy
+        self.clients = {}  # writer: player_id
+        self.outboxes = {}  # writer: ClientOutbox
+        self.client_acks = {}  # writer: last game_update tick the client acknowledged, None before the first
+        self.snapshots = SnapshotHistory(SNAPSHOT_HISTORY)  # Unit states sent to clients, by tick
         self.client_commands = {}  # player_id: commands
         self.player_counter = 1
         self.running = False
         self.game_started = False
-        self.game_state = {}
+        self.game_state = {}  # world_seed and turn_number; units live in self.units
+        self.units = UnitStore()
         self.world = None
+        self.pathfinder = None
+        self.path_requests = {}  # unit_id: move target still waiting for a path, oldest first
+        self.pathfinding_budget = PATHFINDING_BUDGET
+        self.lockstep = lockstep
+        self.simulation = None  # LockstepSimulation, in lockstep mode
+        self.tick_commands = []  # (player_id, command) collected for the current lockstep tick
+        self.state_hashes = collections.OrderedDict()  # tick: hash of the lockstep state after it
+        self.desyncs = 0
+        self.replay_dir = replay_dir
+        self.replay = None  # ReplayWriter of the game in progress
+        self.tick_orders = []  # (unit_id, waypoints) routed in the current tick, for the replay
         self.lobby_state = {'players': []}
-        self.lock = threading.Lock()
+        self.loop = None
+        self.server = None
+        self.stopped = None  # asyncio.Event that ends serve()
+        self.tasks = set()  # Background tasks, referenced so they aren't garbage collected
+        if lockstep:
+            phases = [
+                ('process_commands', self.collect_commands),
+                ('update_game_state', self.step_simulation),
+                ('broadcast', self.broadcast_tick_commands),
+            ]
+        else:
+            phases = [
+                ('process_commands', self.process_commands),
+                ('pathfinding', self.plan_paths),
+                ('update_game_state', self.update_game_state),
+                ('broadcast', self.broadcast_snapshot),
+            ]
+        if replay_dir:
+            phases.insert(-1, ('record_replay', self.record_replay))
+        self.scheduler = TickScheduler(phases, interval=tick_interval)
         print("Networking server initialized.")
 
     def start(self):
+        """Runs serve() on a new event loop in a daemon thread and waits until the server is listening."""
+        ready = threading.Event()
+        threading.Thread(target=self.run_loop, args=(ready,), daemon=True).start()
+        ready.wait()
+
+    def run_loop(self, ready):
+        self.loop = asyncio.new_event_loop()
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen()
-            self.running = True
-            print(f"Server starting on {self.host}:{self.port}")
-            threading.Thread(target=self.accept_connections, daemon=True).start()
-            threading.Thread(target=self.lobby_updater, daemon=True).start()
-        except socket.error as e:
-            print(f"Server failed to start: {e}")
+            self.loop.run_until_complete(self.serve(ready))
+        finally:
+            self.loop.close()
 
-    def lobby_updater(self):
-        while self.running and not self.game_started:
-            with self.lock:
-                self.update_lobby_state()
-                self.broadcast_message({'type': 'lobby_update', 'payload': self.lobby_state})
-            time.sleep(1)
+    async def serve(self, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        try:
+            self.server = await asyncio.start_server(self.client_handler, self.host, self.port)
+        except OSError as e:
+            print(f"Server failed to start: {e}")
+            if ready:
+                ready.set()
+            return
 
-    def accept_connections(self):
+        self.port = self.server.sockets[0].getsockname()[1]  # The real port when bound to port 0
+        self.running = True
+        print(f"Server starting on {self.host}:{self.port}")
         print("Server is waiting for connections...")
-        while self.running:  # Allow connections even after game starts for reconnections (future)
-            try:
-                conn, addr = self.server_socket.accept()
-                with self.lock:
-                    if not self.game_started and len(self.clients) < self.max_clients:
-                        player_id = self.player_counter
-                        self.player_counter += 1
-
-                        print(f"Accepted connection from {addr}, assigned Player ID {player_id}")
-                        self.clients[conn] = player_id
-                        self.client_commands[player_id] = []
-
-                        self.send_message(conn, {'type': 'welcome', 'payload': {'id': player_id}})
-                        threading.Thread(target=self.client_handler, args=(conn, addr), daemon=True).start()
-                    else:
-                        # Future: Handle reconnections or refuse connection
-                        print(f"Refused connection from {addr}: Lobby full or game in progress.")
-                        conn.close()
-            except socket.error:
-                break
+        if ready:
+            ready.set()
+        self.spawn(self.lobby_updater())
 
-    def client_handler(self, conn, addr):
-        while self.running:
-            try:
-                message_header = conn.recv(HEADER_LENGTH)
-                if not message_header: break
+        await self.stopped.wait()
+        self.running = False
+        self.scheduler.stop()
+        self.server.close()
+        for writer in list(self.clients):
+            writer.close()
+        tasks = [task for task in self.tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+        if self.replay:
+            self.replay.close()
+
+    def spawn(self, coroutine):
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def lobby_updater(self):
+        while self.running and not self.game_started:
+            self.update_lobby_state()
+            self.broadcast_message({'type': 'lobby_update', 'payload': self.lobby_state})
+            await asyncio.sleep(1)
+
+    async def client_handler(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        handler_task = asyncio.current_task()
+        self.tasks.add(handler_task)
+        handler_task.add_done_callback(self.tasks.discard)
+        # Future: Handle reconnections
+        if self.game_started or len(self.clients) >= self.max_clients:
+            print(f"Refused connection from {addr}: Lobby full or game in progress.")
+            writer.close()
+            return
 
-                message_length = int(message_header.decode('utf-8').strip())
-                full_message = pickle.loads(conn.recv(message_length))
+        player_id = self.player_counter
+        self.player_counter += 1
+        print(f"Accepted connection from {addr}, assigned Player ID {player_id}")
+        self.clients[writer] = player_id
+        self.client_acks[writer] = None  # Joining clients start from a keyframe
+        self.client_commands[player_id] = []
+        outbox = ClientOutbox(writer, self.send_queue_high_water, self.laggard_policy)
+        self.outboxes[writer] = outbox
+        outbox_task = self.spawn(outbox.run())
+        self.send_message(writer, {'type': 'welcome', 'payload': {'id': player_id}})
 
-                player_id = self.clients.get(conn)
-                if not player_id: continue
+        try:
+            while self.running:
+                full_message = await read_message_async(reader)
+                if not full_message: break
 
                 if full_message['type'] == 'client_commands':
-                    with self.lock:
-                        self.client_commands[player_id] = full_message['payload']
+                    self.client_commands[player_id] = [command for command in full_message['payload']
+                                                       if self.is_valid_command(player_id, command)]
+
+                elif full_message['type'] == 'ack':
+                    acked = self.client_acks.get(writer)
+                    if acked is None or full_message['payload']['tick'] > acked:
+                        self.client_acks[writer] = full_message['payload']['tick']
+
+                elif full_message['type'] == 'state_hash':
+                    self.check_state_hash(player_id, full_message['payload'])
 
                 elif full_message['type'] == 'start_game_request':
                     if player_id == 1:
-                        self.start_game()
+                        self.spawn(self.start_game())
 
-            except (ConnectionResetError, EOFError, pickle.UnpicklingError):
-                break
+        except (OSError, ProtocolError) as e:
+            print(f"Dropping connection from {addr}: {e}")
+        except asyncio.CancelledError:
+            pass  # The server is shutting down; finish normally so asyncio doesn't log the cancellation
 
         print(f"Connection from {addr} closed.")
-        with self.lock:
-            player_id = self.clients.pop(conn, None)
-            if player_id:
-                self.client_commands.pop(player_id, None)
-        conn.close()
+        self.clients.pop(writer, None)
+        self.client_acks.pop(writer, None)
+        self.outboxes.pop(writer, None)
+        self.client_commands.pop(player_id, None)
+        outbox_task.cancel()
+        writer.close()
+
+    def is_valid_command(self, player_id, command):
+        """
+        Whether a command's move target is a finite point inside the world. Anything else, like a NaN
+        sent by a broken or hostile client, would raise in pathfinding (or every lockstep client's
+        simulation) and stop the game for everyone, so it is dropped.
+        """
+        x, y = command['target']
+        if self.world is not None and 0 <= x < self.world.width and 0 <= y < self.world.height:
+            return True  # Comparisons with NaN are always False, and inf is never inside the world
+        print(f"Dropping command from player {player_id} with target {command['target']}")
+        return False
 
     def update_lobby_state(self):
-        self.lobby_state['players'] = [{'id': pid, 'addr': conn.getpeername()} for conn, pid in self.clients.items()]
-
-    def start_game(self):
-        from world import World
-
-        with self.lock:
-            if self.game_started:
-                print("Start game request ignored: Game already started.")
-                return
-            self.game_started = True
-            print("Initializing and broadcasting start_game state...")
-
-            world_seed = random.randint(0, 10000)
-            self.world = World(seed=world_seed)
-            start_positions = self.world.valid_start_islands
-
-            self.game_state = {'world_seed': world_seed, 'units': {}, 'turn_number': 0}
-            unit_id_counter = 0
-
-            player_ids = list(self.client_commands.keys())
-            random.shuffle(player_ids)
-
-            for i, player_id in enumerate(player_ids):
-                if i < len(start_positions):
-                    pos = start_positions[i]
-                    for unit_type in ['command_center', 'cruiser', 'scout']:
-                        unit_id = unit_id_counter
-                        unit_pos = (pos[0] + random.randint(-20, 20), pos[1] + random.randint(-20, 20))
-
-                        unit_state = {
-                            'id': unit_id, 'type': unit_type, 'owner': player_id,
-                            'pos': unit_pos, 'hp': SHIP_STATS[unit_type]['hp'],
-                            'target_pos': unit_pos
-                        }
-                        self.game_state['units'][unit_id] = unit_state
-                        unit_id_counter += 1
-
-            self.broadcast_message({'type': 'start_game', 'payload': self.game_state})
-            threading.Thread(target=self.game_loop, daemon=True).start()
-
-    def game_loop(self):
-        turn_duration = 1.0
+        self.lobby_state['players'] = [{'id': pid, 'addr': writer.get_extra_info('peername')}
+                                       for writer, pid in self.clients.items()]
+
+    @staticmethod
+    def build_world(world_seed):
+        from world import create_world
+
+        world = create_world(world_seed, WORLD_STREAMING, (STREAMED_WORLD_WIDTH, STREAMED_WORLD_HEIGHT), headless=True)
+        if world.components is None:
+            return world, None  # Streamed worlds are never held whole, so there is no pathfinding graph
+        pathfinder = PathFinder(world)
+        pathfinder.build_graphs()
+        return world, pathfinder
+
+    async def start_game(self):
+        if self.game_started:
+            print("Start game request ignored: Game already started.")
+            return
+        self.game_started = True
+        print("Initializing and broadcasting start_game state...")
+
+        world_seed = random.randint(0, 10000)
+        # Generating the world and its pathfinding graph takes a while, so it runs off the event loop
+        self.world, self.pathfinder = await self.loop.run_in_executor(None, self.build_world, world_seed)
+        start_positions = self.world.valid_start_islands
+
+        self.game_state = {
+            'world_seed': world_seed, 'turn_number': 0, 'world_streamed': WORLD_STREAMING,
+            'lockstep': self.lockstep, 'world_size': (self.world.width, self.world.height),
+            'tick_interval': self.scheduler.interval
+        }
+        self.units = UnitStore()
+        self.path_requests.clear()
+        unit_id_counter = 0
+
+        player_ids = list(self.client_commands.keys())
+        random.shuffle(player_ids)
+
+        for i, player_id in enumerate(player_ids):
+            if i < len(start_positions):
+                pos = start_positions[i]
+                for unit_type in ['command_center', 'cruiser', 'scout']:
+                    unit_id = unit_id_counter
+                    unit_pos = (pos[0] + random.randint(-20, 20), pos[1] + random.randint(-20, 20))
+
+                    self.units.add(unit_id, unit_type, player_id, unit_pos, SHIP_STATS[unit_type]['hp'])
+                    unit_id_counter += 1
+
+        if self.lockstep:
+            # Start positions are whole pixels, so the clients decode exactly these dicts from the float32
+            # start_game payload and every simulation starts out the same
+            self.simulation = LockstepSimulation(self.world, self.units.to_dicts(), self.pathfinder)
+            self.units = self.simulation.units
+            self.tick_commands = []
+            self.state_hashes.clear()
+
+        start_game = {'type': 'start_game', 'payload': self.get_game_state()}
+        if self.replay_dir:
+            os.makedirs(self.replay_dir, exist_ok=True)
+            path = os.path.join(self.replay_dir, time.strftime('%Y%m%d-%H%M%S') + f'-{world_seed}.replay')
+            self.replay = ReplayWriter(path, start_game, self.units)
+        self.broadcast_message(start_game)
+        self.spawn(self.game_loop())
+
+    async def game_loop(self):
         print("Server game loop is running.")
-        while self.running:
-            turn_start_time = time.time()
-            with self.lock:
-                self.process_commands()
-                self.update_game_state()
-                self.broadcast_message({'type': 'game_update', 'payload': self.game_state})
-
-            elapsed_time = time.time() - turn_start_time
-            sleep_time = turn_duration - elapsed_time
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+        try:
+            await self.scheduler.run()
+        except Exception as e:
+            # Without a game loop clients would wait forever for the next tick; close their connections instead
+            print(f"Server game loop stopped: {e!r}")
+            self.stop()
 
     def process_commands(self):
         for player_id, commands in self.client_commands.items():
             if commands:
                 for command in commands:
                     unit_id = command.get('unit_id')
-                    unit = self.game_state['units'].get(unit_id)
-                    if unit and unit['owner'] == player_id:
-                        if command['action'] == 'move' and unit['type'] != 'command_center':
-                            unit['target_pos'] = command['target']
+                    if unit_id in self.units and self.units.owner_of(unit_id) == player_id:
+                        if command['action'] == 'move' and self.units.type_of(unit_id) != 'command_center':
+                            # A newer order replaces one still waiting, and goes to the back of the queue
+                            self.path_requests.pop(unit_id, None)
+                            self.path_requests[unit_id] = command['target']
+        for pid in self.client_commands: self.client_commands[pid] = []
+
+    def plan_paths(self):
+        """
+        Turns queued move orders into water routes around islands, until this tick's pathfinding
+        budget is spent. Units keep their previous course until their turn comes.
+        """
+        self.tick_orders = []
+        deadline = time.perf_counter() + self.pathfinding_budget
+        while self.path_requests and time.perf_counter() < deadline:
+            unit_id = next(iter(self.path_requests))
+            target = self.path_requests.pop(unit_id)
+            if unit_id in self.units:
+                waypoints = route_unit(self.units, self.world, self.pathfinder, unit_id, target)
+                if waypoints:
+                    self.tick_orders.append((unit_id, waypoints))
+
+    def collect_commands(self):
+        """Takes this tick's commands from every player, in player order, for the lockstep simulation."""
+        self.tick_commands = [(player_id, command)
+                              for player_id in sorted(self.client_commands)
+                              for command in self.client_commands[player_id]]
         for pid in self.client_commands: self.client_commands[pid] = []
 
+    def step_simulation(self):
+        self.tick_orders = self.simulation.step(self.tick_commands)
+        tick = self.game_state['turn_number'] = self.simulation.tick
+        if tick % STATE_HASH_INTERVAL == 0:
+            self.state_hashes[tick] = self.simulation.state_hash()
+            while len(self.state_hashes) > SNAPSHOT_HISTORY:
+                self.state_hashes.popitem(last=False)
+
+    def broadcast_tick_commands(self):
+        """Sends every client the commands of the tick just simulated; their size doesn't depend on the unit count."""
+        payload = {'tick': self.game_state['turn_number'], 'commands': self.tick_commands}
+        self.broadcast_message({'type': 'tick_commands', 'payload': payload})
+
+    def check_state_hash(self, player_id, payload):
+        """Compares a client's lockstep state hash with the server's own for the same tick."""
+        expected = self.state_hashes.get(payload['tick'])
+        if expected is not None and expected != payload['hash']:
+            self.desyncs += 1
+            print(f"Desync: Player {player_id} disagrees with the server about the state after tick {payload['tick']}.")
+
+    def record_replay(self):
+        """Adds the tick just simulated to the replay of the game."""
+        if self.replay:
+            self.replay.record_tick(self.game_state['turn_number'], self.tick_orders, self.units)
+
     def update_game_state(self):
         self.game_state['turn_number'] += 1
-        for uid, unit in self.game_state['units'].items():
-            if unit['type'] == 'command_center': continue
-            current_pos = pygame.math.Vector2(unit['pos'])
-            target_pos = pygame.math.Vector2(unit['target_pos'])
-            if current_pos.distance_to(target_pos) < 1: continue
-            direction = (target_pos - current_pos).normalize()
-            speed = SHIP_STATS[unit['type']]['speed']
-            new_pos = current_pos + direction * speed
-            if not self.world.is_land(new_pos):
-                unit['pos'] = (new_pos.x, new_pos.y)
-            else:
-                unit['target_pos'] = unit['pos']
+        self.units.update_movement(self.world)
+
+    def get_game_state(self):
+        """The full game state with units as dicts, as sent to clients."""
+        return dict(self.game_state, units=self.units.to_dicts())
+
+    def broadcast_snapshot(self):
+        """
+        Sends each client a game_update holding only the unit fields that changed since the last
+        snapshot it acknowledged, or a keyframe with every unit on join, every KEYFRAME_INTERVAL
+        ticks, and when its acknowledged snapshot has left the history.
+        """
+        tick = self.game_state['turn_number']
+        units = self.units.to_dicts()
+        self.snapshots.add(tick, units)
+
+        messages = {}  # base tick: encoded message, shared by clients acknowledged up to the same tick
+        for conn in list(self.clients.keys()):
+            base_tick = self.client_acks.get(conn)
+            if tick % KEYFRAME_INTERVAL == 0 or self.snapshots.get(base_tick) is None:
+                base_tick = None
+
+            if base_tick not in messages:
+                base_units = self.snapshots.get(base_tick) if base_tick is not None else {}
+                changed, removed = diff_units(base_units, units)
+                payload = {
+                    'tick': tick, 'turn_number': tick, 'keyframe': base_tick is None, 'base_tick': base_tick,
+                    'units': changed, 'removed': removed
+                }
+                messages[base_tick] = encode_message({'type': 'game_update', 'payload': payload})
+            self.queue_message(conn, messages[base_tick], True)
 
     def broadcast_message(self, message_data):
+        """Encodes the message once and queues the same bytes for every client."""
+        data = encode_message(message_data)
+        is_snapshot = message_data['type'] in SNAPSHOT_MESSAGES
         for client_conn in list(self.clients.keys()):
-            self.send_message(client_conn, message_data)
+            self.queue_message(client_conn, data, is_snapshot)
 
     def send_message(self, conn, message_data):
-        try:
-            message = pickle.dumps(message_data)
-            header = f"{len(message):<{HEADER_LENGTH}}".encode('utf-8')
-            conn.sendall(header + message)
-        except socket.error:
-            pass
+        self.queue_message(conn, encode_message(message_data), message_data['type'] in SNAPSHOT_MESSAGES)
+
+    def queue_message(self, conn, data, is_snapshot):
+        """Hands encoded bytes to the connection's outbox. This never blocks the event loop."""
+        outbox = self.outboxes.get(conn)
+        if outbox is None or conn.is_closing():
+            return
+        if not outbox.put(data, is_snapshot):
+            print(f"Disconnecting Player {self.clients.get(conn)}: more than {outbox.high_water} messages behind.")
+            conn.close()
+
+    def dump_tick_stats(self, path=TICK_STATS_PATH):
+        """Writes the per-phase tick timings as JSON. Safe to call from any thread."""
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.scheduler.stats.write_json, path)
+
+    def profile_ticks(self, ticks, path='tick_profile.prof'):
+        """Captures a cProfile of the next `ticks` ticks. Safe to call from any thread."""
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.scheduler.request_profile, ticks, path)
 
     def stop(self):
+        """Stops the server. Safe to call from any thread."""
+        if self.loop and self.stopped and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
         self.running = False
-        for client in self.clients: client.close()
-        self.server_socket.close()
         print("Server stopped.")
 
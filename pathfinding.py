@@ -0,0 +1,357 @@
+import heapq
+import math
+from settings import *
+
+DIAGONAL_COST = math.sqrt(2)
+TILE_SEARCH_CACHE_SIZE = 1024  # Searches from start and goal tiles kept for reuse by later queries
+# (dx, dy, cost) of the eight moves between tiles
+MOVES = [(1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+         (1, 1, DIAGONAL_COST), (1, -1, DIAGONAL_COST), (-1, 1, DIAGONAL_COST), (-1, -1, DIAGONAL_COST)]
+
+
+def octile_distance(a, b):
+    dx, dy = abs(a[0] - b[0]), abs(a[1] - b[1])
+    return max(dx, dy) + (DIAGONAL_COST - 1) * min(dx, dy)
+
+
+def tile_center(tile):
+    return ((tile[0] + 0.5) * TILE_SIZE, (tile[1] + 0.5) * TILE_SIZE)
+
+
+def route_unit(units, world, pathfinder, unit_id, target):
+    """
+    Sends a unit of a UnitStore towards target along a water route around islands. Targets on land,
+    or in water the unit can't reach, are ignored. Without a pathfinder, or when no route is found,
+    the unit sails straight for the target. Returns the waypoints the unit was sent along, or None.
+    """
+    components = world.components
+    if components is None:
+        if world.is_land(target):
+            return None
+        waypoints = [target]
+    else:
+        start = units.position_of(unit_id)
+        target_body = components.water_body_at(target)
+        start_body = components.water_body_at(start)
+        if not target_body or (start_body and start_body != target_body):
+            return None
+        waypoints = (pathfinder.find_path(start, target) if pathfinder else None) or [target]
+    units.set_path(unit_id, waypoints)
+    return waypoints
+
+
+class PathFinder:
+    """
+    Hierarchical (HPA*) pathfinding for ships over the water tiles of a World.
+
+    The map is split into clusters of cluster_size tiles. Wherever water crosses the border of two
+    clusters there is an entrance, and the entrances of a cluster are linked by the length of the
+    shortest path between them inside it. A query runs A* over that small graph of entrances and
+    refines each hop into tiles, then straightens the route into as few waypoints as line of sight
+    allows. Routes are cached by (start cluster, goal cluster) and dropped when the terrain of a
+    cluster they cross changes.
+    """
+
+    def __init__(self, world, cluster_size=PATH_CLUSTER_SIZE):
+        self.world = world
+        self.cluster_size = cluster_size
+        self.clusters_x = -(-WORLD_TILES_X // cluster_size)
+        self.clusters_y = -(-WORLD_TILES_Y // cluster_size)
+        # Plain nested lists of booleans are much faster to index one tile at a time than the array itself
+        self.walkable = (world.terrain_data < WATER_LEVEL).tolist()
+        self.borders = {}  # (cluster, cluster to its right or below): [(tile, tile across the border), ...]
+        self.transitions = {}  # entrance tile: set of entrance tiles across a border
+        self.cluster_graphs = {}  # cluster: {entrance: ({other entrance: cost}, predecessors)}, built on first use
+        self.routes = {}  # (start cluster, goal cluster): (first entrance, last entrance, waypoint tiles between)
+        self.cluster_routes = {}  # cluster: keys of the cached routes that cross it
+        self.tile_searches = {}  # tile: (distances, predecessors) of a search of its cluster from it
+
+        for cy in range(self.clusters_y):
+            for cx in range(self.clusters_x):
+                if cx + 1 < self.clusters_x:
+                    self.build_border((cx, cy), (cx + 1, cy))
+                if cy + 1 < self.clusters_y:
+                    self.build_border((cx, cy), (cx, cy + 1))
+        world.terrain_listeners.append(self.on_terrain_changed)
+
+    def cluster_of(self, tile):
+        return tile[0] // self.cluster_size, tile[1] // self.cluster_size
+
+    def cluster_bounds(self, cluster):
+        x0, y0 = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+        return x0, y0, min(x0 + self.cluster_size, WORLD_TILES_X), min(y0 + self.cluster_size, WORLD_TILES_Y)
+
+    def build_border(self, a, b):
+        """(Re)builds the transitions across the border between cluster a and cluster b, right of or below it."""
+        for tile, other in self.borders.pop((a, b), []):
+            self.transitions[tile].discard(other)
+            self.transitions[other].discard(tile)
+
+        x0, y0, x1, y1 = self.cluster_bounds(a)
+        if b[0] != a[0]:  # Vertical border: pair the last column of a with the first column of b
+            pairs = [((x1 - 1, y), (x1, y)) for y in range(y0, y1)]
+        else:
+            pairs = [((x, y1 - 1), (x, y1)) for x in range(x0, x1)]
+
+        walkable = self.walkable
+        open_pairs = [walkable[t[1]][t[0]] and walkable[o[1]][o[0]] for t, o in pairs]
+        transitions = []
+        start = None
+        for i, is_open in enumerate(open_pairs + [False]):
+            if is_open and start is None:
+                start = i
+            elif not is_open and start is not None:
+                if i - start >= PATH_ENTRANCE_SPLIT:
+                    transitions += [pairs[start], pairs[i - 1]]
+                else:
+                    transitions.append(pairs[(start + i - 1) // 2])
+                start = None
+
+        for tile, other in transitions:
+            self.transitions.setdefault(tile, set()).add(other)
+            self.transitions.setdefault(other, set()).add(tile)
+        self.borders[(a, b)] = transitions
+
+    def entrances(self, cluster):
+        cx, cy = cluster
+        tiles = set()
+        for a, b in [(cluster, (cx + 1, cy)), (cluster, (cx, cy + 1)), ((cx - 1, cy), cluster), ((cx, cy - 1), cluster)]:
+            for tile, other in self.borders.get((a, b), []):
+                tiles.add(tile if a == cluster else other)
+        return tiles
+
+    def local_search(self, start, bounds, goal=None):
+        """
+        Searches the water tiles within bounds from start: the whole area with Dijkstra, or just
+        until goal with A*. Returns (distances, predecessors). start itself may be land.
+        """
+        x0, y0, x1, y1 = bounds
+        walkable = self.walkable
+        dist = {start: 0.0}
+        prev = {start: None}
+        heap = [(0.0, 0.0, start)]
+        while heap:
+            _, d, node = heapq.heappop(heap)
+            if node == goal:
+                break
+            if d > dist[node]:
+                continue
+            x, y = node
+            for dx, dy, cost in MOVES:
+                nx, ny = x + dx, y + dy
+                if not (x0 <= nx < x1 and y0 <= ny < y1) or not walkable[ny][nx]:
+                    continue
+                # Diagonal moves may not cut the corner of a land tile
+                if dx and dy and not (walkable[y][nx] and walkable[ny][x]):
+                    continue
+                nd = d + cost
+                neighbour = (nx, ny)
+                if nd < dist.get(neighbour, math.inf):
+                    dist[neighbour] = nd
+                    prev[neighbour] = node
+                    priority = nd + octile_distance(neighbour, goal) if goal else nd
+                    heapq.heappush(heap, (priority, nd, neighbour))
+        return dist, prev
+
+    def search_cluster_from(self, tile):
+        """local_search() of the tile's cluster from tile, remembered because ships share start and goal tiles."""
+        search = self.tile_searches.get(tile)
+        if search is None:
+            if len(self.tile_searches) >= TILE_SEARCH_CACHE_SIZE:
+                self.tile_searches.clear()
+            search = self.tile_searches[tile] = self.local_search(tile, self.cluster_bounds(self.cluster_of(tile)))
+        return search
+
+    def cluster_graph(self, cluster):
+        graph = self.cluster_graphs.get(cluster)
+        if graph is None:
+            bounds = self.cluster_bounds(cluster)
+            entrances = self.entrances(cluster)
+            graph = {}
+            for entrance in entrances:
+                dist, prev = self.local_search(entrance, bounds)
+                edges = {other: dist[other] for other in entrances if other != entrance and other in dist}
+                graph[entrance] = (edges, prev)
+            self.cluster_graphs[cluster] = graph
+        return graph
+
+    @staticmethod
+    def trace(prev, tile):
+        """The tiles from the search's start to tile, following predecessors."""
+        tiles = []
+        while tile is not None:
+            tiles.append(tile)
+            tile = prev[tile]
+        tiles.reverse()
+        return tiles
+
+    def line_of_sight(self, a, b):
+        """True if the straight line between the centres of tiles a and b only crosses water, a itself excepted."""
+        walkable = self.walkable
+        x, y = a
+        dx, dy = abs(b[0] - x), abs(b[1] - y)
+        sx, sy = (1 if b[0] > x else -1), (1 if b[1] > y else -1)
+        error = dx - dy
+        dx, dy = 2 * dx, 2 * dy
+        steps = (dx + dy) // 2
+        while steps > 0:
+            if error > 0:
+                x += sx
+                error -= dy
+            elif error < 0:
+                y += sy
+                error += dx
+            else:  # The line passes exactly through a corner, which is only open if both sides are
+                if not (walkable[y][x + sx] and walkable[y + sy][x]):
+                    return False
+                x += sx
+                y += sy
+                error += dx - dy
+                steps -= 1
+            if not walkable[y][x]:
+                return False
+            steps -= 1
+        return True
+
+    def smooth(self, tiles):
+        """Drops the waypoints of a tile path that the ship can sail past in a straight line."""
+        if len(tiles) <= 2:
+            return list(tiles)
+        # Only tiles where the path turns can be waypoints, since the path is straight in between
+        corners = [tiles[0]]
+        for i in range(1, len(tiles) - 1):
+            if (tiles[i][0] - tiles[i - 1][0], tiles[i][1] - tiles[i - 1][1]) != \
+                    (tiles[i + 1][0] - tiles[i][0], tiles[i + 1][1] - tiles[i][1]):
+                corners.append(tiles[i])
+        corners.append(tiles[-1])
+
+        waypoints = [corners[0]]
+        for i in range(2, len(corners)):
+            if not self.line_of_sight(waypoints[-1], corners[i]):
+                waypoints.append(corners[i - 1])
+        waypoints.append(corners[-1])
+        return waypoints
+
+    def abstract_search(self, start, goal, start_edges, goal_edges):
+        """A* over the entrance graph from start to goal. Returns the list of nodes, or None."""
+        best = {start: 0.0}
+        came_from = {start: None}
+        heap = [(octile_distance(start, goal), 0.0, start)]
+        while heap:
+            _, d, node = heapq.heappop(heap)
+            if node == goal:
+                return self.trace(came_from, goal)
+            if d > best[node]:
+                continue
+            if node == start:
+                edges = list(start_edges.items())
+            else:
+                edges = list(self.cluster_graph(self.cluster_of(node))[node][0].items())
+            edges += [(other, 1.0) for other in self.transitions.get(node, ())]
+            if node in goal_edges:
+                edges.append((goal, goal_edges[node]))
+            for neighbour, cost in edges:
+                nd = d + cost
+                if nd < best.get(neighbour, math.inf):
+                    best[neighbour] = nd
+                    came_from[neighbour] = node
+                    heapq.heappush(heap, (nd + octile_distance(neighbour, goal), nd, neighbour))
+        return None
+
+    def refine(self, nodes):
+        """Expands a list of entrances into tiles: hops within a cluster follow its graph, the rest cross a border."""
+        tiles = [nodes[0]]
+        for a, b in zip(nodes, nodes[1:]):
+            if self.cluster_of(a) == self.cluster_of(b):
+                tiles += self.trace(self.cluster_graph(self.cluster_of(a))[a][1], b)[1:]
+            else:
+                tiles.append(b)
+        return tiles
+
+    def cache_route(self, key, nodes):
+        tiles = self.refine(nodes)
+        self.routes[key] = (nodes[0], nodes[-1], self.smooth(tiles))
+        for cluster in {self.cluster_of(tile) for tile in tiles}:
+            self.cluster_routes.setdefault(cluster, set()).add(key)
+
+    def find_path(self, start_pos, goal_pos):
+        """
+        Returns the waypoints (pixel positions) of a water route from start_pos to goal_pos, ending
+        at goal_pos itself, or None if the goal is on land or can't be reached.
+        """
+        start = (int(start_pos[0] // TILE_SIZE), int(start_pos[1] // TILE_SIZE))
+        goal = (int(goal_pos[0] // TILE_SIZE), int(goal_pos[1] // TILE_SIZE))
+        if not (0 <= start[0] < WORLD_TILES_X and 0 <= start[1] < WORLD_TILES_Y and
+                0 <= goal[0] < WORLD_TILES_X and 0 <= goal[1] < WORLD_TILES_Y) or not self.walkable[goal[1]][goal[0]]:
+            return None
+
+        # A ship on water can only reach its own body of water; skip the search that would prove it
+        if self.walkable[start[1]][start[0]] and not self.world.components.connected_by_water(start_pos, goal_pos):
+            return None
+
+        start_cluster, goal_cluster = self.cluster_of(start), self.cluster_of(goal)
+        if start_cluster == goal_cluster:
+            dist, prev = self.local_search(start, self.cluster_bounds(start_cluster), goal)
+            if goal in dist:
+                return self.to_waypoints(self.smooth(self.trace(prev, goal)), goal_pos)
+
+        start_dist, start_prev = self.search_cluster_from(start)
+        goal_dist, goal_prev = self.search_cluster_from(goal)
+        start_edges = {e: start_dist[e] for e in self.entrances(start_cluster) if e in start_dist and e != start}
+        goal_edges = {e: goal_dist[e] for e in self.entrances(goal_cluster) if e in goal_dist and e != goal}
+
+        key = (start_cluster, goal_cluster)
+        route = self.routes.get(key)
+        if route is None or route[0] not in start_dist or route[1] not in goal_dist:
+            nodes = self.abstract_search(start, goal, start_edges, goal_edges)
+            if nodes is None:
+                return None
+            # The cached part runs from an entrance of the start cluster to one of the goal cluster.
+            # Start and goal are kept in it when they are entrances that the route leaves or enters by directly.
+            first = 1 if self.cluster_of(nodes[1]) == start_cluster else 0
+            last = len(nodes) - 1 if self.cluster_of(nodes[-2]) == goal_cluster else len(nodes)
+            self.cache_route(key, nodes[first:last])
+            route = self.routes[key]
+
+        first, last, middle = route
+        head = self.smooth(self.trace(start_prev, first))
+        tail = self.smooth(self.trace(goal_prev, last)[::-1])
+        return self.to_waypoints(head[:-1] + middle + tail[1:], goal_pos)
+
+    @staticmethod
+    def to_waypoints(tiles, goal_pos):
+        # Line of sight was checked from the centre of the start tile, so the ship heads there first
+        waypoints = [tile_center(tile) for tile in tiles]
+        waypoints.append((float(goal_pos[0]), float(goal_pos[1])))
+        return waypoints
+
+    def build_graphs(self):
+        """Builds the graph of every cluster up front, so that no query has to pay for it within a tick."""
+        for cy in range(self.clusters_y):
+            for cx in range(self.clusters_x):
+                self.cluster_graph((cx, cy))
+
+    def on_terrain_changed(self, tile_rect):
+        """Updates the graph for tiles whose height changed and drops the routes that crossed them."""
+        x, y, w, h = tile_rect
+        rows = (self.world.terrain_data[y:y + h, x:x + w] < WATER_LEVEL).tolist()
+        for row, values in zip(range(y, y + h), rows):
+            self.walkable[row][x:x + w] = values
+
+        cx0, cy0 = self.cluster_of((x, y))
+        cx1, cy1 = self.cluster_of((x + w - 1, y + h - 1))
+        changed = {(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)}
+        for cx, cy in changed:
+            for a, b in [((cx, cy), (cx + 1, cy)), ((cx, cy), (cx, cy + 1)), ((cx - 1, cy), (cx, cy)), ((cx, cy - 1), (cx, cy))]:
+                if (a, b) in self.borders:
+                    self.build_border(a, b)
+
+        # Neighbours lose or gain entrances along the rebuilt borders too
+        for cx, cy in list(changed):
+            changed.update([(cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)])
+        for tile in [tile for tile in self.tile_searches if self.cluster_of(tile) in changed]:
+            del self.tile_searches[tile]
+        for cluster in changed:
+            self.cluster_graphs.pop(cluster, None)
+            for key in self.cluster_routes.pop(cluster, ()):
+                self.routes.pop(key, None)
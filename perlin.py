@@ -1,6 +1,8 @@
 import math
 import random
 
+import numpy as np
+
 class PerlinNoise:
     """
     A standalone Perlin Noise generator.
@@ -13,6 +15,20 @@ class PerlinNoise:
         random.seed(seed)
         random.shuffle(self.p)
         self.p += self.p
+        self._p_array = np.array(self.p, dtype=np.int64)
+
+    @classmethod
+    def from_permutation(cls, permutation, octaves=1):
+        """
+        A generator with the given doubled permutation table, as in the p attribute of another
+        instance. Unlike seeding, this doesn't touch the random module, so worker processes can
+        rebuild the exact generator of their parent.
+        """
+        noise = cls.__new__(cls)
+        noise.octaves = octaves
+        noise.p = list(permutation)
+        noise._p_array = np.array(noise.p, dtype=np.int64)
+        return noise
 
     def _fade(self, t):
         return t * t * t * (t * (t * 6 - 15) + 10)
@@ -77,3 +93,68 @@ class PerlinNoise:
             ),
             w,
         )
+
+    def noise_grid(self, xs, ys, z=0.0):
+        """
+        Evaluates the noise over the grid spanned by the 1D coordinate arrays xs and ys.
+        Returns an array of shape (len(ys), len(xs)) that matches noise() bit for bit.
+        """
+        x = np.asarray(xs, dtype=np.float64).reshape(1, -1)
+        y = np.asarray(ys, dtype=np.float64).reshape(-1, 1)
+        total = np.zeros((y.shape[0], x.shape[1]))
+        frequency = 1.0
+        amplitude = 1.0
+        max_amplitude = 0.0
+
+        for _ in range(self.octaves):
+            total += self._noise_grid(x * frequency, y * frequency, z * frequency) * amplitude
+            max_amplitude += amplitude
+            amplitude *= 0.5  # persistence
+            frequency *= 2.0  # lacunarity
+
+        return total / max_amplitude if max_amplitude > 0 else total
+
+    def _grad_grid(self, hash_val, x, y, z):
+        h = hash_val & 15
+        u = np.where(h < 8, x, y)
+        v = np.where(h < 4, y, np.where((h == 12) | (h == 14), x, z))
+        return np.where((h & 1) == 0, u, -u) + np.where((h & 2) == 0, v, -v)
+
+    def _noise_grid(self, x, y, z):
+        """Array version of _noise(); x is a row vector, y a column vector and z a scalar."""
+        x_floor = np.floor(x)
+        y_floor = np.floor(y)
+        z_floor = math.floor(z)
+        X = x_floor.astype(np.int64) & 255
+        Y = y_floor.astype(np.int64) & 255
+        Z = int(z_floor) & 255
+
+        x = x - x_floor
+        y = y - y_floor
+        z = z - z_floor
+
+        u = self._fade(x)
+        v = self._fade(y)
+        w = self._fade(z)
+
+        p = self._p_array
+        A = p[X] + Y
+        AA = p[A] + Z
+        AB = p[A + 1] + Z
+        B = p[X + 1] + Y
+        BA = p[B] + Z
+        BB = p[B + 1] + Z
+
+        return self._lerp(
+            self._lerp(
+                self._lerp(self._grad_grid(p[AA], x, y, z), self._grad_grid(p[BA], x - 1, y, z), u),
+                self._lerp(self._grad_grid(p[AB], x, y - 1, z), self._grad_grid(p[BB], x - 1, y - 1, z), u),
+                v,
+            ),
+            self._lerp(
+                self._lerp(self._grad_grid(p[AA + 1], x, y, z - 1), self._grad_grid(p[BA + 1], x - 1, y, z - 1), u),
+                self._lerp(self._grad_grid(p[AB + 1], x, y - 1, z - 1), self._grad_grid(p[BB + 1], x - 1, y - 1, z - 1), u),
+                v,
+            ),
+            w,
+        )
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+from settings import *
+from assets import assets
+
+# Segments are tested against the terrain at points at most this many pixels apart
+TERRAIN_SAMPLE_STEP = 2.0
+TERRAIN = -1  # Stands for the terrain where hits record the index of the target they hit
+
+
+def segment_rect_entry(start, end, rect):
+    """
+    Liang-Barsky clipping of n segments against one rect, as arrays: returns for each segment the
+    fraction of the way from start to end at which it enters the rect, or inf if it misses.
+    """
+    delta = end - start
+    t_enter = np.zeros(len(start))
+    t_exit = np.ones(len(start))
+    for axis, low, high in ((0, rect.left, rect.right), (1, rect.top, rect.bottom)):
+        d = delta[:, axis]
+        s = start[:, axis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (low - s) / d
+            t1 = (high - s) / d
+        parallel = d == 0
+        # A segment parallel to the slab is either always inside it or never
+        outside = parallel & ((s < low) | (s >= high))
+        t0, t1 = np.where(parallel, -np.inf, np.minimum(t0, t1)), np.where(parallel, np.inf, np.maximum(t0, t1))
+        t_enter = np.maximum(t_enter, t0)
+        t_exit = np.minimum(t_exit, t1)
+        t_exit[outside] = -np.inf
+    return np.where(t_enter <= t_exit, t_enter, np.inf)
+
+
+class Projectiles:
+    """
+    Every shell in flight, kept as a struct of arrays like UnitStore: gravity is integrated for all of
+    them in one step, and each step's path is swept against the targets and the terrain, so that no
+    shell can pass through either between two frames. All shells are drawn with one shared image.
+    """
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), dtype=np.float64)
+        self.vel = np.zeros((capacity, 2), dtype=np.float64)
+        self.age = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.age))
+        for name in ('pos', 'vel', 'age'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def fire(self, pos, velocity):
+        if self.count == len(self.age):
+            self._grow(self.count + 1)
+        self.pos[self.count] = pos
+        self.vel[self.count] = velocity
+        self.age[self.count] = 0
+        self.count += 1
+
+    def fire_many(self, positions, velocities):
+        """Fires a barrage: one shell per row of the (n, 2) position and velocity arrays."""
+        n = len(positions)
+        if self.count + n > len(self.age):
+            self._grow(self.count + n)
+        self.pos[self.count:self.count + n] = positions
+        self.vel[self.count:self.count + n] = velocities
+        self.age[self.count:self.count + n] = 0
+        self.count += n
+
+    def clear(self):
+        self.count = 0
+
+    def _keep(self, keep):
+        kept = int(keep.sum())
+        for array in (self.pos, self.vel, self.age):
+            array[:kept] = array[:self.count][keep]
+        self.count = kept
+
+    def terrain_entry(self, start, end, world):
+        """For each segment, the fraction of the way at which it first samples land, or inf if it doesn't."""
+        length = np.hypot(*(end - start).T)
+        steps = max(1, math.ceil(float(length.max()) / TERRAIN_SAMPLE_STEP))
+        fractions = np.arange(1, steps + 1) / steps
+        points = start[:, np.newaxis, :] + (end - start)[:, np.newaxis, :] * fractions[np.newaxis, :, np.newaxis]
+        land = world.is_land_batch(points.reshape(-1, 2)).reshape(len(start), steps)
+        first = np.argmax(land, axis=1)
+        return np.where(land[np.arange(len(start)), first], fractions[first], np.inf)
+
+    def update(self, dt, world, bounds, targets=(), crater_radius=DESTRUCTION_RADIUS):
+        """
+        Moves every shell one step. Shells that hit a target rect or the terrain on the way are removed,
+        and craters of crater_radius are dug where they hit the terrain; shells that leave bounds or grow
+        too old are dropped. Returns a list of (index of the target hit, position of the hit).
+        """
+        n = self.count
+        if not n:
+            return []
+        start = self.pos[:n].copy()
+        self.vel[:n, 1] += PROJECTILE_GRAVITY * dt
+        self.pos[:n] += self.vel[:n] * dt
+        self.age[:n] += dt
+        end = self.pos[:n]
+
+        # The earliest of all hits along each shell's path this step counts
+        first_hit = np.full(n, np.inf) if world is None else self.terrain_entry(start, end, world)
+        hit_by = np.full(n, TERRAIN)
+        for index, rect in enumerate(targets):
+            entry = segment_rect_entry(start, end, rect)
+            closer = entry < first_hit
+            first_hit[closer] = entry[closer]
+            hit_by[closer] = index
+
+        hit = np.isfinite(first_hit)
+        hit_pos = start + (end - start) * np.where(hit, first_hit, 0)[:, np.newaxis]
+        hits = []
+        for row in np.flatnonzero(hit).tolist():
+            if hit_by[row] == TERRAIN:
+                world.deform_terrain(tuple(hit_pos[row].tolist()), crater_radius)
+            else:
+                hits.append((int(hit_by[row]), tuple(hit_pos[row].tolist())))
+
+        x, y = end[:, 0], end[:, 1]
+        inside = (x >= bounds.left) & (x < bounds.right) & (y >= bounds.top) & (y < bounds.bottom)
+        self._keep(~hit & inside & (self.age[:n] <= PROJECTILE_LIFETIME))
+        return hits
+
+    def draw(self, screen, offset=(0, 0)):
+        """Blits the shared shell image centred on every shell."""
+        image = assets.get_image('projectile')
+        half_w, half_h = image.get_width() // 2, image.get_height() // 2
+        corners = (self.pos[:self.count] - (half_w - offset[0], half_h - offset[1])).astype(np.int64).tolist()
+        screen.blits([(image, corner) for corner in corners], doreturn=False)
@@ -0,0 +1,335 @@
+import asyncio
+import struct
+
+# Versioned binary wire protocol. Every message is a fixed header followed by a payload whose
+# layout depends on the message type; units and commands are encoded as fixed-layout records.
+PROTOCOL_VERSION = 4
+
+HEADER = struct.Struct('!BBI')  # protocol version, message type id, payload length
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024  # Larger lengths are rejected rather than allocated
+
+MESSAGE_TYPES = {
+    'welcome': 1,
+    'lobby_update': 2,
+    'start_game_request': 3,
+    'start_game': 4,
+    'game_update': 5,
+    'client_commands': 6,
+    'ack': 7,
+    'tick_commands': 8,
+    'state_hash': 9,
+}
+MESSAGE_NAMES = {type_id: name for name, type_id in MESSAGE_TYPES.items()}
+
+UNIT_TYPES = ['command_center', 'cruiser', 'scout']
+UNIT_TYPE_IDS = {name: i for i, name in enumerate(UNIT_TYPES)}
+ACTIONS = ['move']
+ACTION_IDS = {name: i for i, name in enumerate(ACTIONS)}
+
+# Units travel in blocks of records that carry the same fields. A block starts with the bit mask
+# of those fields and its record count; a record is the unit id followed by the fields, in this order.
+UNIT_FIELDS = [
+    ('type', 'B'),
+    ('owner', 'B'),
+    ('pos', 'ff'),
+    ('hp', 'i'),
+    ('target_pos', 'ff'),
+]
+ALL_FIELDS = (1 << len(UNIT_FIELDS)) - 1
+POS_ONLY = 1 << 2
+UNIT_BLOCK = struct.Struct('!BI')
+
+COMMAND = struct.Struct('!IBff')  # unit id, action id, target x, target y
+COUNT = struct.Struct('!I')
+WELCOME = struct.Struct('!B')
+PLAYER = struct.Struct('!BHB')  # player id, port, length of the address string that follows
+START_GAME = struct.Struct('!IIBBIIf')  # world seed, turn number, streamed world and lockstep flags, world width and height in pixels, seconds per tick
+GAME_UPDATE = struct.Struct('!IiB')  # tick, base tick (-1 for keyframes), keyframe flag
+ACK = struct.Struct('!I')
+TICK_COMMANDS = struct.Struct('!II')  # tick, number of the player commands that follow
+PLAYER_COMMAND = struct.Struct('!BIBff')  # player id, then a COMMAND
+STATE_HASH = struct.Struct('!II')  # tick, hash of the lockstep state after it
+
+
+class ProtocolError(ValueError):
+    """Raised for messages that do not follow the wire protocol."""
+
+
+_record_layouts = {}  # mask: (Struct of one record, [(field name, index in record, width)])
+_key_masks = {}  # tuple of a unit dict's keys: field mask
+
+
+def _record_layout(mask):
+    layout = _record_layouts.get(mask)
+    if layout is None:
+        fmt = '!I'
+        fields = []
+        for bit, (name, field_fmt) in enumerate(UNIT_FIELDS):
+            if mask & (1 << bit):
+                fields.append((name, len(fmt) - 1, len(field_fmt)))
+                fmt += field_fmt
+        layout = _record_layouts[mask] = (struct.Struct(fmt), fields)
+    return layout
+
+
+def _field_mask(fields):
+    mask = 0
+    for bit, (name, _) in enumerate(UNIT_FIELDS):
+        if name in fields:
+            mask |= 1 << bit
+    return mask
+
+
+def _pack_record(record, unit_id, mask, unit):
+    # Full records and position-only deltas are by far the most common, so they skip the generic path
+    if mask == ALL_FIELDS:
+        return record.pack(unit_id, UNIT_TYPE_IDS[unit['type']], unit['owner'], *unit['pos'],
+                           unit['hp'], *unit['target_pos'])
+    if mask == POS_ONLY:
+        return record.pack(unit_id, *unit['pos'])
+    values = [unit_id]
+    for bit, (name, _) in enumerate(UNIT_FIELDS):
+        if mask & (1 << bit):
+            if name == 'type':
+                values.append(UNIT_TYPE_IDS[unit[name]])
+            elif name in ('pos', 'target_pos'):
+                values.extend(unit[name])
+            else:
+                values.append(unit[name])
+    return record.pack(*values)
+
+
+def _encode_units(units):
+    blocks = {}  # mask: [(unit_id, fields), ...]
+    for item in units.items():
+        # Units of one snapshot share their key order, so the mask is looked up rather than rebuilt
+        keys = tuple(item[1])
+        mask = _key_masks.get(keys)
+        if mask is None:
+            mask = _key_masks[keys] = _field_mask(item[1])
+        block = blocks.get(mask)
+        if block is None:
+            block = blocks[mask] = []
+        block.append(item)
+
+    parts = [COUNT.pack(len(blocks))]
+    for mask, items in blocks.items():
+        record = _record_layout(mask)[0]
+        parts.append(UNIT_BLOCK.pack(mask, len(items)))
+        for unit_id, fields in items:
+            parts.append(_pack_record(record, unit_id, mask, fields))
+    return b''.join(parts)
+
+
+def _decode_units(data, offset):
+    (block_count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    units = {}
+    for _ in range(block_count):
+        mask, count = UNIT_BLOCK.unpack_from(data, offset)
+        offset += UNIT_BLOCK.size
+        record, fields = _record_layout(mask)
+        end = offset + count * record.size
+        if end > len(data):
+            raise ProtocolError("Unit block runs past the end of the message")
+        records = record.iter_unpack(data[offset:end])
+        offset = end
+
+        if mask == ALL_FIELDS:
+            for r in records:
+                units[r[0]] = {'id': r[0], 'type': UNIT_TYPES[r[1]], 'owner': r[2], 'pos': (r[3], r[4]),
+                               'hp': r[5], 'target_pos': (r[6], r[7])}
+        elif mask == POS_ONLY:
+            for r in records:
+                units[r[0]] = {'pos': (r[1], r[2])}
+        else:
+            for r in records:
+                unit = {}
+                for name, index, width in fields:
+                    if name == 'type':
+                        unit[name] = UNIT_TYPES[r[index]]
+                    elif width == 2:
+                        unit[name] = (r[index], r[index + 1])
+                    else:
+                        unit[name] = r[index]
+                units[r[0]] = unit
+    return units, offset
+
+
+def _encode_ids(ids):
+    return COUNT.pack(len(ids)) + struct.pack(f'!{len(ids)}I', *ids)
+
+
+def _decode_ids(data, offset):
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    ids = list(struct.unpack_from(f'!{count}I', data, offset))
+    return ids, offset + 4 * count
+
+
+def encode_payload(message_type, payload):
+    if message_type == 'welcome':
+        return WELCOME.pack(payload['id'])
+    if message_type == 'lobby_update':
+        parts = [COUNT.pack(len(payload['players']))]
+        for player in payload['players']:
+            host, port = player['addr'][:2]
+            host = host.encode('utf-8')
+            parts.append(PLAYER.pack(player['id'], port, len(host)) + host)
+        return b''.join(parts)
+    if message_type == 'start_game_request':
+        return b''
+    if message_type == 'start_game':
+        header = START_GAME.pack(payload['world_seed'], payload['turn_number'], payload['world_streamed'],
+                                 payload['lockstep'], *payload['world_size'], payload['tick_interval'])
+        return header + _encode_units(payload['units'])
+    if message_type == 'game_update':
+        base_tick = -1 if payload['base_tick'] is None else payload['base_tick']
+        return (GAME_UPDATE.pack(payload['tick'], base_tick, payload['keyframe']) +
+                _encode_units(payload['units']) + _encode_ids(payload['removed']))
+    if message_type == 'client_commands':
+        parts = [COUNT.pack(len(payload))]
+        for command in payload:
+            parts.append(COMMAND.pack(command['unit_id'], ACTION_IDS[command['action']], *command['target']))
+        return b''.join(parts)
+    if message_type == 'ack':
+        return ACK.pack(payload['tick'])
+    if message_type == 'tick_commands':
+        parts = [TICK_COMMANDS.pack(payload['tick'], len(payload['commands']))]
+        for player_id, command in payload['commands']:
+            parts.append(PLAYER_COMMAND.pack(player_id, command['unit_id'], ACTION_IDS[command['action']], *command['target']))
+        return b''.join(parts)
+    if message_type == 'state_hash':
+        return STATE_HASH.pack(payload['tick'], payload['hash'])
+    raise ProtocolError(f"Unknown message type: {message_type}")
+
+
+def decode_payload(message_type, data):
+    if message_type == 'welcome':
+        return {'id': WELCOME.unpack_from(data)[0]}
+    if message_type == 'lobby_update':
+        (count,) = COUNT.unpack_from(data)
+        offset = COUNT.size
+        players = []
+        for _ in range(count):
+            player_id, port, host_length = PLAYER.unpack_from(data, offset)
+            offset += PLAYER.size
+            host = bytes(data[offset:offset + host_length]).decode('utf-8')
+            offset += host_length
+            players.append({'id': player_id, 'addr': (host, port)})
+        return {'players': players}
+    if message_type == 'start_game_request':
+        return None
+    if message_type == 'start_game':
+        world_seed, turn_number, world_streamed, lockstep, width, height, tick_interval = START_GAME.unpack_from(data)
+        units, _ = _decode_units(data, START_GAME.size)
+        return {
+            'world_seed': world_seed, 'units': units, 'turn_number': turn_number,
+            'world_streamed': bool(world_streamed), 'lockstep': bool(lockstep), 'world_size': (width, height),
+            'tick_interval': tick_interval
+        }
+    if message_type == 'game_update':
+        tick, base_tick, keyframe = GAME_UPDATE.unpack_from(data)
+        units, offset = _decode_units(data, GAME_UPDATE.size)
+        removed, _ = _decode_ids(data, offset)
+        return {
+            'tick': tick, 'turn_number': tick, 'keyframe': bool(keyframe),
+            'base_tick': None if base_tick < 0 else base_tick, 'units': units, 'removed': removed
+        }
+    if message_type == 'client_commands':
+        (count,) = COUNT.unpack_from(data)
+        commands = []
+        for i in range(count):
+            unit_id, action, x, y = COMMAND.unpack_from(data, COUNT.size + i * COMMAND.size)
+            commands.append({'action': ACTIONS[action], 'unit_id': unit_id, 'target': (x, y)})
+        return commands
+    if message_type == 'ack':
+        return {'tick': ACK.unpack_from(data)[0]}
+    if message_type == 'tick_commands':
+        tick, count = TICK_COMMANDS.unpack_from(data)
+        commands = []
+        for i in range(count):
+            player_id, unit_id, action, x, y = PLAYER_COMMAND.unpack_from(data, TICK_COMMANDS.size + i * PLAYER_COMMAND.size)
+            commands.append((player_id, {'action': ACTIONS[action], 'unit_id': unit_id, 'target': (x, y)}))
+        return {'tick': tick, 'commands': commands}
+    if message_type == 'state_hash':
+        tick, state_hash = STATE_HASH.unpack_from(data)
+        return {'tick': tick, 'hash': state_hash}
+    raise ProtocolError(f"Unknown message type: {message_type}")
+
+
+def encode_message(message_data):
+    """Encodes a {'type': ..., 'payload': ...} message into header and payload bytes."""
+    message_type = message_data['type']
+    if message_type not in MESSAGE_TYPES:
+        raise ProtocolError(f"Unknown message type: {message_type}")
+    try:
+        payload = encode_payload(message_type, message_data.get('payload'))
+    except (struct.error, KeyError, IndexError, TypeError) as e:
+        raise ProtocolError(f"Cannot encode {message_type}: {e}") from e
+    return HEADER.pack(PROTOCOL_VERSION, MESSAGE_TYPES[message_type], len(payload)) + payload
+
+
+def decode_message(message_type_id, data):
+    """Decodes a payload received with the given message type id back into a message dict."""
+    message_type = MESSAGE_NAMES.get(message_type_id)
+    if message_type is None:
+        raise ProtocolError(f"Unknown message type id: {message_type_id}")
+    try:
+        payload = decode_payload(message_type, data)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"Malformed {message_type} message: {e}") from e
+    return {'type': message_type, 'payload': payload}
+
+
+async def read_message_async(reader):
+    """Reads and decodes one message from an asyncio StreamReader, or returns None if the stream ended."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+        version, message_type_id, length = HEADER.unpack(header)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"Unsupported protocol version {version}")
+        if length > MAX_PAYLOAD_SIZE:
+            raise ProtocolError(f"Message of {length} bytes exceeds the maximum size")
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    return decode_message(message_type_id, payload)
+
+
+class MessageReader:
+    """
+    Reads framed messages from a socket into one reusable buffer with recv_into, so receiving
+    doesn't allocate or copy per chunk. A decoded message never references the buffer.
+    """
+
+    def __init__(self, sock, initial_size=64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(initial_size)
+        self.view = memoryview(self.buffer)
+
+    def _read_exactly(self, size):
+        """Fills the start of the buffer with exactly size bytes. Returns False if the connection closed."""
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+            self.view = memoryview(self.buffer)
+        received = 0
+        while received < size:
+            n = self.sock.recv_into(self.view[received:size], size - received)
+            if n == 0:
+                return False
+            received += n
+        return True
+
+    def read_message(self):
+        """Blocks until a full message arrives and returns it decoded, or None if the connection closed."""
+        if not self._read_exactly(HEADER.size):
+            return None
+        version, message_type_id, length = HEADER.unpack_from(self.buffer)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"Unsupported protocol version {version}")
+        if length > MAX_PAYLOAD_SIZE:
+            raise ProtocolError(f"Message of {length} bytes exceeds the maximum size")
+        if not self._read_exactly(length):
+            return None
+        return decode_message(message_type_id, self.view[:length])
@@ -0,0 +1,282 @@
+import mmap
+import struct
+import zlib
+import numpy as np
+from settings import *
+from unit_store import UnitStore, UNIT_SPEEDS
+from lockstep import FixedPointUnitStore
+from protocol import HEADER, decode_message, encode_message
+
+# A replay file is a header, the encoded start_game message, then one record per tick that had new
+# orders and one per keyframe, in tick order, and finally an index of all records and a footer that
+# points at it. Everything is little-endian. Orders hold the waypoints each routed unit was sent
+# along, so replaying them needs no pathfinder and can't depend on the state of its route caches.
+# Waypoints are float32, which is exact: targets arrive as float32 and the rest are tile centres.
+REPLAY_MAGIC = b'NAUTREPL'
+REPLAY_VERSION = 1
+
+FILE_HEADER = struct.Struct('<8sHBBIIII')  # magic, version, lockstep flag, fixed point shift, world seed, world width and height, start_game length
+RECORD = struct.Struct('<BII')  # record kind, tick, body length
+ORDER = struct.Struct('<IH')  # unit id, number of the (x, y) float32 waypoints that follow
+KEYFRAME = struct.Struct('<II')  # unit count, number of units with waypoints left
+UNIT_WAYPOINTS = struct.Struct('<IH')  # unit id, number of the stored waypoints that follow
+FOOTER = struct.Struct('<QI8s')  # offset of the index, last tick recorded, magic
+INDEX_ENTRY = np.dtype([('kind', 'u1'), ('tick', '<u4'), ('offset', '<u8')])
+
+ORDERS, KEYFRAME_RECORD = 1, 2
+
+# The arrays of a UnitStore saved in keyframes, with their on-disk dtypes. Coordinates are stored in
+# the store's own representation, so keyframes are exact; speeds follow from the types. Keyframes
+# are zlib-compressed, as the many units sharing types, owners and hp make them very repetitive.
+KEYFRAME_ARRAYS = [('ids', '<u4'), ('types', 'u1'), ('owners', '<i4'), ('hp', '<i4')]
+COORDINATE_ARRAYS = ['pos', 'target_pos']
+
+
+class ReplayError(ValueError):
+    """Raised for files that are not replays this version can read."""
+
+
+def _coordinate_dtype(store_class):
+    return '<i8' if store_class.COORDINATE_DTYPE == np.int64 else '<f8'
+
+
+def pack_units(units):
+    """The exact state of a UnitStore as the body of a keyframe record."""
+    n = units.count
+    coordinates = _coordinate_dtype(type(units))
+    parts = [KEYFRAME.pack(n, len(units.waypoints))]
+    parts += [getattr(units, name)[:n].astype(dtype).tobytes() for name, dtype in KEYFRAME_ARRAYS]
+    parts += [getattr(units, name)[:n].astype(coordinates).tobytes() for name in COORDINATE_ARRAYS]
+    for unit_id in sorted(units.waypoints):
+        waypoints = units.waypoints[unit_id]
+        parts.append(UNIT_WAYPOINTS.pack(unit_id, len(waypoints)))
+        parts.append(np.array(waypoints, dtype=coordinates).reshape(-1, 2).tobytes())
+    return zlib.compress(b''.join(parts))
+
+
+def unpack_units(body, store_class):
+    """Rebuilds a store_class instance from the body of a keyframe record."""
+    data = zlib.decompress(body)
+    offset = 0
+    n, waypoint_count = KEYFRAME.unpack_from(data, offset)
+    offset += KEYFRAME.size
+    coordinates = _coordinate_dtype(store_class)
+    units = store_class(capacity=max(n, 1))
+
+    def take(dtype, count):
+        nonlocal offset
+        values = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    for name, dtype in KEYFRAME_ARRAYS:
+        getattr(units, name)[:n] = take(dtype, n)
+    units.speeds[:n] = units.from_pixels(UNIT_SPEEDS[units.types[:n]])
+    units.pos[:n] = take(coordinates, 2 * n).reshape(n, 2)
+    units.target_pos[:n] = take(coordinates, 2 * n).reshape(n, 2)
+    units.count = n
+    units.rows = {unit_id: row for row, unit_id in enumerate(units.ids[:n].tolist())}
+    for _ in range(waypoint_count):
+        unit_id, length = UNIT_WAYPOINTS.unpack_from(data, offset)
+        offset += UNIT_WAYPOINTS.size
+        units.waypoints[unit_id] = list(take(coordinates, 2 * length).reshape(length, 2).copy())
+    return units
+
+
+def pack_orders(orders):
+    parts = []
+    for unit_id, waypoints in orders:
+        parts.append(ORDER.pack(unit_id, len(waypoints)))
+        parts.append(np.array(waypoints, dtype='<f4').tobytes())
+    return b''.join(parts)
+
+
+def unpack_orders(data, offset, end):
+    """The (unit_id, waypoints) orders of one orders record body."""
+    orders = []
+    while offset < end:
+        unit_id, length = ORDER.unpack_from(data, offset)
+        offset += ORDER.size
+        waypoints = np.frombuffer(data, dtype='<f4', count=2 * length, offset=offset).reshape(length, 2)
+        offset += waypoints.nbytes
+        orders.append((unit_id, [tuple(point) for point in waypoints.tolist()]))
+    return orders
+
+
+class ReplayWriter:
+    """
+    Records a game as it is played: the server passes it each tick's routed orders, and every
+    keyframe_interval ticks it also saves the complete unit state, so that a player can start from
+    the nearest keyframe instead of the beginning. close() writes the index.
+    """
+
+    def __init__(self, path, start_game, units, keyframe_interval=REPLAY_KEYFRAME_INTERVAL):
+        """start_game is the start_game message sent to clients; units the store the game starts from."""
+        payload = start_game['payload']
+        message = encode_message(start_game)
+        width, height = payload['world_size']
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.index = []
+        self.last_tick = payload['turn_number']
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, payload['lockstep'], FIXED_POINT_SHIFT,
+                                         payload['world_seed'], width, height, len(message)))
+        self.file.write(message)
+        self.write_record(KEYFRAME_RECORD, payload['turn_number'], pack_units(units))
+
+    def write_record(self, kind, tick, body):
+        self.index.append((kind, tick, self.file.tell()))
+        self.file.write(RECORD.pack(kind, tick, len(body)))
+        self.file.write(body)
+
+    def record_tick(self, tick, orders, units):
+        """Records the orders routed in tick, and a keyframe of the units after it when one is due."""
+        self.last_tick = tick
+        if orders:
+            self.write_record(ORDERS, tick, pack_orders(orders))
+        if tick % self.keyframe_interval == 0:
+            self.write_record(KEYFRAME_RECORD, tick, pack_units(units))
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_ENTRY).tobytes())
+        self.file.write(FOOTER.pack(index_offset, self.last_tick, REPLAY_MAGIC))
+        self.file.close()
+        print(f"Replay written to {self.path}.")
+
+
+class ReplayPlayer:
+    """
+    Plays a replay file back from a memory map. seek() jumps to any tick by loading the nearest
+    keyframe before it and simulating forward, so only the records in between are ever read.
+    Files whose recording was cut short have no index; it is then rebuilt with one pass over the records.
+    """
+
+    def __init__(self, path, world=None):
+        """world must be the world of the recorded game; by default it is generated again from its seed."""
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < FILE_HEADER.size:
+            raise ReplayError(f"{path} is too short to be a replay")
+        (magic, version, lockstep, shift, self.world_seed,
+         width, height, message_length) = FILE_HEADER.unpack_from(self.data, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ReplayError(f"{path} is not a version {REPLAY_VERSION} replay")
+        if lockstep and shift != FIXED_POINT_SHIFT:
+            raise ReplayError(f"{path} was recorded with FIXED_POINT_SHIFT = {shift}")
+        self.lockstep = bool(lockstep)
+        self.world_size = (width, height)
+        self.store_class = FixedPointUnitStore if lockstep else UnitStore
+
+        start = FILE_HEADER.size
+        _, message_type, length = HEADER.unpack_from(self.data, start)
+        self.start_game = decode_message(message_type, self.data[start + HEADER.size:start + HEADER.size + length])
+        self.records_offset = start + message_length
+
+        self.index, self.last_tick = self.read_index()
+        keyframes = self.index[self.index['kind'] == KEYFRAME_RECORD]
+        orders = self.index[self.index['kind'] == ORDERS]
+        self.keyframe_ticks, self.keyframe_offsets = keyframes['tick'], keyframes['offset']
+        self.order_ticks, self.order_offsets = orders['tick'], orders['offset']
+        self.first_tick = int(self.index['tick'][0])
+
+        self.world = world
+        self.units = None
+        self.tick = None
+
+    def read_index(self):
+        """The index entries and the last tick recorded."""
+        data = self.data
+        if len(data) >= self.records_offset + FOOTER.size:
+            index_offset, last_tick, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+            if magic == REPLAY_MAGIC and self.records_offset <= index_offset <= len(data) - FOOTER.size:
+                count = (len(data) - FOOTER.size - index_offset) // INDEX_ENTRY.itemsize
+                return np.frombuffer(data, dtype=INDEX_ENTRY, count=count, offset=index_offset), last_tick
+        print(f"{self.path} has no index, probably because its recording was interrupted; scanning it.")
+        entries = []
+        offset = self.records_offset
+        while offset + RECORD.size <= len(data):
+            kind, tick, length = RECORD.unpack_from(data, offset)
+            if kind not in (ORDERS, KEYFRAME_RECORD) or offset + RECORD.size + length > len(data):
+                break  # The torn last record
+            entries.append((kind, tick, offset))
+            offset += RECORD.size + length
+        if not entries:
+            raise ReplayError(f"{self.path} holds no records")
+        return np.array(entries, dtype=INDEX_ENTRY), entries[-1][1]
+
+    def load_world(self):
+        if self.world is None:
+            from world import create_world
+            self.world = create_world(self.world_seed, self.start_game['payload']['world_streamed'],
+                                      self.world_size, headless=True)
+        return self.world
+
+    def seek(self, tick):
+        """Sets units to the state after tick, which is clamped to the recorded ticks, and returns them."""
+        tick = min(max(tick, self.first_tick), self.last_tick)
+        if self.tick is None or not (self.tick <= tick and self.nearest_keyframe(tick) <= self.tick):
+            # Unless simulating on from the current tick is shorter, restart from the nearest keyframe
+            row = np.searchsorted(self.keyframe_ticks, tick, side='right') - 1
+            offset = int(self.keyframe_offsets[row])
+            _, _, length = RECORD.unpack_from(self.data, offset)
+            self.units = unpack_units(self.data[offset + RECORD.size:offset + RECORD.size + length], self.store_class)
+            self.tick = int(self.keyframe_ticks[row])
+        while self.tick < tick:
+            self.step()
+        return self.units
+
+    def nearest_keyframe(self, tick):
+        return int(self.keyframe_ticks[np.searchsorted(self.keyframe_ticks, tick, side='right') - 1])
+
+    def orders_at(self, tick):
+        """The orders routed in tick, as (unit_id, waypoints)."""
+        row = np.searchsorted(self.order_ticks, tick)
+        if row == len(self.order_ticks) or self.order_ticks[row] != tick:
+            return []
+        offset = int(self.order_offsets[row])
+        _, _, length = RECORD.unpack_from(self.data, offset)
+        return unpack_orders(self.data, offset + RECORD.size, offset + RECORD.size + length)
+
+    def step(self):
+        """Simulates one tick forward from the current state."""
+        world = self.load_world()
+        self.tick += 1
+        for unit_id, waypoints in self.orders_at(self.tick):
+            if unit_id in self.units:
+                self.units.set_path(unit_id, waypoints)
+        self.units.update_movement(world)
+
+    def close(self):
+        self.index = self.keyframe_ticks = self.keyframe_offsets = self.order_ticks = self.order_offsets = None
+        self.data.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarises a replay file, or the units at one of its ticks.")
+    parser.add_argument('path')
+    parser.add_argument('--tick', type=int, help="print every unit's state after this tick")
+    args = parser.parse_args()
+
+    replay = ReplayPlayer(args.path)
+    print(f"World seed {replay.world_seed}, {replay.world_size[0]}x{replay.world_size[1]} pixels"
+          f"{', lockstep' if replay.lockstep else ''}")
+    print(f"Ticks {replay.first_tick} to {replay.last_tick}: {len(replay.order_ticks)} with orders, "
+          f"{len(replay.keyframe_ticks)} keyframes")
+    if args.tick is not None:
+        units = replay.seek(args.tick)
+        print(f"Units after tick {replay.tick}:")
+        for unit in units.to_dicts().values():
+            print(f"  {unit['id']:>5} {unit['type']:<15} player {unit['owner']}  "
+                  f"pos ({unit['pos'][0]:.1f}, {unit['pos'][1]:.1f})  hp {unit['hp']}")
+    replay.close()
+
+
+if __name__ == '__main__':
+    main()
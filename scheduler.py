@@ -0,0 +1,164 @@
+import asyncio
+import collections
+import cProfile
+import json
+import time
+import traceback
+from settings import TICK_INTERVAL, MAX_CATCH_UP_TICKS, MAX_FAILED_TICKS, TICK_STATS_SIZE, TICK_HISTOGRAM_BUCKETS_MS
+
+
+class TickFailure(RuntimeError):
+    """Raised by TickScheduler.run() when phases keep raising, tick after tick."""
+
+
+class TickStats:
+    """Per-phase tick durations in ring buffers, summarised as percentiles and histograms on demand."""
+
+    def __init__(self, size=TICK_STATS_SIZE, buckets_ms=TICK_HISTOGRAM_BUCKETS_MS):
+        self.size = size
+        self.buckets_ms = list(buckets_ms)
+        self.samples = collections.OrderedDict()  # phase name: deque of durations in seconds
+        self.ticks = 0
+        self.overruns = 0  # Ticks that finished after the next one was due
+        self.skipped_ticks = 0  # Ticks dropped because the loop fell too far behind
+        self.errors = collections.Counter()  # phase name: exceptions it raised
+        self.last_profile = None  # Path of the last completed cProfile capture
+
+    def record(self, phase, duration):
+        series = self.samples.get(phase)
+        if series is None:
+            series = self.samples[phase] = collections.deque(maxlen=self.size)
+        series.append(duration)
+
+    def summarize(self, durations):
+        durations_ms = sorted(d * 1000.0 for d in durations)
+        if not durations_ms:
+            return {'samples': 0}
+
+        def percentile(p):
+            return durations_ms[min(len(durations_ms) - 1, int(p / 100.0 * len(durations_ms)))]
+
+        histogram = collections.OrderedDict()
+        lower = 0
+        for upper in self.buckets_ms:
+            histogram[f"<{upper}ms"] = sum(1 for d in durations_ms if lower <= d < upper)
+            lower = upper
+        histogram[f">={lower}ms"] = sum(1 for d in durations_ms if d >= lower)
+        return {
+            'samples': len(durations_ms),
+            'mean_ms': sum(durations_ms) / len(durations_ms),
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': durations_ms[-1],
+            'histogram': histogram,
+        }
+
+    def to_dict(self):
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped_ticks': self.skipped_ticks,
+            'errors': dict(self.errors),
+            'last_profile': self.last_profile,
+            'phases': {phase: self.summarize(list(series)) for phase, series in self.samples.items()},
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+        print(f"Tick stats written to {path}")
+
+
+class TickScheduler:
+    """
+    Runs a list of named phases at a fixed timestep on the asyncio loop.
+
+    Ticks are scheduled against absolute deadlines, so sleep inaccuracy doesn't accumulate into
+    drift. A late tick runs immediately to catch up; if the loop falls more than max_catch_up
+    ticks behind, the missed ticks are skipped instead of being run back to back.
+
+    An exception in a phase is logged and counted in the stats, and the tick goes on with the next
+    phase, so one bad tick doesn't end the game. After max_failed ticks in a row with a failure,
+    run() raises TickFailure instead of carrying on with a game that is broken.
+    """
+
+    def __init__(self, phases, interval=TICK_INTERVAL, max_catch_up=MAX_CATCH_UP_TICKS, max_failed=MAX_FAILED_TICKS):
+        self.phases = phases  # [(name, callable), ...]
+        self.interval = interval
+        self.max_catch_up = max_catch_up
+        self.max_failed = max_failed
+        self.failed_ticks = 0  # Consecutive ticks in which a phase raised
+        self.stats = TickStats()
+        self.running = False
+        self.profiler = None
+        self.profile_ticks_left = 0
+        self.profile_path = None
+
+    def request_profile(self, ticks, path='tick_profile.prof'):
+        """Captures a cProfile of the next `ticks` ticks and writes it to path."""
+        self.profile_ticks_left = ticks
+        self.profile_path = path
+
+    def run_tick(self):
+        """Runs every phase once; returns whether they all completed."""
+        if self.profile_ticks_left and self.profiler is None:
+            self.profiler = cProfile.Profile()
+        if self.profiler:
+            self.profiler.enable()
+
+        tick_start = time.perf_counter()
+        completed = True
+        for name, phase in self.phases:
+            phase_start = time.perf_counter()
+            try:
+                phase()
+            except Exception:
+                completed = False
+                self.stats.errors[name] += 1
+                print(f"Tick {self.stats.ticks}: phase {name} failed")
+                traceback.print_exc()
+            self.stats.record(name, time.perf_counter() - phase_start)
+        self.stats.record('total', time.perf_counter() - tick_start)
+        self.stats.ticks += 1
+
+        if self.profiler:
+            self.profiler.disable()
+            self.profile_ticks_left -= 1
+            if self.profile_ticks_left <= 0:
+                self.profiler.dump_stats(self.profile_path)
+                self.stats.last_profile = self.profile_path
+                print(f"Tick profile written to {self.profile_path}")
+                self.profiler = None
+        return completed
+
+    async def run(self):
+        self.running = True
+        next_tick = time.monotonic()
+        while self.running:
+            behind = time.monotonic() - next_tick
+            if behind >= self.interval * self.max_catch_up:
+                skipped = int(behind // self.interval)
+                self.stats.skipped_ticks += skipped
+                next_tick += skipped * self.interval
+            self.stats.record('lateness', max(0.0, behind))
+
+            if self.run_tick():
+                self.failed_ticks = 0
+            else:
+                self.failed_ticks += 1
+                if self.failed_ticks >= self.max_failed:
+                    raise TickFailure(f"{self.failed_ticks} ticks in a row failed")
+
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                self.stats.overruns += 1
+            # Always yield, even when catching up, so that network I/O keeps flowing
+            await asyncio.sleep(max(0.0, delay))
+
+    def stop(self):
+        self.running = False
@@ -1,15 +1,36 @@
 # Centralized file for all game constants and configuration.
+import os
 
 # Screen and Display
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 FPS = 60
 TITLE = "Nautical: LAN Edition"
+STARTUP_TIMELINE = False # Print how long each startup step took at the first frame (or run main.py --startup-timeline)
 
 # Networking
 SERVER_HOST = "0.0.0.0" # Host on all available network interfaces
 SERVER_PORT = 5555
 MAX_PLAYERS = 4
+KEYFRAME_INTERVAL = 10 # Every n-th game_update carries the full state of all units
+SNAPSHOT_HISTORY = 32 # Ticks of unit snapshots kept as delta bases
+TICK_INTERVAL = 1.0 # Seconds between server ticks
+INTERPOLATION_DELAY_TICKS = 1.2 # Clients render this many ticks behind the newest snapshot, so a late one still arrives in time
+MAX_EXTRAPOLATION_TICKS = 0.5 # How far clients carry units on past their newest snapshot when it is late
+SNAPSHOT_BUFFER_SIZE = 8 # Snapshots a client keeps for interpolation and for estimating the server clock
+MAX_CATCH_UP_TICKS = 5 # A server further behind than this skips ticks instead of catching up
+MAX_FAILED_TICKS = 20 # The server shuts down after this many ticks in a row in which a phase raised
+TICK_STATS_SIZE = 600 # Ticks of per-phase timings kept for the tick stats
+TICK_HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+TICK_STATS_PATH = "tick_stats.json"
+PATHFINDING_BUDGET = 0.25 # Seconds of each tick spent on queued move paths; the rest wait for the next tick
+LOCKSTEP = False # Send only commands each tick and let every peer run the simulation itself
+FIXED_POINT_SHIFT = 8 # Fractional bits of unit coordinates in the lockstep simulation
+STATE_HASH_INTERVAL = 10 # Every n-th lockstep tick, clients send the server a hash of their state
+REPLAY_DIR = None # Directory the server records a replay of every game to; None records none
+REPLAY_KEYFRAME_INTERVAL = 100 # Every n-th tick, replays save the complete unit state to seek from
+SEND_QUEUE_HIGH_WATER = 8 # Messages queued for one client before the laggard policy applies
+LAGGARD_POLICY = 'drop' # 'drop' discards queued snapshots and keeps the latest, 'disconnect' drops the client
 
 # Colors
 WHITE = (255, 255, 255)
@@ -36,6 +57,10 @@ BUTTON_CLICK_COLOR = (10, 40, 100)
 WORLD_WIDTH = 4000 # World dimension in pixels
 WORLD_HEIGHT = 4000
 TILE_SIZE = 10 # Visual size of a tile in pixels (for drawing)
+CHUNK_SIZE = 32 # Edge length of a terrain render chunk in tiles
+SPATIAL_CELL_SIZE = 256 # Edge length of a spatial index cell in pixels
+PATH_CLUSTER_SIZE = 16 # Edge length of a pathfinding cluster in tiles
+PATH_ENTRANCE_SPLIT = 6 # Entrances at least this wide get a transition at each end instead of one in the middle
 
 # Calculated world dimensions in tiles
 WORLD_TILES_X = WORLD_WIDTH // TILE_SIZE
@@ -49,12 +74,32 @@ PERLIN_LACUNARITY = 2.0
 WATER_LEVEL = 0.45 # Values below this are water
 ISLAND_MIN_HEIGHT = 0.6
 
+WORLD_GEN_WORKERS = None # Processes that generate large worlds in bands of rows; None uses one per core
+WORLD_GEN_PARALLEL_MIN_TILES = 250000 # Smaller worlds are generated in-process, where starting workers costs more than it saves
+
+# Streamed worlds are generated chunk by chunk as they are touched, so their size isn't bound by memory
+WORLD_STREAMING = False # Start games on a streamed world of STREAMED_WORLD_WIDTH x STREAMED_WORLD_HEIGHT
+STREAMED_WORLD_WIDTH = 400000 # World dimension in pixels
+STREAMED_WORLD_HEIGHT = 400000
+STREAMED_START_REGION = 400 # Edge length in tiles of the region at the centre searched for start islands
+TERRAIN_CACHE_BUDGET = 32 * 1024 * 1024 # Bytes of generated chunk heights and colours kept in memory
+CHUNK_SURFACE_CACHE_BUDGET = 96 * 1024 * 1024 # Bytes of rendered chunk surfaces kept in memory
+
+# World Cache
+# Bump WORLD_GENERATOR_VERSION whenever a change to generation would alter the map for a given seed,
+# or the arrays stored for a world change
+WORLD_GENERATOR_VERSION = 2
+WORLD_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".nautical", "world_cache")
+
 # Map Colors
 WATER_COLOR = (20, 60, 120)
 LAND_COLOR_LOW = (160, 140, 90)  # Sandy color for shores
 LAND_COLOR_HIGH = (80, 120, 50)   # Grassy color for inland#
 MOUTAIN_COLOR = (100, 100, 100)
 FOG_COLOR = (30, 30, 40) # Dark blue/grey for Fog of War
+LAND_GREEN = LAND_COLOR_HIGH # Ground of the combat arena
+OCEAN_BLUE = WATER_COLOR # Backdrop of the combat arena
+FOG_EXPLORED_ALPHA = 170 # Opacity of the fog over explored tiles that are out of radar range
 
 # Game Logic and Ship Statistics
 SHIP_STATS = {
@@ -77,6 +122,7 @@ SHIP_STATS = {
         'image_size': (30, 15)
     }
 }
+SHIP_ROTATION_STEPS = 32 # Ship images are turned to the nearest of this many headings
 
 # Combat Mechanics
 MIN_SHOT_POWER = 200
@@ -85,6 +131,8 @@ SHOT_CHARGE_RATE = 500  # Power per second
 PROJECTILE_SPEED_MULTIPLIER = 1.0 # Multiplies shot power to get initial speed
 PROJECTILE_GRAVITY = 200.0 # Pixels per second^2
 PROJECTILE_DAMAGE = 100
+PROJECTILE_LIFETIME = 10 # Seconds before a shell that hit nothing is dropped
 EXPLOSION_RADIUS = 50 # Visual radius of the explosion effect
 DESTRUCTION_RADIUS = 4 # Radius of terrain deformation in tiles
+COMBAT_CRATER_RADIUS = 24 # Radius in pixels of the crater a shell blasts into the combat terrain
 
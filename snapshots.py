@@ -0,0 +1,121 @@
+from collections import OrderedDict, deque
+from settings import TICK_INTERVAL, INTERPOLATION_DELAY_TICKS, MAX_EXTRAPOLATION_TICKS, SNAPSHOT_BUFFER_SIZE
+
+
+def diff_units(base_units, units):
+    """
+    Returns (changed, removed) between two unit snapshots: changed maps each new or modified
+    unit id to the fields that differ from the base, removed lists the ids that disappeared.
+    """
+    changed = {}
+    for unit_id, unit in units.items():
+        base = base_units.get(unit_id)
+        if base is None:
+            changed[unit_id] = dict(unit)
+        elif base != unit:
+            changed[unit_id] = {field: value for field, value in unit.items() if base.get(field) != value}
+    removed = [unit_id for unit_id in base_units if unit_id not in units]
+    return changed, removed
+
+
+def apply_delta(base_units, changed, removed):
+    """Builds the snapshot that diff_units(base_units, ...) was computed against. The base is not modified."""
+    units = dict(base_units)
+    for unit_id in removed:
+        units.pop(unit_id, None)
+    for unit_id, fields in changed.items():
+        unit = dict(units.get(unit_id, {}))
+        unit.update(fields)
+        units[unit_id] = unit
+    return units
+
+
+class SnapshotHistory:
+    """The most recent unit snapshots, by tick. Snapshots are treated as immutable once added."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.snapshots = OrderedDict()  # tick: {unit_id: unit_state}
+
+    def add(self, tick, units):
+        self.snapshots[tick] = units
+        while len(self.snapshots) > self.max_size:
+            self.snapshots.popitem(last=False)
+
+    def get(self, tick):
+        return self.snapshots.get(tick)
+
+    def discard_before(self, tick):
+        """Drops every snapshot older than tick."""
+        while self.snapshots and next(iter(self.snapshots)) < tick:
+            self.snapshots.popitem(last=False)
+
+    def clear(self):
+        self.snapshots.clear()
+
+
+class SnapshotBuffer:
+    """
+    Unit positions of the most recent snapshots a client received, for rendering slightly in the past.
+
+    The server clock is estimated from the arrival times: the offset between the local clock and a
+    snapshot's tick is smallest for the snapshot that was delayed least, so the smallest offset in the
+    buffer is used and jitter only ever makes snapshots early. Units are drawn `delay` ticks behind
+    that clock, interpolated between the two snapshots around the render tick, and carried on along
+    their last course for up to `max_extrapolation` ticks when the next snapshot is late.
+    """
+
+    def __init__(self, tick_interval=TICK_INTERVAL, delay=INTERPOLATION_DELAY_TICKS,
+                 max_extrapolation=MAX_EXTRAPOLATION_TICKS, size=SNAPSHOT_BUFFER_SIZE):
+        self.tick_interval = tick_interval
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        self.snapshots = deque(maxlen=size)  # (tick, {unit_id: (x, y)}), oldest first
+        self.clock_offsets = deque(maxlen=size)  # Local arrival time minus server time, per snapshot
+
+    def add(self, tick, units, removed, received_at, keyframe=False):
+        """
+        Adds the snapshot of a tick from its changed units and removed unit ids, received at the local
+        monotonic time received_at. A keyframe replaces the positions instead of updating them.
+        """
+        if self.snapshots and tick <= self.snapshots[-1][0]:
+            return  # Ticks only move forward; anything else is a duplicate
+        positions = {} if keyframe or not self.snapshots else dict(self.snapshots[-1][1])
+        for unit_id in removed:
+            positions.pop(unit_id, None)
+        for unit_id, unit in units.items():
+            if 'pos' in unit:
+                positions[unit_id] = tuple(unit['pos'])
+        self.snapshots.append((tick, positions))
+        self.clock_offsets.append(received_at - tick * self.tick_interval)
+
+    def render_tick(self, now):
+        """The (fractional) server tick to show at the local monotonic time now."""
+        return (now - min(self.clock_offsets)) / self.tick_interval - self.delay
+
+    def positions_at(self, now):
+        """Returns {unit_id: (x, y)} as seen at the local monotonic time now."""
+        if not self.snapshots:
+            return {}
+        tick = self.render_tick(now)
+        if len(self.snapshots) == 1 or tick <= self.snapshots[0][0]:
+            return dict(self.snapshots[0][1])
+
+        # The snapshots around the render tick, or the newest two when it is past the newest one
+        (tick0, older), (tick1, newer) = self.snapshots[-2], self.snapshots[-1]
+        for i in range(len(self.snapshots) - 1):
+            if self.snapshots[i + 1][0] >= tick:
+                (tick0, older), (tick1, newer) = self.snapshots[i], self.snapshots[i + 1]
+                break
+        tick = min(tick, self.snapshots[-1][0] + self.max_extrapolation)
+        alpha = (tick - tick0) / (tick1 - tick0)
+
+        positions = {}
+        for unit_id, (x1, y1) in newer.items():
+            x0, y0 = older.get(unit_id, (x1, y1))
+            positions[unit_id] = (x0 + (x1 - x0) * alpha, y0 + (y1 - y0) * alpha)
+        return positions
+
+    def clear(self):
+        self.snapshots.clear()
+        self.clock_offsets.clear()
@@ -0,0 +1,92 @@
+import math
+from settings import SPATIAL_CELL_SIZE
+
+
+class SpatialHash:
+    """
+    A uniform grid of sprites keyed by the cell that holds their centre.
+
+    Queries only visit the cells around the queried area, so their cost depends on how many
+    sprites are nearby rather than on the total number of sprites.
+    """
+
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (cell_x, cell_y): set of sprites
+        self.sprite_cells = {}  # sprite: (cell_x, cell_y)
+        self.max_half_extent = 0  # Largest distance from a sprite's centre to the edge of its rect
+
+    def cell_of(self, pos):
+        return int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+
+    def insert(self, sprite):
+        cell = self.cell_of(sprite.rect.center)
+        self.cells.setdefault(cell, set()).add(sprite)
+        self.sprite_cells[sprite] = cell
+        self.max_half_extent = max(self.max_half_extent, sprite.rect.width / 2, sprite.rect.height / 2)
+
+    def remove(self, sprite):
+        cell = self.sprite_cells.pop(sprite, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            bucket.discard(sprite)
+            if not bucket:
+                del self.cells[cell]
+
+    def move(self, sprite):
+        """
+        Moves the sprite to the cell of its current position, if that changed. Its rect may have
+        grown since it was inserted, as when a ship's image turns, so the largest extent is updated too.
+        """
+        rect = sprite.rect
+        half_extent = max(rect.width, rect.height) / 2
+        if half_extent > self.max_half_extent:
+            self.max_half_extent = half_extent
+        cell = self.cell_of(rect.center)
+        old_cell = self.sprite_cells.get(sprite)
+        if cell != old_cell:
+            if old_cell is not None:
+                self.remove(sprite)
+            self.cells.setdefault(cell, set()).add(sprite)
+            self.sprite_cells[sprite] = cell
+
+    def clear(self):
+        self.cells.clear()
+        self.sprite_cells.clear()
+        self.max_half_extent = 0
+
+    def _sprites_in_cells(self, left, top, right, bottom):
+        min_x, min_y = self.cell_of((left, top))
+        max_x, max_y = self.cell_of((right, bottom))
+        for cell_x in range(min_x, max_x + 1):
+            for cell_y in range(min_y, max_y + 1):
+                bucket = self.cells.get((cell_x, cell_y))
+                if bucket:
+                    yield from bucket
+
+    def query_radius(self, pos, radius):
+        """Yields the sprites whose position is within radius of pos."""
+        x, y = pos
+        radius_sq = radius * radius
+        # Cells are keyed by the integer rect centre, which can be up to a pixel away from pos
+        reach = radius + 1
+        for sprite in self._sprites_in_cells(x - reach, y - reach, x + reach, y + reach):
+            if (sprite.pos.x - x) ** 2 + (sprite.pos.y - y) ** 2 <= radius_sq:
+                yield sprite
+
+    def query_rect(self, rect):
+        """Yields the sprites whose rect overlaps the given rect."""
+        margin = math.ceil(self.max_half_extent)
+        candidates = self._sprites_in_cells(rect.left - margin, rect.top - margin,
+                                            rect.right + margin, rect.bottom + margin)
+        for sprite in candidates:
+            if sprite.rect.colliderect(rect):
+                yield sprite
+
+    def query_point(self, point):
+        """Yields the sprites whose rect contains the point."""
+        x, y = point
+        margin = math.ceil(self.max_half_extent)
+        for sprite in self._sprites_in_cells(x - margin, y - margin, x + margin, y + margin):
+            if sprite.rect.collidepoint(point):
+                yield sprite
@@ -0,0 +1,57 @@
+import contextlib
+import time
+
+# Imported first thing by main.py, so the timeline starts about when the game does
+STARTED_AT = time.perf_counter()
+
+
+class StartupTimeline:
+    """
+    Timestamps of the steps between launching the game and its first frame, such as imports and
+    view construction. Steps are always recorded, as that costs next to nothing; when enabled, the
+    timeline is printed at the first frame and later steps, like views built on demand, as they finish.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.steps = []  # (label, seconds since start, seconds the step took)
+        self.last = STARTED_AT
+        self.reported = False
+
+    def mark(self, label):
+        """Records a step that ran from the previous mark until now."""
+        now = time.perf_counter()
+        self.add(label, now, now - self.last)
+
+    @contextlib.contextmanager
+    def phase(self, label):
+        """Records the step run inside the with block."""
+        start = time.perf_counter()
+        yield
+        now = time.perf_counter()
+        self.add(label, now, now - start)
+
+    def add(self, label, now, duration):
+        step = (label, now - STARTED_AT, duration)
+        self.steps.append(step)
+        self.last = now
+        if self.enabled and self.reported:
+            self.print_step(*step)
+
+    @staticmethod
+    def print_step(label, at, duration):
+        print(f"[startup] {at * 1000:8.1f} ms {duration * 1000:+8.1f} ms  {label}")
+
+    def first_frame(self):
+        """Marks the first frame on screen and prints the timeline so far, if enabled."""
+        if self.reported:
+            return
+        self.mark("first frame")
+        self.reported = True
+        if self.enabled:
+            for step in self.steps:
+                self.print_step(*step)
+            print(f"[startup] Time to first frame: {self.steps[-1][1] * 1000:.1f} ms")
+
+
+startup_timeline = StartupTimeline()
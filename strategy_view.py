@@ -1,6 +1,10 @@
+import time
 import pygame
 from settings import *
-from world import World
+from world import create_world
+from fog import FogOfWar
+from spatial import SpatialHash
+from snapshots import SnapshotBuffer
 from entities import ArtilleryCruiser, ScoutShip, CommandCenter
 from ui import Button
 
@@ -34,41 +38,95 @@ class StrategyView:
         self.camera = None
         self.all_sprites = pygame.sprite.Group()
         self.sprite_map = {}  # Maps unit_id to sprite object for quick lookup
-        self.selected_unit = None
+        self.spatial_index = SpatialHash()  # Kept up to date by BaseUnit.update
+        self.snapshot_buffer = SnapshotBuffer()  # Positions by server tick, interpolated for drawing; rebuilt for each game
+        self.selected_units = []
+        self.drag_start = None  # World position where a left-button drag started
         self.pending_commands = []
         self.submit_turn_button = Button(SCREEN_WIDTH - 220, SCREEN_HEIGHT - 70, 200, 50, "Submit Turn", self.submit_turn)
-        self.fog_surface = None
+        self.fog = None
+        self.simulation = None  # LockstepSimulation, when the server runs in lockstep mode
+        self.pending_ticks = {}  # tick: (tick_commands, received_at) relayed ahead of the simulation
 
-    def initialize_from_gamestate(self, initial_state):
-        """Builds the game world and sprites from the server's initial state."""
+    def initialize_from_gamestate(self, initial_state, received_at):
+        """Builds the game world and sprites from the server's initial state, received at the monotonic time received_at."""
         print("Initializing strategy view from server state...")
-        self.world = World(seed=initial_state['world_seed'])
-        self.camera = Camera(WORLD_WIDTH, WORLD_HEIGHT)
+        self.world = create_world(initial_state['world_seed'], initial_state['world_streamed'], initial_state['world_size'])
+        self.camera = Camera(self.world.width, self.world.height)
         self.all_sprites.empty()
         self.sprite_map.clear()
+        self.spatial_index.clear()
+        self.selected_units = []
+        # Snapshots are timed by the server's own tick rate, which may not be this client's TICK_INTERVAL
+        self.snapshot_buffer = SnapshotBuffer(tick_interval=initial_state['tick_interval'])
+        self.snapshot_buffer.add(initial_state['turn_number'], initial_state['units'], [], received_at, keyframe=True)
 
-        self.fog_surface = pygame.Surface((WORLD_WIDTH, WORLD_HEIGHT))
-        self.fog_surface.fill(FOG_COLOR)
-        self.fog_surface.set_colorkey((255, 0, 255))  # Make a color transparent
+        self.fog = FogOfWar(self.world)
+        self.simulation = self.create_simulation(initial_state) if initial_state['lockstep'] else None
+        self.pending_ticks.clear()
 
         for unit_id, unit_data in initial_state['units'].items():
-            pos = unit_data['pos']
-            unit_type = unit_data['type']
-            player_owner = unit_data['owner']
-
-            sprite = None
-            if unit_type == 'cruiser':
-                sprite = ArtilleryCruiser(pos, player_owner, unit_id)
-            elif unit_type == 'scout':
-                sprite = ScoutShip(pos, player_owner, unit_id)
-            elif unit_type == 'command_center':
-                sprite = CommandCenter(pos, player_owner, unit_id)
-
-            if sprite:
-                self.all_sprites.add(sprite)
-                self.sprite_map[unit_id] = sprite
+            self.add_unit(unit_id, unit_data)
         print(f"Created {len(self.all_sprites)} sprites.")
 
+    def create_simulation(self, initial_state):
+        """The lockstep simulation of this client, with the same pathfinding graph the server builds."""
+        from lockstep import LockstepSimulation
+        from pathfinding import PathFinder
+
+        pathfinder = None
+        if self.world.components is not None:
+            pathfinder = PathFinder(self.world)
+            pathfinder.build_graphs()
+        return LockstepSimulation(self.world, initial_state['units'], pathfinder, initial_state['turn_number'])
+
+    def receive_tick_commands(self, tick_commands, received_at):
+        """Buffers the commands the server relayed for a tick, and runs every tick that is now next in line."""
+        tick = tick_commands['tick']
+        if tick <= self.simulation.tick:
+            print(f"Ignoring commands for lockstep tick {tick}: already simulated.")
+            return
+        self.pending_ticks[tick] = (tick_commands, received_at)
+        while self.simulation.tick + 1 in self.pending_ticks:
+            self.step_simulation(*self.pending_ticks.pop(self.simulation.tick + 1))
+
+    def step_simulation(self, tick_commands, received_at):
+        """Runs the next lockstep tick with the commands the server relayed, and reports the state hash when due."""
+        self.simulation.step(tick_commands['commands'])
+        tick = self.simulation.tick
+        self.snapshot_buffer.add(tick, self.simulation.units.to_dicts(), [], received_at, keyframe=True)
+        if tick % STATE_HASH_INTERVAL == 0:
+            state_hash = {'tick': tick, 'hash': self.simulation.state_hash()}
+            self.game_manager.network_client.send_message({'type': 'state_hash', 'payload': state_hash})
+
+    def add_unit(self, unit_id, unit_data):
+        """Creates the sprite for a unit from its server state."""
+        pos = unit_data['pos']
+        unit_type = unit_data['type']
+        player_owner = unit_data['owner']
+
+        sprite = None
+        if unit_type == 'cruiser':
+            sprite = ArtilleryCruiser(pos, player_owner, unit_id)
+        elif unit_type == 'scout':
+            sprite = ScoutShip(pos, player_owner, unit_id)
+        elif unit_type == 'command_center':
+            sprite = CommandCenter(pos, player_owner, unit_id)
+
+        if sprite:
+            self.all_sprites.add(sprite)
+            self.sprite_map[unit_id] = sprite
+            sprite.spatial_index = self.spatial_index
+            self.spatial_index.insert(sprite)
+
+    def remove_unit(self, unit_id):
+        sprite = self.sprite_map.pop(unit_id, None)
+        if sprite:
+            sprite.kill()
+            self.spatial_index.remove(sprite)
+            if sprite in self.selected_units:
+                self.selected_units.remove(sprite)
+
     def submit_turn(self):
         if self.pending_commands:
             print(f"Submitting {len(self.pending_commands)} commands to server...")
@@ -79,7 +137,7 @@ class StrategyView:
 
     def on_enter(self, data=None):
         if data and 'initial_state' in data:
-            self.initialize_from_gamestate(data['initial_state'])
+            self.initialize_from_gamestate(data['initial_state'], data['received_at'])
         elif data and 'combat_results' in data:
             print(f"Combat results received: {data['combat_results']}")
 
@@ -89,25 +147,51 @@ class StrategyView:
 
         if event.type == pygame.MOUSEBUTTONDOWN:
             world_pos = self.get_mouse_world_pos()
-            if event.button == 1:  # Left click
-                self.selected_unit = None
-                for sprite in self.all_sprites:
-                    sprite.selected = False
-                    if sprite.player_owner == self.game_manager.network_client.player_id:
-                        if sprite.rect.collidepoint(world_pos):
-                            self.selected_unit = sprite
-                            sprite.selected = True
+            if event.button == 1:  # Left click, selection happens on release
+                self.drag_start = world_pos
 
             if event.button == 3:  # Right click
-                if self.selected_unit and not self.world.is_land(pygame.math.Vector2(world_pos)):
-                    self.selected_unit.set_target(world_pos)
-                    self.pending_commands = [c for c in self.pending_commands if c['unit_id'] != self.selected_unit.unique_id]
-                    command = {
-                        'action': 'move',
-                        'unit_id': self.selected_unit.unique_id,
-                        'target': world_pos
-                    }
-                    self.pending_commands.append(command)
+                if self.selected_units and not self.world.is_land(pygame.math.Vector2(world_pos)):
+                    selected_ids = {unit.unique_id for unit in self.selected_units}
+                    self.pending_commands = [c for c in self.pending_commands if c['unit_id'] not in selected_ids]
+                    for unit in self.selected_units:
+                        unit.set_target(world_pos)
+                        command = {
+                            'action': 'move',
+                            'unit_id': unit.unique_id,
+                            'target': world_pos
+                        }
+                        self.pending_commands.append(command)
+
+        if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.drag_start:
+            self.select_units(self.get_selection_rect())
+            self.drag_start = None
+
+    def get_selection_rect(self):
+        """The dragged selection box in world coordinates, or None for a plain click."""
+        (x0, y0), (x1, y1) = self.drag_start, self.get_mouse_world_pos()
+        if abs(x1 - x0) < 5 and abs(y1 - y0) < 5:
+            return None
+        return pygame.Rect(min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0))
+
+    def select_units(self, selection_rect):
+        """Selects my units inside the box, or the one under the cursor if there is no box."""
+        my_player_id = self.game_manager.network_client.player_id
+        for unit in self.selected_units:
+            unit.selected = False
+
+        if selection_rect:
+            candidates = self.spatial_index.query_rect(selection_rect)
+            self.selected_units = [unit for unit in candidates if unit.player_owner == my_player_id]
+        else:
+            click_pos = pygame.math.Vector2(self.drag_start)
+            candidates = [unit for unit in self.spatial_index.query_point(self.drag_start)
+                          if unit.player_owner == my_player_id]
+            # Pick the unit closest to the click when several overlap
+            self.selected_units = sorted(candidates, key=lambda unit: unit.pos.distance_squared_to(click_pos))[:1]
+
+        for unit in self.selected_units:
+            unit.selected = True
 
     def update(self, dt):
         if not self.camera: return
@@ -115,12 +199,26 @@ class StrategyView:
         if client:
             for msg in client.get_messages():
                 if msg['type'] == 'game_update':
+                    # Only units that changed since the snapshot the delta is based on are included
                     game_state = msg['payload']
                     for unit_id, unit_data in game_state['units'].items():
                         if unit_id in self.sprite_map:
                             self.sprite_map[unit_id].update_from_state(unit_data)
+                        else:
+                            self.add_unit(unit_id, unit_data)
+                    for unit_id in game_state['removed']:
+                        self.remove_unit(unit_id)
+                    self.snapshot_buffer.add(game_state['tick'], game_state['units'], game_state['removed'],
+                                             msg['received_at'], keyframe=game_state['keyframe'])
+                elif msg['type'] == 'tick_commands' and self.simulation:
+                    self.receive_tick_commands(msg['payload'], msg['received_at'])
 
-        self.all_sprites.update(dt)  # Pass delta time for smooth movement
+        # Units are drawn where they were a little while ago, between the two snapshots around then
+        for unit_id, pos in self.snapshot_buffer.positions_at(time.monotonic()).items():
+            sprite = self.sprite_map.get(unit_id)
+            if sprite:
+                sprite.pos.update(pos)
+        self.all_sprites.update(dt)
 
         keys = pygame.key.get_pressed()
         cam_speed = 500 * dt
@@ -128,35 +226,33 @@ class StrategyView:
         if keys[pygame.K_RIGHT]: self.camera.camera.x -= cam_speed
         if keys[pygame.K_UP]: self.camera.camera.y += cam_speed
         if keys[pygame.K_DOWN]: self.camera.camera.y -= cam_speed
-        self.camera.camera.x = max(-(WORLD_WIDTH - SCREEN_WIDTH), min(0, self.camera.camera.x))
-        self.camera.camera.y = max(-(WORLD_HEIGHT - SCREEN_HEIGHT), min(0, self.camera.camera.y))
+        self.camera.camera.x = max(-(self.world.width - SCREEN_WIDTH), min(0, self.camera.camera.x))
+        self.camera.camera.y = max(-(self.world.height - SCREEN_HEIGHT), min(0, self.camera.camera.y))
 
     def draw(self, screen):
         if not self.world: return
-        screen.blit(self.world.map_surface, self.camera.camera.topleft)
+        self.world.draw_terrain(screen, self.camera.camera.topleft)
 
         my_player_id = self.game_manager.network_client.player_id
         my_units = [s for s in self.all_sprites if s.player_owner == my_player_id]
 
         visible_sprites = set(my_units)
-        for unit in self.all_sprites:
-            if unit.player_owner != my_player_id:
-                for my_unit in my_units:
-                    if unit.pos.distance_to(my_unit.pos) <= my_unit.radar_range:
-                        visible_sprites.add(unit)
-                        break
+        for my_unit in my_units:
+            visible_sprites.update(self.spatial_index.query_radius(my_unit.pos, my_unit.radar_range))
 
         for sprite in self.all_sprites:
             if sprite in visible_sprites:
                 screen.blit(sprite.image, self.camera.apply(sprite.rect))
                 sprite.draw_extras(screen, self.camera)
 
-        if self.fog_surface:
-            self.fog_surface.fill(FOG_COLOR)
-            self.fog_surface.blit(self.world.map_surface, (0, 0), special_flags=pygame.BLEND_RGBA_SUB)
-            for my_unit in my_units:
-                pygame.draw.circle(self.fog_surface, (255, 0, 255), my_unit.pos, my_unit.radar_range)
-            screen.blit(self.fog_surface, self.camera.camera.topleft)
+        if self.fog:
+            self.fog.update(my_units)
+            self.fog.draw(screen, self.camera.camera.topleft)
+
+        if self.drag_start:
+            selection_rect = self.get_selection_rect()
+            if selection_rect:
+                pygame.draw.rect(screen, WHITE, self.camera.apply(selection_rect), 1)
 
         self.submit_turn_button.draw(screen)
 
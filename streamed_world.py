@@ -0,0 +1,274 @@
+import collections
+import random
+import numpy as np
+try:
+    import pygame
+except ImportError:  # A headless dedicated server can run without pygame installed
+    pygame = None
+from perlin import PerlinNoise
+from settings import *
+from components import label_runs
+from world import generate_height_block, TERRAIN_PALETTE, TERRAIN_THRESHOLDS
+
+
+def chunk_parts(tile_rect):
+    """
+    Splits tile_rect (x, y, w, h) along chunk borders. Yields (chunk key, chunk slices, rect slices) for
+    every chunk it overlaps, where the slices index the overlapping tiles of the chunk and of the rect.
+    """
+    x, y, w, h = tile_rect
+    for chunk_y in range(y // CHUNK_SIZE, (y + h - 1) // CHUNK_SIZE + 1):
+        top = chunk_y * CHUNK_SIZE
+        y0, y1 = max(y, top), min(y + h, top + CHUNK_SIZE)
+        for chunk_x in range(x // CHUNK_SIZE, (x + w - 1) // CHUNK_SIZE + 1):
+            left = chunk_x * CHUNK_SIZE
+            x0, x1 = max(x, left), min(x + w, left + CHUNK_SIZE)
+            yield ((chunk_x, chunk_y),
+                   (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left)),
+                   (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)))
+
+
+class LRUCache:
+    """Holds values up to a budget of bytes, evicting the least recently used ones first."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = collections.OrderedDict()  # key: (value, size in bytes)
+        self.size = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        self.discard(key)
+        self.entries[key] = (value, size)
+        self.size += size
+        # The newest entry always stays, even if it alone is over budget
+        while self.size > self.budget and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class StreamedWorld:
+    """
+    A world far larger than fits in memory, generated one chunk at a time from the seed the first time
+    it is touched. Chunks live in an LRU cache with a memory budget and are regenerated after eviction.
+    Deformed chunks are kept in a sparse overlay that outlives the cache, so craters never disappear.
+    Islands are only searched in the start region, and there are no component labels to path over.
+    """
+
+    def __init__(self, seed, width=STREAMED_WORLD_WIDTH, height=STREAMED_WORLD_HEIGHT, headless=False):
+        self.seed = seed
+        self.headless = headless
+        self.width, self.height = width, height  # In pixels
+        self.tiles_x, self.tiles_y = width // TILE_SIZE, height // TILE_SIZE
+        self.chunks = LRUCache(TERRAIN_CACHE_BUDGET)  # (chunk_x, chunk_y): (heights, colors)
+        self.chunk_surfaces = LRUCache(CHUNK_SURFACE_CACHE_BUDGET)  # (chunk_x, chunk_y): Surface
+        self.deformed = {}  # (chunk_x, chunk_y): heights of a chunk with craters, the only copy of its terrain
+        self.chunks_generated = 0
+        self.terrain_listeners = []  # Called with the tile rect (x, y, w, h) that deform_terrain changed
+        self.components = None  # Labelling needs the whole map, which a streamed world never holds
+        self.perlin = PerlinNoise(octaves=4, seed=self.seed)
+        self.islands = self.find_islands()
+        self.valid_start_islands = self.find_valid_start_islands()
+
+    def chunk_rect(self, chunk_x, chunk_y):
+        """The tile rect of a chunk; chunks on the far edges of the world are cut short."""
+        x, y = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+        return x, y, min(CHUNK_SIZE, self.tiles_x - x), min(CHUNK_SIZE, self.tiles_y - y)
+
+    def get_chunk(self, chunk_x, chunk_y):
+        """Returns the (heights, colors) arrays of a chunk, generating it if it isn't cached."""
+        key = (chunk_x, chunk_y)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            heights = self.deformed.get(key)
+            if heights is None:
+                heights = generate_height_block(self.perlin.p, self.perlin.octaves, self.tiles_x, self.tiles_y,
+                                                self.chunk_rect(chunk_x, chunk_y))
+                self.chunks_generated += 1
+            chunk = heights, self.classify_terrain(heights)
+            self.chunks.put(key, chunk, chunk[0].nbytes + chunk[1].nbytes)
+        return chunk
+
+    def load_chunks(self, tile_rect):
+        """
+        Generates the chunks under tile_rect that aren't cached with one noise evaluation over their
+        bounding box, which is much faster than one per chunk and gives exactly the same heights.
+        """
+        x, y, w, h = tile_rect
+        missing = [(chunk_x, chunk_y)
+                   for chunk_y in range(y // CHUNK_SIZE, (y + h - 1) // CHUNK_SIZE + 1)
+                   for chunk_x in range(x // CHUNK_SIZE, (x + w - 1) // CHUNK_SIZE + 1)
+                   if (chunk_x, chunk_y) not in self.chunks and (chunk_x, chunk_y) not in self.deformed]
+        if len(missing) < 2:
+            return
+        left = min(key[0] for key in missing) * CHUNK_SIZE
+        top = min(key[1] for key in missing) * CHUNK_SIZE
+        right = min((max(key[0] for key in missing) + 1) * CHUNK_SIZE, self.tiles_x)
+        bottom = min((max(key[1] for key in missing) + 1) * CHUNK_SIZE, self.tiles_y)
+        block = generate_height_block(self.perlin.p, self.perlin.octaves, self.tiles_x, self.tiles_y,
+                                      (left, top, right - left, bottom - top))
+        for chunk_x, chunk_y in missing:
+            cx, cy, cw, ch = self.chunk_rect(chunk_x, chunk_y)
+            heights = block[cy - top:cy - top + ch, cx - left:cx - left + cw].copy()
+            colors = self.classify_terrain(heights)
+            self.chunks.put((chunk_x, chunk_y), (heights, colors), heights.nbytes + colors.nbytes)
+            self.chunks_generated += 1
+
+    def classify_terrain(self, heights):
+        """Maps an array of heights to an array of RGB colours in one pass, like World.classify_terrain()."""
+        return TERRAIN_PALETTE[np.digitize(heights, TERRAIN_THRESHOLDS)]
+
+    def heights_in(self, tile_rect):
+        """The heights of the tiles in tile_rect, which must lie inside the world, as one array indexed [y, x]."""
+        self.load_chunks(tile_rect)
+        heights = np.empty((tile_rect[3], tile_rect[2]), dtype=np.float32)
+        for (chunk_x, chunk_y), chunk_slices, rect_slices in chunk_parts(tile_rect):
+            heights[rect_slices] = self.get_chunk(chunk_x, chunk_y)[0][chunk_slices]
+        return heights
+
+    def colors_in(self, tile_rect):
+        """The RGB colours of the tiles in tile_rect, which must lie inside the world, indexed [y, x]."""
+        self.load_chunks(tile_rect)
+        colors = np.empty((tile_rect[3], tile_rect[2], 3), dtype=np.uint8)
+        for (chunk_x, chunk_y), chunk_slices, rect_slices in chunk_parts(tile_rect):
+            colors[rect_slices] = self.get_chunk(chunk_x, chunk_y)[1][chunk_slices]
+        return colors
+
+    def find_islands(self):
+        """Finds the centroids of the large islands in the start region at the centre of the world, in scan order."""
+        w, h = min(STREAMED_START_REGION, self.tiles_x), min(STREAMED_START_REGION, self.tiles_y)
+        x0, y0 = (self.tiles_x - w) // 2, (self.tiles_y - h) // 2
+        heights = self.heights_in((x0, y0, w, h))
+        labels, sizes, sum_x, sum_y, _ = label_runs(heights >= WATER_LEVEL)
+
+        # Same rules as World.find_islands(): ordered by their first high tile, at least 21 tiles
+        seeds = np.flatnonzero(heights > ISLAND_MIN_HEIGHT)
+        seed_labels, first = np.unique(labels.ravel()[seeds], return_index=True)
+        islands = []
+        for label in seed_labels[np.argsort(first)].tolist():
+            size = int(sizes[label])
+            if label and size > 20:
+                islands.append(((x0 + int(sum_x[label]) // size) * TILE_SIZE, (y0 + int(sum_y[label]) // size) * TILE_SIZE))
+        return islands
+
+    def find_valid_start_islands(self):
+        """Returns the large islands in a random order, for use as starting positions."""
+        islands = list(self.islands)
+        random.shuffle(islands)
+        return islands
+
+    def get_chunk_surface(self, chunk_x, chunk_y):
+        """Returns the rendered surface of a chunk, rendering it if it isn't cached."""
+        key = (chunk_x, chunk_y)
+        surf = self.chunk_surfaces.get(key)
+        if surf is None:
+            colors = self.get_chunk(chunk_x, chunk_y)[1]
+            h, w = colors.shape[:2]
+            tile_surf = pygame.Surface((w, h))
+            # surfarray is indexed [x, y], the chunk [y, x]
+            pygame.surfarray.blit_array(tile_surf, colors.transpose(1, 0, 2))
+            surf = pygame.transform.scale(tile_surf, (w * TILE_SIZE, h * TILE_SIZE))
+            self.chunk_surfaces.put(key, surf, surf.get_bytesize() * surf.get_width() * surf.get_height())
+        return surf
+
+    def draw_terrain(self, screen, offset):
+        """Blits the chunks visible on screen, where offset is the screen position of the world origin."""
+        chunk_px = CHUNK_SIZE * TILE_SIZE
+        view = pygame.Rect(-offset[0], -offset[1], *screen.get_size())
+        view = view.clip(pygame.Rect(0, 0, self.tiles_x * TILE_SIZE, self.tiles_y * TILE_SIZE))
+        if not view.width or not view.height:
+            return
+
+        self.load_chunks((view.left // TILE_SIZE, view.top // TILE_SIZE,
+                          (view.right - 1) // TILE_SIZE - view.left // TILE_SIZE + 1,
+                          (view.bottom - 1) // TILE_SIZE - view.top // TILE_SIZE + 1))
+        blits = []
+        for chunk_y in range(view.top // chunk_px, (view.bottom - 1) // chunk_px + 1):
+            for chunk_x in range(view.left // chunk_px, (view.right - 1) // chunk_px + 1):
+                dest = (chunk_x * chunk_px + offset[0], chunk_y * chunk_px + offset[1])
+                blits.append((self.get_chunk_surface(chunk_x, chunk_y), dest))
+        screen.blits(blits, doreturn=False)
+
+    def deform_terrain(self, world_pos, radius):
+        """
+        Digs a crater like World.deform_terrain() into the chunks it touches, which from then on live in
+        the overlay, drops their rendered surfaces and tells the terrain listeners which tiles changed.
+        """
+        x, y = world_pos
+        tile_x, tile_y = int(x // TILE_SIZE), int(y // TILE_SIZE)
+        tile_radius = int(radius // TILE_SIZE)
+
+        x0, x1 = max(0, tile_x - tile_radius), min(self.tiles_x, tile_x + tile_radius)
+        y0, y1 = max(0, tile_y - tile_radius), min(self.tiles_y, tile_y + tile_radius)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        xs = np.arange(x0, x1)
+        ys = np.arange(y0, y1)
+        dist_sq = (xs[np.newaxis, :] - tile_x) ** 2 + (ys[:, np.newaxis] - tile_y) ** 2
+        crater = np.where(dist_sq < tile_radius ** 2, (tile_radius ** 2 - dist_sq) * 2, 0)
+
+        tile_rect = (x0, y0, x1 - x0, y1 - y0)
+        for key, chunk_slices, rect_slices in chunk_parts(tile_rect):
+            heights, colors = self.get_chunk(*key)
+            region = heights[chunk_slices]
+            np.maximum(region - crater[rect_slices], 0, out=region)
+            colors[chunk_slices] = self.classify_terrain(region)
+            self.deformed[key] = heights
+            self.chunk_surfaces.discard(key)
+        for listener in self.terrain_listeners:
+            listener(tile_rect)
+
+    def get_height_at_pos(self, world_pos):
+        """Returns the height value at a given world pixel position (a Vector2 or an (x, y) pair)."""
+        x, y = world_pos
+        tile_x = int(x // TILE_SIZE)
+        tile_y = int(y // TILE_SIZE)
+        if 0 <= tile_x < self.tiles_x and 0 <= tile_y < self.tiles_y:
+            heights = self.get_chunk(tile_x // CHUNK_SIZE, tile_y // CHUNK_SIZE)[0]
+            return float(heights[tile_y % CHUNK_SIZE, tile_x % CHUNK_SIZE])
+        return 0
+
+    def is_land(self, world_pos):
+        """Checks if a given pixel position is on land."""
+        return self.get_height_at_pos(world_pos) >= WATER_LEVEL
+
+    def is_land_batch(self, positions):
+        """is_land() for an (n, 2) array of pixel positions, with one gather per chunk they fall into."""
+        tiles = np.floor_divide(positions, TILE_SIZE).astype(np.int64)
+        tile_x, tile_y = tiles[:, 0], tiles[:, 1]
+        inside = (tile_x >= 0) & (tile_x < self.tiles_x) & (tile_y >= 0) & (tile_y < self.tiles_y)
+        heights = np.zeros(len(tiles), dtype=np.float64)
+
+        rows = np.flatnonzero(inside)
+        chunk_x, chunk_y = tile_x[rows] // CHUNK_SIZE, tile_y[rows] // CHUNK_SIZE
+        keys = chunk_y * (self.tiles_x // CHUNK_SIZE + 1) + chunk_x
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for group in np.split(order, bounds) if len(order) else ():
+            chunk_heights = self.get_chunk(int(chunk_x[group[0]]), int(chunk_y[group[0]]))[0]
+            heights[rows[group]] = chunk_heights[tile_y[rows[group]] % CHUNK_SIZE, tile_x[rows[group]] % CHUNK_SIZE]
+        return heights >= WATER_LEVEL
@@ -0,0 +1,165 @@
+import numpy as np
+from settings import *
+
+UNIT_TYPES = list(SHIP_STATS)
+UNIT_TYPE_IDS = {name: i for i, name in enumerate(UNIT_TYPES)}
+UNIT_SPEEDS = np.array([SHIP_STATS[name]['speed'] for name in UNIT_TYPES], dtype=np.float64)
+IMMOBILE_TYPE = UNIT_TYPE_IDS['command_center']
+
+
+class UnitStore:
+    """
+    The server's units, kept as a struct of arrays: row i of every array describes the same unit.
+    Movement for all units is computed with array operations, and the dicts that go over the
+    network are only built by to_dicts(). Coordinates and speeds are stored as COORDINATE_DTYPE,
+    converted from and to pixels by from_pixels() and to_pixels().
+    """
+    COORDINATE_DTYPE = np.float64
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.rows = {}  # unit_id: row
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.types = np.zeros(capacity, dtype=np.uint8)
+        self.owners = np.zeros(capacity, dtype=np.int32)
+        self.hp = np.zeros(capacity, dtype=np.int32)
+        self.speeds = np.zeros(capacity, dtype=self.COORDINATE_DTYPE)
+        self.pos = np.zeros((capacity, 2), dtype=self.COORDINATE_DTYPE)
+        self.target_pos = np.zeros((capacity, 2), dtype=self.COORDINATE_DTYPE)
+        self.waypoints = {}  # unit_id: waypoints still to sail to after target_pos
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, unit_id):
+        return unit_id in self.rows
+
+    def from_pixels(self, values):
+        """Converts pixel coordinates (or speeds) to the stored representation."""
+        return values
+
+    def to_pixels(self, values):
+        """Converts an array of stored coordinates back to pixels."""
+        return values
+
+    def distances(self, delta):
+        """The length of every row of an (n, 2) array of stored offsets."""
+        return np.hypot(delta[:, 0], delta[:, 1])
+
+    def steps(self, delta, distance, speeds):
+        """Each row of delta shortened to its unit's speed; distance is never zero."""
+        return delta / distance[:, np.newaxis] * speeds[:, np.newaxis]
+
+    def _grow(self):
+        capacity = 2 * len(self.ids)
+        for name in ('ids', 'types', 'owners', 'hp', 'speeds', 'pos', 'target_pos'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, unit_id, unit_type, owner, pos, hp, target_pos=None):
+        if self.count == len(self.ids):
+            self._grow()
+        row = self.count
+        self.rows[unit_id] = row
+        self.ids[row] = unit_id
+        self.types[row] = UNIT_TYPE_IDS[unit_type]
+        self.owners[row] = owner
+        self.hp[row] = hp
+        self.speeds[row] = self.from_pixels(SHIP_STATS[unit_type]['speed'])
+        self.pos[row] = self.from_pixels(pos)
+        self.target_pos[row] = self.from_pixels(pos if target_pos is None else target_pos)
+        self.count += 1
+
+    def remove(self, unit_id):
+        """Removes a unit by moving the last row into its place."""
+        row = self.rows.pop(unit_id)
+        self.waypoints.pop(unit_id, None)
+        last = self.count - 1
+        if row != last:
+            for array in (self.ids, self.types, self.owners, self.hp, self.speeds, self.pos, self.target_pos):
+                array[row] = array[last]
+            self.rows[int(self.ids[row])] = row
+        self.count = last
+
+    def owner_of(self, unit_id):
+        return int(self.owners[self.rows[unit_id]])
+
+    def type_of(self, unit_id):
+        return UNIT_TYPES[self.types[self.rows[unit_id]]]
+
+    def position_of(self, unit_id):
+        return tuple(self.to_pixels(self.pos[self.rows[unit_id]]).tolist())
+
+    def set_target(self, unit_id, target):
+        self.target_pos[self.rows[unit_id]] = self.from_pixels(target)
+        self.waypoints.pop(unit_id, None)
+
+    def set_path(self, unit_id, waypoints):
+        """Sends the unit along the waypoints, one after another."""
+        waypoints = self.from_pixels(waypoints)
+        row = self.rows[unit_id]
+        # A route starts at the centre of the unit's tile; a unit already on it would never
+        # "arrive" there and move on, so skip it
+        if len(waypoints) > 1 and (waypoints[0] == self.pos[row]).all():
+            waypoints = waypoints[1:]
+        self.target_pos[row] = waypoints[0]
+        if len(waypoints) > 1:
+            self.waypoints[unit_id] = list(waypoints[1:])
+        else:
+            self.waypoints.pop(unit_id, None)
+
+    def update_movement(self, world):
+        """
+        Moves every mobile unit one step of its speed towards its target, stopping on the target
+        when it is closer than that. Units that reach their target head for their next waypoint.
+        Units whose next position would be on land stay put and drop their target and waypoints.
+        """
+        n = self.count
+        pos = self.pos[:n]
+        target = self.target_pos[:n]
+        delta = target - pos
+        distance = self.distances(delta)
+        moving = (self.types[:n] != IMMOBILE_TYPE) & (distance > 0)
+        if not moving.any():
+            return
+
+        rows = np.flatnonzero(moving)
+        step = self.steps(delta[rows], distance[rows], self.speeds[rows])
+        arriving = distance[rows] <= self.speeds[rows]
+        new_pos = np.where(arriving[:, np.newaxis], target[rows], pos[rows] + step)
+        blocked = world.is_land_batch(self.to_pixels(new_pos))
+
+        free_rows = rows[~blocked]
+        pos[free_rows] = new_pos[~blocked]
+        blocked_rows = rows[blocked]
+        target[blocked_rows] = pos[blocked_rows]
+
+        if self.waypoints:
+            for row in blocked_rows.tolist():
+                self.waypoints.pop(int(self.ids[row]), None)
+            for row in rows[arriving & ~blocked].tolist():
+                unit_id = int(self.ids[row])
+                waypoints = self.waypoints.get(unit_id)
+                if waypoints:
+                    target[row] = waypoints.pop(0)
+                    if not waypoints:
+                        del self.waypoints[unit_id]
+
+    def to_dicts(self):
+        """Builds the {unit_id: unit_state} dicts sent to clients."""
+        n = self.count
+        ids = self.ids[:n].tolist()
+        types = self.types[:n].tolist()
+        owners = self.owners[:n].tolist()
+        hp = self.hp[:n].tolist()
+        pos = self.to_pixels(self.pos[:n]).tolist()
+        target_pos = self.to_pixels(self.target_pos[:n]).tolist()
+        return {
+            ids[i]: {
+                'id': ids[i], 'type': UNIT_TYPES[types[i]], 'owner': owners[i],
+                'pos': tuple(pos[i]), 'hp': hp[i], 'target_pos': tuple(target_pos[i])
+            }
+            for i in range(n)
+        }
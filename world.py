@@ -1,73 +1,156 @@
-import pygame
+import os
 import random
 import math
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+try:
+    import pygame
+except ImportError:  # A headless dedicated server can run without pygame installed
+    pygame = None
 from perlin import PerlinNoise
 from settings import *
+from world_cache import world_cache
+from components import TerrainComponents
+
+# Heights at or above each threshold move a tile into the next colour of TERRAIN_PALETTE
+TERRAIN_THRESHOLDS = np.array([WATER_LEVEL, WATER_LEVEL + 15, 180], dtype=np.float32)
+TERRAIN_PALETTE = np.array([WATER_COLOR, LAND_COLOR_LOW, LAND_COLOR_HIGH, MOUTAIN_COLOR], dtype=np.uint8)
+
+
+def generate_height_band(permutation, octaves, width, height, y0, y1):
+    """
+    The heights of rows y0 to y1 of a width x height tile map, from the Perlin noise with the given
+    permutation table. Every tile only depends on its own coordinates, so bands generated separately,
+    in any process, join into exactly the map that one call for all rows returns.
+    """
+    return generate_height_block(permutation, octaves, width, height, (0, y0, width, y1 - y0))
+
+
+def generate_height_block(permutation, octaves, width, height, tile_rect):
+    """The heights of the tiles in tile_rect (x, y, w, h) of a width x height tile map, as generate_height_band() computes them."""
+    x0, y0, w, h = tile_rect
+    perlin = PerlinNoise.from_permutation(permutation, octaves)
+    center_x, center_y = width / 2, height / 2
+    xs = np.arange(x0, x0 + w)
+    ys = np.arange(y0, y0 + h)
+
+    # The whole block is evaluated at once; results match the per-tile noise() calls exactly
+    noise_vals = perlin.noise_grid(xs * 0.05, ys * 0.05)
+
+    # Radial gradient to create a central ocean
+    dx = (xs - center_x) ** 2
+    dy = (ys - center_y) ** 2
+    dist_to_center = np.sqrt(dx[np.newaxis, :] + dy[:, np.newaxis])
+    max_dist = math.sqrt(center_x ** 2 + center_y ** 2)
+    gradient = dist_to_center / max_dist
+
+    # Combine noise with the gradient
+    heights = (noise_vals + (1.0 - gradient)) * 128 + 64
+    return np.clip(heights, 0, 255).astype(np.float32)
+
+
+def generate_heights_parallel(permutation, octaves, width, height, workers):
+    """Generates the heightmap in one band of rows per worker process. Each band comes back as a compact float32 array."""
+    bounds = np.linspace(0, height, workers + 1).astype(int).tolist()
+    heights = np.empty((height, width), dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        bands = [(y0, y1, pool.submit(generate_height_band, permutation, octaves, width, height, y0, y1))
+                 for y0, y1 in zip(bounds, bounds[1:]) if y1 > y0]
+        for y0, y1, band in bands:
+            heights[y0:y1] = band.result()
+    return heights
+
+
+def create_world(seed, streamed=False, size=(WORLD_WIDTH, WORLD_HEIGHT), headless=False):
+    """A World, or a StreamedWorld of the given size in pixels when streamed is set."""
+    if streamed:
+        from streamed_world import StreamedWorld
+        return StreamedWorld(seed, *size, headless=headless)
+    return World(seed, headless=headless)
 
 
 class World:
     """
     Manages the generation of the world map from a seed.
+    A headless world (as used by the server) never creates a map surface.
     """
 
-    def __init__(self, seed):
+    def __init__(self, seed, use_cache=True, headless=False):
         self.seed = seed
-        self.terrain_data = []
+        self.headless = headless
+        self.width, self.height = WORLD_WIDTH, WORLD_HEIGHT  # In pixels
+        self.tiles_x, self.tiles_y = WORLD_TILES_X, WORLD_TILES_Y
+        self._map_surface = None  # Rendered on first access of map_surface
+        self.chunk_surfaces = {}  # (chunk_x, chunk_y): Surface, rendered when first drawn
+        self.dirty_chunks = set()  # Chunks whose tiles changed since they were rendered
+        self.terrain_listeners = []  # Called with the tile rect (x, y, w, h) that deform_terrain changed
+        self.terrain_data = None  # 2D float32 array of heights indexed [y, x]
+        self.terrain_colors = None  # 3D uint8 array with the RGB colour of each tile, indexed [y, x]
+        self.islands = []  # Centroids of all large islands, in scan order
+        self.components = None  # TerrainComponents labelling the islands and water bodies
         self.perlin = PerlinNoise(octaves=4, seed=self.seed)  # <--- Instantiated our own class
-        self.generate_terrain()
-        self.map_surface = self.create_map_surface()
+
+        cached = world_cache.load(seed) if use_cache else None
+        if cached:
+            self.terrain_data, self.terrain_colors, islands, component_arrays = cached
+            self.islands = [tuple(center) for center in islands.tolist()]
+            self.components = TerrainComponents(self.terrain_data, component_arrays)
+            # The checksums were checked in the background meanwhile; a corrupt map would desync this
+            # player from everyone who generated it
+            if not world_cache.wait_verified(seed):
+                cached = None
+        if not cached:
+            self.generate_terrain()
+            self.terrain_colors = self.classify_terrain(self.terrain_data)
+            self.components = TerrainComponents(self.terrain_data)
+            self.islands = self.find_islands()
+            if use_cache:
+                world_cache.store(seed, self.terrain_data, self.terrain_colors, self.islands, self.components)
+
         self.valid_start_islands = self.find_valid_start_islands()
 
-    def generate_terrain(self):
+    @property
+    def map_surface(self):
+        """The rendered terrain, created the first time it is needed."""
+        if self._map_surface is None:
+            if self.headless:
+                raise RuntimeError("A headless World has no map surface.")
+            self._map_surface = self.create_map_surface()
+        return self._map_surface
+
+    def generate_terrain(self, workers=WORLD_GEN_WORKERS):
         """
         Creates a 2D array of height values using our internal Perlin noise generator and a radial gradient
-        to form a central ocean with islands.
+        to form a central ocean with islands. Large worlds are generated in bands by a process pool.
         """
-        self.terrain_data = [[0 for _ in range(WORLD_TILES_X)] for _ in range(WORLD_TILES_Y)]
-        center_x, center_y = WORLD_TILES_X / 2, WORLD_TILES_Y / 2
-
-        for y in range(WORLD_TILES_Y):
-            for x in range(WORLD_TILES_X):
-                # Use our PerlinNoise class instance
-                noise_val = self.perlin.noise(x * 0.05, y * 0.05)  # <--- Updated call
-
-                # Radial gradient to create a central ocean
-                dist_to_center = math.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
-                max_dist = math.sqrt(center_x ** 2 + center_y ** 2)
-                gradient = dist_to_center / max_dist
+        if workers is None:
+            workers = os.cpu_count() or 1
+        permutation, octaves = self.perlin.p, self.perlin.octaves
+        if workers > 1 and WORLD_TILES_X * WORLD_TILES_Y >= WORLD_GEN_PARALLEL_MIN_TILES:
+            try:
+                self.terrain_data = generate_heights_parallel(permutation, octaves, WORLD_TILES_X, WORLD_TILES_Y, workers)
+                return
+            except (OSError, BrokenProcessPool) as e:  # Some hosts don't allow starting processes
+                print(f"Parallel world generation failed ({e}), generating in-process.")
+        self.terrain_data = generate_height_band(permutation, octaves, WORLD_TILES_X, WORLD_TILES_Y, 0, WORLD_TILES_Y)
 
-                # Combine noise with the gradient
-                height = (noise_val + (1.0 - gradient)) * 128 + 64
-
-                self.terrain_data[y][x] = max(0, min(255, height))
-
-    def find_valid_start_islands(self):
-        """Finds reasonably large islands suitable for starting positions."""
+    def find_islands(self):
+        """Finds the centroids of all reasonably large islands, ordered by their first high tile in scan order."""
+        land = self.components.land
+        # An island needs at least one tile above ISLAND_MIN_HEIGHT; take the first such tile of each
+        seeds = np.flatnonzero(self.terrain_data > ISLAND_MIN_HEIGHT)
+        labels, first = np.unique(land.labels.ravel()[seeds], return_index=True)
         islands = []
-        visited = set()
-        for y in range(WORLD_TILES_Y):
-            for x in range(WORLD_TILES_X):
-                if (y, x) not in visited and self.terrain_data[y][x] > ISLAND_MIN_HEIGHT:
-                    island_size = 0
-                    center_x, center_y = 0, 0
-                    stack = [(y, x)]
-                    visited.add((y, x))
-
-                    while stack:
-                        cy, cx = stack.pop()
-                        island_size += 1
-                        center_x += cx
-                        center_y += cy
-                        for dy, dx in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                            ny, nx = cy + dy, cx + dx
-                            if 0 <= ny < WORLD_TILES_Y and 0 <= nx < WORLD_TILES_X and \
-                                    (ny, nx) not in visited and self.terrain_data[ny][nx] > WATER_LEVEL:
-                                visited.add((ny, nx))
-                                stack.append((ny, nx))
-
-                    if island_size > 20:  # Filter for decent sized islands
-                        islands.append(((center_x // island_size) * TILE_SIZE, (center_y // island_size) * TILE_SIZE))
+        for label in labels[np.argsort(first)].tolist():
+            size = int(land.sizes[label])
+            if label and size > 20:  # Filter for decent sized islands
+                islands.append(((int(land.sum_x[label]) // size) * TILE_SIZE, (int(land.sum_y[label]) // size) * TILE_SIZE))
+        return islands
 
+    def find_valid_start_islands(self):
+        """Returns the large islands in a random order, for use as starting positions."""
+        islands = list(self.islands)
         random.shuffle(islands)
         return islands
 
@@ -82,40 +165,118 @@ class World:
         else:
             return MOUTAIN_COLOR
 
+    def classify_terrain(self, heights):
+        """Maps an array of heights to an array of RGB colours in one pass, matching get_tile_color()."""
+        return TERRAIN_PALETTE[np.digitize(heights, TERRAIN_THRESHOLDS)]
+
+    def heights_in(self, tile_rect):
+        """The heights of the tiles in tile_rect, indexed [y, x]."""
+        x, y, w, h = tile_rect
+        return self.terrain_data[y:y + h, x:x + w]
+
+    def colors_in(self, tile_rect):
+        """The RGB colours of the tiles in tile_rect, indexed [y, x]."""
+        x, y, w, h = tile_rect
+        return self.terrain_colors[y:y + h, x:x + w]
+
+    def render_tiles(self, target, tile_rect, origin=(0, 0)):
+        """
+        Draws the tiles inside tile_rect (in tile coordinates) onto target, scaled up by TILE_SIZE.
+        origin is the tile shown at the top left corner of target.
+        """
+        x, y, w, h = tile_rect
+        colors = self.terrain_colors[y:y + h, x:x + w]
+        tile_surf = pygame.Surface((w, h))
+        # surfarray is indexed [x, y], the heightmap [y, x]
+        pygame.surfarray.blit_array(tile_surf, colors.transpose(1, 0, 2))
+        dest = ((x - origin[0]) * TILE_SIZE, (y - origin[1]) * TILE_SIZE)
+        target.blit(pygame.transform.scale(tile_surf, (w * TILE_SIZE, h * TILE_SIZE)), dest)
+
+    def get_chunk_surface(self, chunk_x, chunk_y):
+        """Returns the rendered surface of a chunk, (re)rendering it if it is new or dirty."""
+        key = (chunk_x, chunk_y)
+        surf = self.chunk_surfaces.get(key)
+        if surf is None or key in self.dirty_chunks:
+            x, y = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+            w, h = min(CHUNK_SIZE, WORLD_TILES_X - x), min(CHUNK_SIZE, WORLD_TILES_Y - y)
+            if surf is None:
+                surf = pygame.Surface((w * TILE_SIZE, h * TILE_SIZE))
+                self.chunk_surfaces[key] = surf
+            self.render_tiles(surf, (x, y, w, h), origin=(x, y))
+            self.dirty_chunks.discard(key)
+        return surf
+
+    def draw_terrain(self, screen, offset):
+        """Blits the chunks visible on screen, where offset is the screen position of the world origin."""
+        chunk_px = CHUNK_SIZE * TILE_SIZE
+        view = pygame.Rect(-offset[0], -offset[1], *screen.get_size())
+        view = view.clip(pygame.Rect(0, 0, WORLD_TILES_X * TILE_SIZE, WORLD_TILES_Y * TILE_SIZE))
+        if not view.width or not view.height:
+            return
+
+        blits = []
+        for chunk_y in range(view.top // chunk_px, (view.bottom - 1) // chunk_px + 1):
+            for chunk_x in range(view.left // chunk_px, (view.right - 1) // chunk_px + 1):
+                dest = (chunk_x * chunk_px + offset[0], chunk_y * chunk_px + offset[1])
+                blits.append((self.get_chunk_surface(chunk_x, chunk_y), dest))
+        screen.blits(blits, doreturn=False)
+
     def create_map_surface(self):
         """Renders the entire world terrain to a large pygame.Surface for efficiency."""
         world_surf = pygame.Surface((WORLD_WIDTH, WORLD_HEIGHT))
-        for y, row in enumerate(self.terrain_data):
-            for x, height in enumerate(row):
-                color = self.get_tile_color(height)
-                rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                pygame.draw.rect(world_surf, color, rect)
+        self.render_tiles(world_surf, (0, 0, WORLD_TILES_X, WORLD_TILES_Y))
         return world_surf
 
     def deform_terrain(self, world_pos, radius):
-        """Modifies the terrain data and redraws the affected part of the map surface."""
-        tile_x, tile_y = int(world_pos.x // TILE_SIZE), int(world_pos.y // TILE_SIZE)
+        """
+        Modifies the terrain data, marks the chunks it touches as dirty, redraws the map surface if any,
+        relabels the components around the crater and tells the terrain listeners which tiles changed.
+        """
+        x, y = world_pos
+        tile_x, tile_y = int(x // TILE_SIZE), int(y // TILE_SIZE)
         tile_radius = int(radius // TILE_SIZE)
 
-        for y in range(max(0, tile_y - tile_radius), min(WORLD_TILES_Y, tile_y + tile_radius)):
-            for x in range(max(0, tile_x - tile_radius), min(WORLD_TILES_X, tile_x + tile_radius)):
-                dist_sq = (x - tile_x) ** 2 + (y - tile_y) ** 2
-                if dist_sq < tile_radius ** 2:
-                    new_height = self.terrain_data[y][x] - (tile_radius ** 2 - dist_sq) * 2
-                    self.terrain_data[y][x] = max(0, new_height)
-                    color = self.get_tile_color(self.terrain_data[y][x])
-                    rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                    pygame.draw.rect(self.map_surface, color, rect)
+        x0, x1 = max(0, tile_x - tile_radius), min(WORLD_TILES_X, tile_x + tile_radius)
+        y0, y1 = max(0, tile_y - tile_radius), min(WORLD_TILES_Y, tile_y + tile_radius)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        xs = np.arange(x0, x1)
+        ys = np.arange(y0, y1)
+        dist_sq = (xs[np.newaxis, :] - tile_x) ** 2 + (ys[:, np.newaxis] - tile_y) ** 2
+        crater = np.where(dist_sq < tile_radius ** 2, (tile_radius ** 2 - dist_sq) * 2, 0)
+
+        region = self.terrain_data[y0:y1, x0:x1]
+        np.maximum(region - crater, 0, out=region)
+        self.terrain_colors[y0:y1, x0:x1] = self.classify_terrain(region)
+        for chunk_y in range(y0 // CHUNK_SIZE, (y1 - 1) // CHUNK_SIZE + 1):
+            for chunk_x in range(x0 // CHUNK_SIZE, (x1 - 1) // CHUNK_SIZE + 1):
+                if (chunk_x, chunk_y) in self.chunk_surfaces:
+                    self.dirty_chunks.add((chunk_x, chunk_y))
+        if self._map_surface is not None:
+            self.render_tiles(self._map_surface, (x0, y0, x1 - x0, y1 - y0))
+        self.components.update((x0, y0, x1 - x0, y1 - y0))
+        for listener in self.terrain_listeners:
+            listener((x0, y0, x1 - x0, y1 - y0))
 
     def get_height_at_pos(self, world_pos):
-        """Returns the height value at a given world pixel position."""
-        tile_x = int(world_pos.x // TILE_SIZE)
-        tile_y = int(world_pos.y // TILE_SIZE)
+        """Returns the height value at a given world pixel position (a Vector2 or an (x, y) pair)."""
+        x, y = world_pos
+        tile_x = int(x // TILE_SIZE)
+        tile_y = int(y // TILE_SIZE)
         if 0 <= tile_x < WORLD_TILES_X and 0 <= tile_y < WORLD_TILES_Y:
-            return self.terrain_data[tile_y][tile_x]
+            return float(self.terrain_data[tile_y, tile_x])
         return 0
 
     def is_land(self, world_pos):
         """Checks if a given pixel position is on land."""
         return self.get_height_at_pos(world_pos) >= WATER_LEVEL
 
+    def is_land_batch(self, positions):
+        """is_land() for an (n, 2) array of pixel positions, as one gather from the heightmap."""
+        tiles = np.floor_divide(positions, TILE_SIZE).astype(np.int64)
+        tile_x, tile_y = tiles[:, 0], tiles[:, 1]
+        inside = (tile_x >= 0) & (tile_x < WORLD_TILES_X) & (tile_y >= 0) & (tile_y < WORLD_TILES_Y)
+        heights = np.zeros(len(tiles), dtype=np.float64)
+        heights[inside] = self.terrain_data[tile_y[inside], tile_x[inside]]
+        return heights >= WATER_LEVEL
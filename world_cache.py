@@ -0,0 +1,131 @@
+import concurrent.futures
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zlib
+import numpy as np
+from components import TerrainComponents
+from settings import *
+
+
+class WorldCache:
+    """
+    Persists generated worlds on disk, keyed by (seed, generator version, world size).
+
+    Every array of an entry, including the island and water body labels, is stored as its own .npy
+    file and opened memory-mapped, so a cached world only pulls the pages it touches into memory.
+    Entries are opened copy-on-write: deforming the terrain of a loaded world never writes back into
+    the cache. Loading only checks each file's shape and type; the checksums, which have to read
+    every page, are verified by a background thread while the caller sets up the world, and the
+    caller waits for them with wait_verified() before using it. An entry that fails is removed.
+    """
+    ARRAYS = ('heightmap', 'colors', 'islands')
+
+    def __init__(self, cache_dir=WORLD_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.verifications = {}  # seed: Future of whether the checksums of the entry last loaded for it match
+
+    def entry_dir(self, seed):
+        key = f"{seed}_v{WORLD_GENERATOR_VERSION}_{WORLD_TILES_X}x{WORLD_TILES_Y}"
+        return os.path.join(self.cache_dir, key)
+
+    def _checksum(self, array):
+        return zlib.crc32(np.ascontiguousarray(array))
+
+    def load(self, seed):
+        """
+        Returns (heightmap, colors, islands, component arrays) for the seed, or None on a cache miss.
+        Stale or malformed entries are removed so that the caller regenerates them.
+        """
+        path = self.entry_dir(seed)
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['seed'] != seed or meta['version'] != WORLD_GENERATOR_VERSION or \
+                    tuple(meta['size']) != (WORLD_TILES_X, WORLD_TILES_Y):
+                raise ValueError("entry does not match the requested world")
+            missing = [name for name in self.ARRAYS + TerrainComponents.ARRAYS if name not in meta['arrays']]
+            if missing:
+                raise ValueError(f"entry lacks {', '.join(missing)}")
+
+            arrays = {}
+            for name, (shape, dtype) in meta['arrays'].items():
+                # Opening the map reads only the .npy header, and fails if the file is too short for it
+                array = np.load(os.path.join(path, name + '.npy'), mmap_mode='c')
+                if array.shape != tuple(shape) or array.dtype != np.dtype(dtype):
+                    raise ValueError(f"unexpected shape or type of {name}")
+                arrays[name] = array
+            if arrays['heightmap'].shape != (WORLD_TILES_Y, WORLD_TILES_X):
+                raise ValueError("unexpected heightmap shape")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Discarding world cache entry for seed {seed}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        verification = self.verifications[seed] = concurrent.futures.Future()
+        threading.Thread(target=lambda: verification.set_result(self.verify(seed, meta)), daemon=True).start()
+        heightmap, colors, islands = (arrays.pop(name) for name in self.ARRAYS)
+        return heightmap, colors, islands, arrays
+
+    def wait_verified(self, seed):
+        """Waits for the checksums of the entry loaded for seed; False if they didn't match and it must be regenerated."""
+        verification = self.verifications.pop(seed, None)
+        return verification is None or verification.result()
+
+    def verify(self, seed, meta):
+        """Checks the checksums of an entry, from its files, and removes it if any doesn't match."""
+        path = self.entry_dir(seed)
+        try:
+            for name, checksum in meta['checksums'].items():
+                if self._checksum(np.load(os.path.join(path, name + '.npy'), mmap_mode='r')) != checksum:
+                    raise ValueError(f"checksum mismatch in {name}")
+        except (OSError, ValueError) as e:
+            print(f"World cache entry for seed {seed} is corrupt ({e}); discarding it.")
+            shutil.rmtree(path, ignore_errors=True)
+            return False
+        return True
+
+    def store(self, seed, heightmap, colors, islands, components):
+        """
+        Writes a new entry; components is the TerrainComponents of the heightmap. The entry only
+        becomes visible once all of its files are complete.
+        """
+        arrays = {
+            'heightmap': np.ascontiguousarray(heightmap, dtype=np.float32),
+            'colors': np.ascontiguousarray(colors, dtype=np.uint8),
+            'islands': np.array(islands, dtype=np.int64).reshape(-1, 2),
+        }
+        arrays.update((name, np.ascontiguousarray(array)) for name, array in components.to_arrays().items())
+        path = self.entry_dir(seed)
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(dir=self.cache_dir)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, name + '.npy'), array)
+            meta = {
+                'seed': seed,
+                'version': WORLD_GENERATOR_VERSION,
+                'size': [WORLD_TILES_X, WORLD_TILES_Y],
+                'arrays': {name: [list(array.shape), array.dtype.str] for name, array in arrays.items()},
+                'checksums': {name: self._checksum(array) for name, array in arrays.items()},
+            }
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write world cache entry for seed {seed}: {e}")
+            if tmp_path:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+# Create a single instance to be imported by other modules
+world_cache = WorldCache()